@@ -0,0 +1,147 @@
+"""
+Apache Arrow IPC stream responses over a database cursor.
+
+Rows are fetched with fetchmany, transposed into columns and written as one
+record batch each, so like the JSON streams (see streaming.py) a response
+holds one batch in memory. Low-cardinality text columns (source table,
+incident type, neighborhood) are dictionary-encoded: each value is sent once
+and rows carry a small integer. The dictionaries grow across batches and only
+the new values are sent with each batch (dictionary deltas). Times are sent as
+64-bit timestamps instead of text.
+"""
+
+import io
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from flask import Response, stream_with_context
+
+from metrics import add_serialize_time
+from streaming import iter_batches, STREAM_BATCH_SIZE
+
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+# Column kinds
+DICTIONARY = 'dictionary'
+STRING = 'string'
+FLOAT = 'float'
+TIMESTAMP = 'timestamp'
+
+# Arrow kind of each incidents column that can be streamed
+INCIDENT_COLUMN_KINDS = {
+    'source_table': DICTIONARY,
+    'incident_time': TIMESTAMP,
+    'incident_type': DICTIONARY,
+    'description': STRING,
+    'address': STRING,
+    'neighborhood': DICTIONARY,
+    'latitude': FLOAT,
+    'longitude': FLOAT,
+}
+
+# incident_time is normalized with SQLite's datetime(); other text becomes null
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+ARROW_TYPES = {
+    DICTIONARY: pa.dictionary(pa.int32(), pa.string()),
+    STRING: pa.string(),
+    FLOAT: pa.float64(),
+    TIMESTAMP: pa.timestamp('s'),
+}
+
+
+class DictionaryEncoder:
+    """Encodes a column against a dictionary that only grows, so later batches extend earlier ones"""
+
+    def __init__(self):
+        self._codes = {}
+        self._values = []
+
+    def encode(self, values):
+        codes = []
+        for value in values:
+            if value is None:
+                codes.append(None)
+                continue
+            code = self._codes.get(value)
+            if code is None:
+                code = self._codes[value] = len(self._values)
+                self._values.append(value)
+            codes.append(code)
+        return pa.DictionaryArray.from_arrays(
+            pa.array(codes, type=pa.int32()), pa.array(self._values, type=pa.string())
+        )
+
+
+def arrow_schema(columns, kinds=INCIDENT_COLUMN_KINDS):
+    return pa.schema([(column, ARROW_TYPES[kinds[column]]) for column in columns])
+
+
+def _column_array(values, kind, encoder):
+    if kind == DICTIONARY:
+        return encoder.encode(values)
+    if kind == TIMESTAMP:
+        text = pa.array(values, type=pa.string())
+        return pc.strptime(text, format=TIMESTAMP_FORMAT, unit='s', error_is_null=True)
+    return pa.array(values, type=ARROW_TYPES[kind])
+
+
+def record_batches(cursor, columns, kinds=INCIDENT_COLUMN_KINDS, batch_size=None):
+    """
+    Record batches of the given columns of the rows of an executed cursor
+    (other selected columns are left out).
+    """
+    schema = arrow_schema(columns, kinds)
+    selected = [description[0] for description in cursor.description]
+    positions = [selected.index(column) for column in columns]
+    encoders = {column: DictionaryEncoder() for column in columns if kinds[column] == DICTIONARY}
+    for rows in iter_batches(cursor, batch_size or STREAM_BATCH_SIZE):
+        arrays = [
+            _column_array([row[position] for row in rows], kinds[column], encoders.get(column))
+            for position, column in zip(positions, columns)
+        ]
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def stream_arrow(conn, cursor, columns, kinds=INCIDENT_COLUMN_KINDS, batch_size=None):
+    """
+    Streamed Arrow IPC response of the rows of an executed cursor.
+
+    Args:
+        conn: Connection of the cursor, closed once the stream ends
+        cursor: Cursor with an executed SELECT
+        columns: Names of the selected columns to send
+        kinds: Column name -> DICTIONARY, STRING, FLOAT or TIMESTAMP
+        batch_size: Rows per record batch (default STREAM_BATCH_SIZE)
+
+    Returns:
+        Flask Response
+    """
+    schema = arrow_schema(columns, kinds)
+    options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+
+    def generate():
+        sink = io.BytesIO()
+
+        def drain():
+            data = sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+            return data
+
+        try:
+            writer = pa.ipc.new_stream(sink, schema, options=options)
+            for batch in record_batches(cursor, columns, kinds, batch_size):
+                start = time.perf_counter()
+                writer.write_batch(batch)
+                add_serialize_time(time.perf_counter() - start)
+                yield drain()
+            # A stream cut short by an error has no end-of-stream marker, so readers see it fail
+            writer.close()
+            yield drain()
+        finally:
+            cursor.close()
+            conn.close()
+
+    return Response(stream_with_context(generate()), mimetype=ARROW_MIMETYPE)
@@ -0,0 +1,309 @@
+"""
+Per-endpoint latency and memory benchmark of the API.
+
+Every route in BENCHMARK_ROUTES is requested through Flask's test client
+against a database, either an existing one (--db) or synthetic databases of
+the given scales (see data_processing/synthetic_data.py), generated on first
+use and kept in --data-dir. For each route the harness reports the p50, p95
+and p99 latency of --iterations requests and the peak Python heap of one
+more request, traced with tracemalloc (SQLite's own page cache is not
+included). The response cache is cleared before every request, so cached
+routes are measured on a miss.
+
+Results are written as JSON. Passing --baseline compares them with an
+earlier results file and exits with status 1 if any route's p95 got slower
+than the baseline by more than --tolerance; --save-baseline writes the
+results as the new baseline. The create routes write a few hundred rows to
+the database they are run against.
+
+Usage:
+    python benchmark.py --scales 1M,10M [--iterations 20] [--output benchmark_results.json]
+    python benchmark.py --db ../sql_databases/processed_data.db --read-only
+    python benchmark.py --scales 1M --baseline benchmark_baseline.json
+"""
+
+import argparse
+import collections
+import contextlib
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+import db_pool
+import geocoding
+import queries
+import response_cache
+import write_queue
+
+DEFAULT_SCALES = ['1M']
+DEFAULT_ITERATIONS = 20
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'sql_databases')
+DATA_PROCESSING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data_processing')
+
+BULK_RECORDS = 500
+
+Route = collections.namedtuple('Route', ['name', 'method', 'path', 'body', 'writes'])
+
+
+def _json_body(record, address_field='address'):
+    """Request body of a create route; each request gets its own address"""
+    return lambda i: ('application/json', json.dumps({**record, address_field: f'{i} Benchmark St'}))
+
+
+def _bulk_body(record, address_field='address'):
+    def body(i):
+        lines = (json.dumps({**record, address_field: f'{i}-{n} Benchmark St'}) for n in range(BULK_RECORDS))
+        return 'application/x-ndjson', '\n'.join(lines)
+    return body
+
+
+SFPD_RECORD = {'category': 'LARCENY/THEFT', 'descript': 'PETTY THEFT', 'pddistrict': 'MISSION',
+               'latitude': 37.76, 'longitude': -122.42}
+SERVICE_RECORD = {'category': 'Graffiti', 'complaint_type': 'Graffiti on Building', 'descriptor': 'Paint',
+                  'neighborhood': 'Mission', 'latitude': 37.76, 'longitude': -122.42}
+FIRE_RECORD = {'Incident Date': '2024-06-01', 'Primary Situation': '111 Building fire',
+               'Analysis Neighborhood': 'Mission', 'ZIP Code': '94110'}
+
+# One entry per route, with the parameters the frontend uses
+BENCHMARK_ROUTES = [
+    Route('timeline', 'GET', '/api/incidents/timeline?limit=100', None, False),
+    Route('timeline_map', 'GET', '/api/incidents/timeline?limit=5000&prioritize_coords=true', None, False),
+    Route('timeline_source', 'GET', '/api/incidents/timeline?source=fire_incidents&limit=100', None, False),
+    Route('timeline_sources', 'GET', '/api/incidents/timeline?source=sfpd_incidents,sffd_service_calls&limit=1000', None, False),
+    Route('timeline_bbox', 'GET', '/api/incidents/timeline?bbox=-122.42,37.77,-122.40,37.79&limit=1000', None, False),
+    Route('timeline_ndjson', 'GET', '/api/incidents/timeline?limit=5000&format=ndjson', None, False),
+    Route('feed_arrow', 'GET', '/api/incidents/feed?limit=5000&format=arrow', None, False),
+    Route('clusters', 'GET', '/api/incidents/clusters?zoom=12&breakdown=source', None, False),
+    Route('neighborhood_top', 'GET', '/api/neighborhood/top', None, False),
+    Route('neighborhood_top_bbox', 'GET', '/api/neighborhood/top?bbox=-122.45,37.75,-122.40,37.79', None, False),
+    Route('danger_analysis', 'GET', '/api/neighborhoods/danger-analysis', None, False),
+    Route('incident_type_breakdown', 'GET', '/stats/incident_type_breakdown', None, False),
+    Route('monthly_incidents', 'GET', '/stats/monthly_incidents', None, False),
+    Route('top_crime_categories', 'GET', '/stats/top_crime_categories', None, False),
+    Route('fire_primary_situation', 'GET', '/api/fire/primary_situation', None, False),
+    Route('fire_incomplete_inspections', 'GET', '/api/fire/incomplete_inspections', None, False),
+    Route('fire_top_neighborhoods', 'GET', '/api/fire/top-neighborhoods', None, False),
+    Route('sffd_response_times', 'GET', '/api/sffd/response-times', None, False),
+    Route('create_311', 'POST', '/api/311-requests', _json_body(SERVICE_RECORD, 'incident_address'), True),
+    Route('create_sfpd', 'POST', '/api/sfpd_incidents', _json_body(SFPD_RECORD), True),
+    Route('create_fire', 'POST', '/api/fire-incidents', _json_body(FIRE_RECORD, 'Address'), True),
+    Route('bulk_sfpd', 'POST', '/api/sfpd_incidents/bulk', _bulk_body(SFPD_RECORD), True),
+]
+
+
+def percentile(values, q):
+    """q-th percentile (0-100) of values, interpolating between the closest ranks"""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = (len(values) - 1) * q / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def send_request(client, route, i=0):
+    """Send one request of a route; returns (status, response bytes)"""
+    response_cache.cache.clear()
+    kwargs = {}
+    if route.body is not None:
+        content_type, data = route.body(i)
+        kwargs = {'data': data, 'content_type': content_type}
+    response = client.open(route.path, method=route.method, **kwargs)
+    try:
+        return response.status_code, len(response.get_data())
+    finally:
+        response.close()
+
+
+@contextlib.contextmanager
+def serving(db_path):
+    """Test client of the app serving db_path, without background geocoding"""
+    previous_path, previous_autostart = queries.DB_PATH, geocoding.settings['autostart']
+    queries.DB_PATH = db_path
+    geocoding.settings['autostart'] = False
+    try:
+        yield queries.app.test_client()
+    finally:
+        write_queue.stop_all(timeout=30)
+        db_pool.pool.close_all()
+        queries.DB_PATH = previous_path
+        geocoding.settings['autostart'] = previous_autostart
+
+
+def measure_route(client, route, iterations=DEFAULT_ITERATIONS, warmup=1):
+    """Latency percentiles (ms) and peak traced memory (KB) of a route"""
+    for i in range(warmup):
+        send_request(client, route, i)
+
+    latencies = []
+    status = size = None
+    for i in range(warmup, warmup + iterations):
+        started = time.perf_counter()
+        status, size = send_request(client, route, i)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    try:
+        send_request(client, route, warmup + iterations)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'status': status,
+        'bytes': size,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def benchmark_database(db_path, routes=None, iterations=DEFAULT_ITERATIONS, read_only=False):
+    """
+    Measure every route against one database.
+
+    Returns:
+        Dictionary of route name -> measure_route() result
+    """
+    routes = [route for route in (routes or BENCHMARK_ROUTES) if not (read_only and route.writes)]
+    with serving(db_path) as client:
+        return {route.name: measure_route(client, route, iterations) for route in routes}
+
+
+def synthetic_database(scale, data_dir=DEFAULT_DATA_DIR, seed=0):
+    """Path of the synthetic database of a scale (e.g. '10M'), generating it if it doesn't exist yet"""
+    name = f'synthetic_{scale}.db' if not seed else f'synthetic_{scale}_seed{seed}.db'
+    db_path = os.path.join(data_dir, name)
+    if not os.path.exists(db_path):
+        if DATA_PROCESSING_DIR not in sys.path:
+            sys.path.insert(0, DATA_PROCESSING_DIR)
+        from synthetic_data import generate_database, parse_scale
+
+        os.makedirs(data_dir, exist_ok=True)
+        print(f"Generating {db_path}...")
+        generate_database(db_path, parse_scale(scale), seed=seed, verbose=True)
+    return db_path
+
+
+def count_incidents(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(f'SELECT COUNT(*) FROM {queries.INCIDENTS_TABLE}').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def run_benchmarks(databases, iterations=DEFAULT_ITERATIONS, read_only=False):
+    """
+    Benchmark each (label, db_path) pair.
+
+    Returns:
+        Results document: {'meta': {...}, 'scales': {label: {'database', 'incidents', 'routes'}}}
+    """
+    results = {
+        'meta': {
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'iterations': iterations,
+        },
+        'scales': {},
+    }
+    for label, db_path in databases:
+        results['scales'][label] = {
+            'database': os.path.abspath(db_path),
+            'incidents': count_incidents(db_path),
+            'routes': benchmark_database(db_path, iterations=iterations, read_only=read_only),
+        }
+    return results
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE, metric='p95_ms'):
+    """
+    Routes whose metric is more than tolerance (a fraction) above the
+    baseline's, or whose status changed, at scales present in both.
+
+    Returns:
+        List of {'scale', 'route', 'baseline', 'current', 'change'} dictionaries
+    """
+    regressions = []
+    for label, scale in results['scales'].items():
+        baseline_routes = baseline.get('scales', {}).get(label, {}).get('routes', {})
+        for name, current in scale['routes'].items():
+            previous = baseline_routes.get(name)
+            if previous is None:
+                continue
+            if current['status'] != previous['status']:
+                regressions.append({'scale': label, 'route': name, 'baseline': previous['status'],
+                                    'current': current['status'], 'change': 'status'})
+            elif current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append({'scale': label, 'route': name, 'baseline': previous[metric],
+                                    'current': current[metric],
+                                    'change': f'+{(current[metric] / previous[metric] - 1) * 100:.0f}%'})
+    return regressions
+
+
+def print_report(results):
+    for label, scale in results['scales'].items():
+        print(f"\n{label}: {scale['incidents']} incidents ({scale['database']})")
+        print(f"{'route':<30}{'status':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak KB':>11}{'bytes':>11}")
+        for name, stats in scale['routes'].items():
+            print(f"{name:<30}{stats['status']:>7}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}"
+                  f"{stats['p99_ms']:>10.1f}{stats['peak_memory_kb']:>11.1f}{stats['bytes']:>11}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark every API route on synthetic or existing databases')
+    parser.add_argument('--scales', default=','.join(DEFAULT_SCALES),
+                        help='Comma-separated synthetic scales, e.g. 1M,10M,50M (default: 1M)')
+    parser.add_argument('--db', default=None, help='Benchmark this database instead of synthetic ones')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='Where synthetic databases are kept')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of generated databases (default: 0)')
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS,
+                        help=f'Timed requests per route (default: {DEFAULT_ITERATIONS})')
+    parser.add_argument('--read-only', action='store_true', help='Skip the routes that write')
+    parser.add_argument('--output', default='benchmark_results.json', help='Results file')
+    parser.add_argument('--baseline', default=None, help='Results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f'Allowed p95 slowdown over the baseline (default: {DEFAULT_TOLERANCE})')
+    parser.add_argument('--save-baseline', default=None, help='Also write the results to this baseline file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.db:
+        databases = [(os.path.splitext(os.path.basename(args.db))[0], args.db)]
+    else:
+        databases = [(scale, synthetic_database(scale, args.data_dir, args.seed))
+                     for scale in args.scales.split(',') if scale]
+
+    results = run_benchmarks(databases, iterations=args.iterations, read_only=args.read_only)
+    print_report(results)
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression['scale']} {regression['route']}: "
+                  f"{regression['baseline']} -> {regression['current']} ({regression['change']})")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+Bulk NDJSON ingest for the write endpoints.
+
+The request body is read line by line, one JSON record per line, so a feed
+of thousands of records never has to be held in memory. Rows are inserted in
+transactions of chunk_size records: each row runs inside a SAVEPOINT, so a
+row that fails validation or a constraint is rolled back on its own and
+reported, while the rest of its chunk commits. The incidents and rollup rows
+of a chunk are derived in one set-based refresh just before its commit. Each
+chunk is one write handed to the caller's write function, so the endpoints
+commit through the same single writer as the other create endpoints.
+"""
+
+import json
+
+from incidents import INCIDENTS_TABLE, refresh_incidents, table_exists
+from response_cache import invalidate
+
+DEFAULT_CHUNK_SIZE = 500
+MAX_CHUNK_SIZE = 5000
+
+
+def iter_ndjson(stream):
+    """
+    (line number, record, error) for every non-blank line of a byte or text
+    stream; record is None and error a message when the line isn't a JSON object.
+    """
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_number, None, "Expected a JSON object"
+            continue
+        yield line_number, record, None
+
+
+def _insert_chunk(cursor, source_table, insert_row, records):
+    """
+    Insert a chunk of (line number, record) pairs, each in its own SAVEPOINT,
+    and derive their incidents. Returns per-record (fields, error) and the new rowids.
+    """
+    if not cursor.connection.in_transaction:
+        # An explicit transaction, so releasing a row's savepoint doesn't commit
+        cursor.execute('BEGIN')
+    outcomes = []
+    rowids = []
+    for line_number, record in records:
+        cursor.execute('SAVEPOINT bulk_row')
+        try:
+            rowid, fields = insert_row(cursor, record)
+        except Exception as e:
+            cursor.execute('ROLLBACK TO bulk_row')
+            outcomes.append((None, str(e)))
+        else:
+            rowids.append(rowid)
+            outcomes.append((fields, None))
+        cursor.execute('RELEASE bulk_row')
+    if rowids and table_exists(cursor.connection, INCIDENTS_TABLE):
+        refresh_incidents(cursor, source_table, 'SELECT value FROM json_each(?)', (json.dumps(rowids),))
+    return outcomes, rowids
+
+
+def ingest_ndjson(write, stream, source_table, insert_row, chunk_size=DEFAULT_CHUNK_SIZE, after_commit=None):
+    """
+    Insert the NDJSON records of stream into source_table.
+
+    Args:
+        write: Callable running work(cursor) as one committed transaction and
+            returning its result, e.g. queries.submit_write so chunks go through
+            the group-commit writer like every other API write
+        stream: Iterable of NDJSON lines, e.g. request.stream
+        source_table: Table the rows go to, for incidents and cache invalidation
+        insert_row: Callable (cursor, record) -> (rowid, result fields); raises
+            ValueError for an invalid record
+        chunk_size: Records per transaction
+        after_commit: Optional callable run after each committed chunk with new rows
+
+    Returns:
+        Dictionary with received, created and failed counts and per-row results,
+        in input order: {"line", "status": "created", **fields} or
+        {"line", "status": "error", "error"}
+    """
+    results = []
+    created = 0
+    # (index into results, line number, record) of the valid records of the current chunk
+    pending = []
+    chunk_lines = 0
+
+    def finish_chunk():
+        nonlocal created
+        if not pending:
+            return
+        records = [(line_number, record) for _, line_number, record in pending]
+        try:
+            outcomes, rowids = write(lambda cursor: _insert_chunk(cursor, source_table, insert_row, records))
+        except Exception as e:
+            # e.g. the database is locked: nothing of this chunk was stored
+            outcomes, rowids = [(None, str(e))] * len(pending), []
+        for (index, line_number, _), (fields, error) in zip(pending, outcomes):
+            if error is None:
+                results[index] = {'line': line_number, 'status': 'created', **fields}
+                created += 1
+            else:
+                results[index] = {'line': line_number, 'status': 'error', 'error': error}
+        pending.clear()
+        if rowids:
+            invalidate(source_table)
+            if after_commit is not None:
+                after_commit()
+
+    for line_number, record, error in iter_ndjson(stream):
+        if error is None:
+            # Filled in once its chunk is written
+            pending.append((len(results), line_number, record))
+            results.append(None)
+        else:
+            results.append({'line': line_number, 'status': 'error', 'error': error})
+        chunk_lines += 1
+
+        if chunk_lines >= chunk_size:
+            finish_chunk()
+            chunk_lines = 0
+    finish_chunk()
+
+    return {
+        'received': len(results),
+        'created': created,
+        'failed': len(results) - created,
+        'results': results,
+    }
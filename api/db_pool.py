@@ -0,0 +1,189 @@
+"""
+Pooled SQLite connections for the Flask app.
+
+Opening a connection per request throws away SQLite's page cache and costs a
+file open, and handlers that forget conn.close() leak file descriptors. The
+pool keeps long-lived, tuned connections: a request checks one out on first use,
+and the app-context teardown hands it back (rolling back anything left
+uncommitted), so every worker thread keeps reusing a warm connection.
+"""
+
+import atexit
+import sqlite3
+import threading
+
+from flask import g
+
+import slow_queries
+from metrics import TimedCursor
+
+# Applied to every new connection. journal_mode=WAL persists in the database
+# file and lets readers run alongside the writer.
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # KiB, i.e. 64 MB
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,
+}
+
+
+def apply_pragmas(conn, pragmas):
+    for name, value in pragmas.items():
+        try:
+            conn.execute(f'PRAGMA {name} = {value}')
+        except sqlite3.OperationalError:
+            # e.g. WAL on a read-only database; keep the default
+            pass
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    sqlite3 connection whose close() returns it to its pool, and whose cursors
+    add their SQL time to the request metrics
+    """
+
+    pool = None
+    checked_out = False
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute doesn't go through cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+    def really_close(self):
+        super().close()
+
+
+class ConnectionPool:
+    """
+    Idle connections per database path, reused most-recently-released first.
+
+    Args:
+        pragmas: PRAGMA name -> value applied to each new connection
+        max_idle: Idle connections kept per database; extras are closed
+    """
+
+    def __init__(self, pragmas=None, max_idle=8):
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._stats = {'opened': 0, 'closed': 0, 'checkouts': 0, 'reused': 0, 'in_use': 0}
+
+    def _open(self, db_path):
+        conn = sqlite3.connect(db_path, factory=PooledConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        apply_pragmas(conn, self.pragmas)
+        slow_queries.track_vm_steps(conn)
+        conn.pool = self
+        conn.db_path = db_path
+        return conn
+
+    def acquire(self, db_path):
+        """Check out an idle connection to db_path, opening one if none is idle"""
+        with self._lock:
+            idle = self._idle.get(db_path)
+            conn = idle.pop() if idle else None
+            self._stats['checkouts'] += 1
+            self._stats['in_use'] += 1
+            if conn is not None:
+                self._stats['reused'] += 1
+            else:
+                self._stats['opened'] += 1
+        if conn is None:
+            try:
+                conn = self._open(db_path)
+            except sqlite3.Error:
+                with self._lock:
+                    self._stats['in_use'] -= 1
+                    self._stats['opened'] -= 1
+                raise
+        conn.checked_out = True
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool. Releasing twice is a no-op."""
+        if not conn.checked_out:
+            return
+        conn.checked_out = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        with self._lock:
+            self._stats['in_use'] -= 1
+            idle = self._idle.setdefault(conn.db_path, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+            self._stats['closed'] += 1
+        conn.really_close()
+
+    def _discard(self, conn):
+        with self._lock:
+            self._stats['in_use'] -= 1
+            self._stats['closed'] += 1
+        conn.really_close()
+
+    def close_all(self):
+        """Close every idle connection"""
+        with self._lock:
+            idle = [conn for conns in self._idle.values() for conn in conns]
+            self._idle = {}
+            self._stats['closed'] += len(idle)
+        for conn in idle:
+            conn.really_close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = sum(len(conns) for conns in self._idle.values())
+        return stats
+
+
+pool = ConnectionPool()
+atexit.register(pool.close_all)
+
+
+def get_pooled_connection(db_path):
+    """
+    Connection for the current app context, checked out on first use and
+    released on teardown. Outside an app context the caller owns a plain
+    connection and must close it.
+    """
+    try:
+        connections = g.setdefault('db_connections', {})
+    except RuntimeError:
+        conn = pool._open(db_path)
+        conn.pool = None
+        return conn
+    conn = connections.get(db_path)
+    if conn is None or not conn.checked_out:
+        conn = pool.acquire(db_path)
+        connections[db_path] = conn
+    return conn
+
+
+def release_connections(exception=None):
+    """App-context teardown: return this context's connections to the pool"""
+    for conn in g.pop('db_connections', {}).values():
+        pool.release(conn)
+
+
+def init_app(app):
+    app.teardown_appcontext(release_connections)
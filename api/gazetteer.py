@@ -0,0 +1,256 @@
+"""
+Local gazetteer of San Francisco block centroids.
+
+The SFPD, 311 and fire complaint/violation tables hold millions of
+(address, latitude, longitude) observations, many of them already at block
+level ("1400 Block of WALLER ST"). build_gazetteer() parses every distinct
+address into a (street, block) key, where block is the house number rounded
+down to the hundred (or INTERSECTION_BLOCK for "X ST / Y ST"), and stores
+the mean coordinates of each key. lookup() answers from that table with an
+indexed search, so most addresses are placed without a network call.
+
+fire_incidents only carries a ZIP code, so refine_zip_coordinates() replaces
+its ZIP-centroid coordinates with block centroids where the address is known.
+
+Usage:
+    python gazetteer.py [db_path]
+"""
+
+import os
+import re
+import sqlite3
+import sys
+
+from incidents import (
+    INCIDENTS_TABLE, INCIDENT_SOURCES, COORDINATE_SOURCES,
+    refresh_incidents, table_exists, table_columns
+)
+
+GAZETTEER_TABLE = 'gazetteer'
+INTERSECTION_BLOCK = -1
+
+# Observations outside the city (e.g. SFPD's 90/-120.5 "unknown" point, or 0/0) are ignored
+SF_BOUNDS = {'min_lat': 37.6, 'max_lat': 37.85, 'min_lon': -122.55, 'max_lon': -122.35}
+
+# How far (in house numbers) lookup() looks for the nearest known block on the same street
+MAX_BLOCK_DISTANCE = 200
+
+# Street suffixes and their spellings across the datasets
+STREET_SUFFIXES = {
+    'STREET': 'ST',
+    'AVENUE': 'AVE',
+    'AV': 'AVE',
+    'BOULEVARD': 'BLVD',
+    'BL': 'BLVD',
+    'DRIVE': 'DR',
+    'ROAD': 'RD',
+    'PLACE': 'PL',
+    'COURT': 'CT',
+    'LANE': 'LN',
+    'TERRACE': 'TER',
+    'TR': 'TER',
+    'HIGHWAY': 'HWY',
+    'HY': 'HWY',
+    'WY': 'WAY',
+    'CIRCLE': 'CIR',
+    'ALLEY': 'ALY',
+}
+
+BLOCK_ADDRESS_PATTERN = re.compile(r'^(\d+)[A-Z]?(?:-\d+[A-Z]?)?\s+(?:BLOCK\s+OF\s+)?(.+)$')
+INTERSECTION_SEPARATOR = re.compile(r'\s*(?:/|\\|&|\bAND\b)\s*')
+UNIT_PATTERN = re.compile(r'\s+(?:#|APT\b|UNIT\b|STE\b|SUITE\b).*$')
+
+
+def normalize_address(address):
+    """Upper case, punctuation dropped, street suffixes abbreviated (e.g. '1 Main Street.' -> '1 MAIN ST')"""
+    words = re.sub(r'[^0-9A-Z]+', ' ', str(address or '').upper()).split()
+    return ' '.join(STREET_SUFFIXES.get(word, word) for word in words)
+
+
+def block_key(address):
+    """
+    (street, block) for an address, or None if it names no block or
+    intersection.
+
+    '1423 Waller Street' and '1400 Block of WALLER ST' both give
+    ('WALLER ST', 1400); 'LINCOLN WY / 4TH AV' and 'Intersection of 4TH AVE
+    and LINCOLN WAY' both give ('4TH AVE & LINCOLN WAY', INTERSECTION_BLOCK).
+    """
+    if not address:
+        return None
+    # Drop ", SAN FRANCISCO, CA ..." and unit numbers
+    text = str(address).upper().split(',')[0].strip()
+    text = re.sub(r'^INTERSECTION\s+OF\s+', '', text)
+
+    streets = [normalize_address(part) for part in INTERSECTION_SEPARATOR.split(text)]
+    streets = [street for street in streets if street]
+    if len(streets) == 2:
+        return ' & '.join(sorted(streets)), INTERSECTION_BLOCK
+
+    match = BLOCK_ADDRESS_PATTERN.match(UNIT_PATTERN.sub('', text))
+    if not match:
+        return None
+    street = normalize_address(match.group(2))
+    if not street:
+        return None
+    return street, int(match.group(1)) // 100 * 100
+
+
+def gazetteer_sources(conn):
+    """(table, address, latitude, longitude) columns of every loaded source with measured coordinates"""
+    sources = []
+    for source_table, columns in INCIDENT_SOURCES.items():
+        # ZIP centroids would only smear the block centroids
+        if COORDINATE_SOURCES.get(source_table, (None,))[0] == 'zip_code':
+            continue
+        if not table_exists(conn, source_table):
+            continue
+        present = table_columns(conn, source_table)
+        wanted = (columns['address'], columns['latitude'], columns['longitude'])
+        if all(column in present for column in wanted):
+            sources.append((source_table, *wanted))
+    return sources
+
+
+def build_gazetteer(conn):
+    """
+    (Re)build the gazetteer table from every source with coordinates.
+
+    Returns:
+        Number of (street, block) entries
+    """
+    totals = {}
+    for source_table, address, latitude, longitude in gazetteer_sources(conn):
+        # Aggregate per distinct address in SQL; only those are parsed in Python
+        rows = conn.execute(f'''
+            SELECT "{address}", SUM("{latitude}"), SUM("{longitude}"), COUNT(*)
+            FROM "{source_table}"
+            WHERE "{latitude}" BETWEEN :min_lat AND :max_lat
+              AND "{longitude}" BETWEEN :min_lon AND :max_lon
+            GROUP BY "{address}"
+        ''', SF_BOUNDS)
+        for value, lat_sum, lon_sum, count in rows:
+            key = block_key(value)
+            if key is None:
+                continue
+            total = totals.setdefault(key, [0.0, 0.0, 0])
+            total[0] += lat_sum
+            total[1] += lon_sum
+            total[2] += count
+
+    cursor = conn.cursor()
+    cursor.execute(f'DROP TABLE IF EXISTS {GAZETTEER_TABLE}')
+    cursor.execute(f'''
+        CREATE TABLE {GAZETTEER_TABLE} (
+            street TEXT NOT NULL,
+            block INTEGER NOT NULL,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL,
+            observations INTEGER NOT NULL,
+            PRIMARY KEY (street, block)
+        ) WITHOUT ROWID
+    ''')
+    cursor.executemany(
+        f'INSERT INTO {GAZETTEER_TABLE} VALUES (?, ?, ?, ?, ?)',
+        (
+            (street, block, lat_sum / count, lon_sum / count, count)
+            for (street, block), (lat_sum, lon_sum, count) in totals.items()
+        )
+    )
+    conn.commit()
+    return len(totals)
+
+
+def lookup(conn, address):
+    """
+    Block centroid (latitude, longitude) for an address: its own block, else
+    the nearest known block of the same street within MAX_BLOCK_DISTANCE.
+    None if the address can't be placed or the gazetteer isn't built.
+    """
+    key = block_key(address)
+    if key is None:
+        return None
+    street, block = key
+    try:
+        if block == INTERSECTION_BLOCK:
+            row = conn.execute(
+                f'SELECT latitude, longitude FROM {GAZETTEER_TABLE} WHERE street = ? AND block = ?',
+                (street, block)
+            ).fetchone()
+        else:
+            row = conn.execute(
+                f'SELECT latitude, longitude FROM {GAZETTEER_TABLE} '
+                f'WHERE street = ? AND block BETWEEN ? AND ? ORDER BY ABS(block - ?) LIMIT 1',
+                (street, max(block - MAX_BLOCK_DISTANCE, 0), block + MAX_BLOCK_DISTANCE, block)
+            ).fetchone()
+    except sqlite3.OperationalError:
+        # No gazetteer table in this database
+        return None
+    return (row[0], row[1]) if row else None
+
+
+def refine_zip_coordinates(conn):
+    """
+    Replace ZIP-centroid coordinates of COORDINATE_SOURCES rows with the
+    block centroid of their address, refreshing their incidents.
+
+    Returns:
+        Dictionary of source table -> number of rows updated
+    """
+    updated = {}
+    cursor = conn.cursor()
+    for source_table, (kind, _) in COORDINATE_SOURCES.items():
+        if kind != 'zip_code' or not table_exists(conn, source_table):
+            continue
+        columns = INCIDENT_SOURCES[source_table]
+        address, latitude, longitude = columns['address'], columns['latitude'], columns['longitude']
+
+        cursor.execute('DROP TABLE IF EXISTS temp.block_coordinates')
+        cursor.execute('CREATE TEMP TABLE block_coordinates (address TEXT PRIMARY KEY, latitude REAL, longitude REAL)')
+        addresses = [row[0] for row in conn.execute(
+            f'SELECT DISTINCT "{address}" FROM "{source_table}" WHERE "{address}" IS NOT NULL'
+        )]
+        cursor.executemany(
+            'INSERT INTO temp.block_coordinates VALUES (?, ?, ?)',
+            ((value, *coordinates) for value in addresses
+             for coordinates in [lookup(conn, value)] if coordinates is not None)
+        )
+
+        cursor.execute('DROP TABLE IF EXISTS temp.refined_rowids')
+        cursor.execute(f'''
+            CREATE TEMP TABLE refined_rowids AS
+            SELECT t.rowid AS source_rowid
+            FROM "{source_table}" AS t JOIN temp.block_coordinates AS b ON b.address = t."{address}"
+            WHERE t."{latitude}" IS NOT b.latitude OR t."{longitude}" IS NOT b.longitude
+        ''')
+        cursor.execute(f'''
+            UPDATE "{source_table}" AS t
+            SET "{latitude}" = b.latitude, "{longitude}" = b.longitude
+            FROM temp.block_coordinates AS b
+            WHERE b.address = t."{address}"
+              AND t.rowid IN (SELECT source_rowid FROM temp.refined_rowids)
+        ''')
+        updated[source_table] = cursor.rowcount
+        if table_exists(conn, INCIDENTS_TABLE):
+            refresh_incidents(cursor, source_table, 'SELECT source_rowid FROM temp.refined_rowids')
+
+        cursor.execute('DROP TABLE temp.refined_rowids')
+        cursor.execute('DROP TABLE temp.block_coordinates')
+        conn.commit()
+    return updated
+
+
+def main():
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(__file__), '..', 'sql_databases', 'processed_data.db'
+    )
+    conn = sqlite3.connect(db_path)
+    entries = build_gazetteer(conn)
+    print(f"Built '{GAZETTEER_TABLE}' table with {entries} blocks and intersections")
+    updated = refine_zip_coordinates(conn)
+    print(f"Replaced ZIP centroids with block centroids: {updated}")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,364 @@
+"""
+Cached, asynchronous geocoding for rows created through the API.
+
+A POST that arrives without coordinates first consults geocode_cache, keyed
+on the normalized address and ZIP code, then the local gazetteer of block
+centroids (see gazetteer.py). On a miss the row is inserted without
+coordinates and a job is queued in geocode_jobs within the same transaction,
+so the request never waits on the geocoder. A background worker per database
+drains the queue at most one geocoder call per min_interval seconds, caches
+the result (including "not found"), writes the coordinates back to the
+source row and refreshes its incidents entry. Jobs whose geocoder call fails
+are retried with exponential back-off and dropped after MAX_ATTEMPTS. The
+worker only reads on its own connection; its writes go through the
+database's group-commit writer (see write_queue.py) so they never contend
+with the API's writes for the lock.
+
+The geocoder is any callable (address, zip_code) -> (latitude, longitude),
+set with configure(geocoder=...); tests plug in a local fake.
+"""
+
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+import gazetteer
+from gazetteer import normalize_address
+import write_queue
+from incidents import INCIDENT_SOURCES, refresh_incidents
+
+logger = logging.getLogger(__name__)
+
+GEOCODE_CACHE_TABLE = 'geocode_cache'
+GEOCODE_JOBS_TABLE = 'geocode_jobs'
+
+# Nominatim's usage policy allows one request per second
+DEFAULT_MIN_INTERVAL = 1.0
+POLL_INTERVAL = 5.0
+MAX_ATTEMPTS = 5
+MAX_BACKOFF = 300.0
+# "Not found" answers are asked again after this long, in case the geocoder learns the address
+NOT_FOUND_TTL = 7 * 24 * 3600
+
+
+def normalize_zip(zip_code):
+    """Five-digit ZIP code, or '' if missing (handles float-formatted values like '94110.0')"""
+    match = re.match(r'\s*(\d{5})', str(zip_code or ''))
+    return match.group(1) if match else ''
+
+
+def ensure_geocode_tables(conn):
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {GEOCODE_CACHE_TABLE} (
+            address_key TEXT NOT NULL,
+            zip_code TEXT NOT NULL,
+            latitude REAL,
+            longitude REAL,
+            looked_up_at REAL NOT NULL,
+            PRIMARY KEY (address_key, zip_code)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {GEOCODE_JOBS_TABLE} (
+            id INTEGER PRIMARY KEY,
+            source_table TEXT NOT NULL,
+            source_rowid INTEGER NOT NULL,
+            address TEXT,
+            zip_code TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            not_before REAL NOT NULL DEFAULT 0
+        )
+    ''')
+
+
+def database_path(conn):
+    """File path of a connection's main database"""
+    return conn.execute('PRAGMA database_list').fetchone()[2]
+
+
+class GeocodeCache:
+    """Lookups and stores against geocode_cache, with hit/miss counters"""
+
+    def __init__(self, not_found_ttl=NOT_FOUND_TTL):
+        self.not_found_ttl = not_found_ttl
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def lookup(self, conn, address, zip_code=None):
+        """
+        Cached (latitude, longitude) for an address, (None, None) for a cached
+        "not found", or None on a miss.
+        """
+        ensure_geocode_tables(conn)
+        row = conn.execute(
+            f'SELECT latitude, longitude, looked_up_at FROM {GEOCODE_CACHE_TABLE} '
+            f'WHERE address_key = ? AND zip_code = ?',
+            (normalize_address(address), normalize_zip(zip_code))
+        ).fetchone()
+        if row is None or (row[0] is None and row[2] + self.not_found_ttl < time.time()):
+            self._count('misses')
+            return None
+        self._count('hits')
+        return row[0], row[1]
+
+    def store(self, conn, address, zip_code, latitude, longitude):
+        ensure_geocode_tables(conn)
+        conn.execute(
+            f'INSERT OR REPLACE INTO {GEOCODE_CACHE_TABLE} '
+            f'(address_key, zip_code, latitude, longitude, looked_up_at) VALUES (?, ?, ?, ?, ?)',
+            (normalize_address(address), normalize_zip(zip_code), latitude, longitude, time.time())
+        )
+        self._count('stores')
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+class GeocodeWorker:
+    """
+    Drains geocode_jobs of one database on a daemon thread.
+
+    Args:
+        db_path: Database holding the jobs, cache and source rows
+        geocoder: Callable (address, zip_code) -> (latitude, longitude)
+        min_interval: Minimum seconds between geocoder calls
+        cache: GeocodeCache used for lookups and stores
+    """
+
+    def __init__(self, db_path, geocoder, min_interval=DEFAULT_MIN_INTERVAL, cache=None):
+        self.db_path = db_path
+        self.geocoder = geocoder
+        self.min_interval = min_interval
+        self.cache = cache or GeocodeCache()
+        self._conn = None
+        self._tables_ready = False
+        self._thread = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._last_call = None
+        self._lock = threading.Lock()
+        self._stats = {'geocoded': 0, 'cached': 0, 'gazetteer': 0, 'errors': 0, 'dropped': 0}
+
+    def _open(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5)
+        return self._conn
+
+    def _connection(self):
+        """The worker's read connection, once the geocode tables exist"""
+        if not self._tables_ready:
+            self._write(lambda cursor: ensure_geocode_tables(cursor.connection))
+            self._tables_ready = True
+        return self._open()
+
+    def _write(self, work):
+        """
+        Run work(cursor) as one committed write: through the database's writer
+        when the write queue is enabled, else on the worker's own connection.
+        """
+        if write_queue.settings['enabled']:
+            future = write_queue.writer_for(self.db_path).submit(work)
+            return future.result(timeout=write_queue.settings['timeout'])
+
+        conn = self._open()
+        cursor = conn.cursor()
+        try:
+            result = work(cursor)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        return result
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _throttle(self):
+        if self._last_call is not None:
+            delay = self._last_call + self.min_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        self._last_call = time.monotonic()
+
+    def _apply(self, cursor, source_table, source_rowid, latitude, longitude):
+        """Write coordinates to a source row that still has none and re-derive its incident"""
+        if latitude is None or longitude is None:
+            return
+        columns = INCIDENT_SOURCES[source_table]
+        cursor.execute(
+            f'UPDATE "{source_table}" SET "{columns["latitude"]}" = ?, "{columns["longitude"]}" = ? '
+            f'WHERE rowid = ? AND "{columns["latitude"]}" IS NULL',
+            (latitude, longitude, source_rowid)
+        )
+        if cursor.rowcount:
+            refresh_incidents(cursor, source_table, 'SELECT ?', (source_rowid,))
+
+    def process_next(self):
+        """
+        Handle the oldest due job.
+
+        Returns:
+            True if a job was handled, False if none is due
+        """
+        conn = self._connection()
+        job = conn.execute(
+            f'SELECT id, source_table, source_rowid, address, zip_code, attempts FROM {GEOCODE_JOBS_TABLE} '
+            f'WHERE not_before <= ? ORDER BY id LIMIT 1',
+            (time.time(),)
+        ).fetchone()
+        if job is None:
+            return False
+        job_id, source_table, source_rowid, address, zip_code, attempts = job
+
+        coordinates = self.cache.lookup(conn, address, zip_code)
+        if coordinates is not None:
+            self._count('cached')
+        else:
+            # e.g. the gazetteer was built after the job was queued
+            coordinates = gazetteer.lookup(conn, address)
+            if coordinates is not None:
+                self._count('gazetteer')
+        geocoded = False
+        if coordinates is None:
+            self._throttle()
+            try:
+                coordinates = self.geocoder(address, zip_code)
+            except Exception:
+                self._count('errors')
+                if attempts + 1 >= MAX_ATTEMPTS:
+                    self._count('dropped')
+                    self._write(lambda cursor: cursor.execute(
+                        f'DELETE FROM {GEOCODE_JOBS_TABLE} WHERE id = ?', (job_id,)
+                    ))
+                else:
+                    backoff = min(max(self.min_interval, 1.0) * 2 ** attempts, MAX_BACKOFF)
+                    self._write(lambda cursor: cursor.execute(
+                        f'UPDATE {GEOCODE_JOBS_TABLE} SET attempts = attempts + 1, not_before = ? WHERE id = ?',
+                        (time.time() + backoff, job_id)
+                    ))
+                return True
+            geocoded = True
+
+        def write(cursor):
+            if geocoded:
+                self.cache.store(cursor.connection, address, zip_code, *coordinates)
+            self._apply(cursor, source_table, source_rowid, *coordinates)
+            cursor.execute(f'DELETE FROM {GEOCODE_JOBS_TABLE} WHERE id = ?', (job_id,))
+
+        self._write(write)
+        if geocoded:
+            self._count('geocoded')
+        return True
+
+    def run_pending(self):
+        """Handle every due job on the calling thread"""
+        while self.process_next():
+            pass
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                handled = self.process_next()
+            except Exception:
+                logger.exception('Geocode worker error')
+                if self._conn is not None:
+                    self._conn.rollback()
+                handled = False
+            if not handled:
+                self._wake.wait(POLL_INTERVAL)
+                self._wake.clear()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='geocode-worker', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+cache = GeocodeCache()
+
+# geocoder: callable (address, zip_code) -> (latitude, longitude); workers only start once it is set
+# autostart: start a worker when jobs are queued (tests turn this off and drain queues themselves)
+settings = {
+    'geocoder': None,
+    'min_interval': DEFAULT_MIN_INTERVAL,
+    'autostart': True,
+}
+_workers = {}
+_workers_lock = threading.Lock()
+
+
+def configure(**options):
+    """Update settings, e.g. configure(geocoder=nominatim_geocode, min_interval=1.0)"""
+    unknown = set(options) - set(settings)
+    if unknown:
+        raise ValueError(f"Unknown geocoding settings: {', '.join(sorted(unknown))}")
+    settings.update(options)
+
+
+def worker_for(db_path):
+    """The background worker of a database, created on first use"""
+    with _workers_lock:
+        worker = _workers.get(db_path)
+        if worker is None:
+            worker = GeocodeWorker(db_path, lambda address, zip_code: settings['geocoder'](address, zip_code),
+                                   min_interval=settings['min_interval'], cache=cache)
+            _workers[db_path] = worker
+        return worker
+
+
+def enqueue(cursor, source_table, source_rowid, address, zip_code=None):
+    """Queue a row for geocoding, in the caller's transaction"""
+    ensure_geocode_tables(cursor.connection)
+    cursor.execute(
+        f'INSERT INTO {GEOCODE_JOBS_TABLE} (source_table, source_rowid, address, zip_code) VALUES (?, ?, ?, ?)',
+        (source_table, source_rowid, address, normalize_zip(zip_code) or None)
+    )
+
+
+def notify(conn):
+    """Wake (starting if needed) the worker of conn's database after queued jobs are committed"""
+    notify_database(database_path(conn))
+
+
+def notify_database(db_path):
+    """Wake (starting if needed) the worker of a database after queued jobs are committed"""
+    if not settings['autostart'] or settings['geocoder'] is None:
+        return
+    worker = worker_for(db_path)
+    worker.start()
+    worker.wake()
+
+
+def stats():
+    stats = {'cache': cache.stats()}
+    with _workers_lock:
+        stats['workers'] = {db_path: worker.stats() for db_path, worker in _workers.items()}
+    return stats
@@ -0,0 +1,708 @@
+"""
+Materialized "incidents" table that unifies every incident source, plus the
+derived tables maintained alongside it.
+
+The timeline, neighborhood and danger-analysis endpoints read from this one
+normalized, indexed table instead of rebuilding a six-way UNION ALL over the
+raw source tables on every request. The table is built once (see
+build_incidents_table / `python incidents.py`) and the POST endpoints keep it
+in sync through record_incident. The incident_rollup table holds counts per
+(neighborhood, time_period, day_type, incident_type, source_table) cell so the
+danger analysis costs O(cells) instead of O(incidents), the
+incident_locations R*Tree indexes the coordinates of incidents for
+bounding-box filters, and the incident_grid table counts incidents per map
+grid cell at several resolutions for the clustered map view. The rollup
+buckets incidents by the integer hour and weekday derived from each source's
+incident time at ingest (TIME_FEATURE_COLUMNS), not by parsing incident_time.
+"""
+
+import os
+import sqlite3
+import sys
+
+import pandas as pd
+
+INCIDENTS_TABLE = 'incidents'
+
+# San Francisco ZIP code to approximate latitude/longitude mapping
+SF_ZIP_COORDINATES = {
+    '94102': (37.7799, -122.4193),  # Civic Center
+    '94103': (37.7728, -122.4099),  # SOMA
+    '94104': (37.7914, -122.4016),  # Financial District
+    '94105': (37.7883, -122.3902),  # Rincon Hill
+    '94107': (37.7641, -122.3936),  # Potrero Hill
+    '94108': (37.7923, -122.4079),  # Chinatown
+    '94109': (37.7926, -122.4208),  # Nob Hill
+    '94110': (37.7487, -122.4160),  # Mission
+    '94111': (37.7984, -122.4040),  # Financial District North
+    '94112': (37.7202, -122.4428),  # Outer Mission
+    '94114': (37.7579, -122.4360),  # Castro
+    '94115': (37.7866, -122.4362),  # Western Addition
+    '94116': (37.7439, -122.4862),  # Outer Sunset
+    '94117': (37.7703, -122.4414),  # Haight-Ashbury
+    '94118': (37.7820, -122.4630),  # Richmond
+    '94121': (37.7768, -122.4979),  # Outer Richmond
+    '94122': (37.7586, -122.4856),  # Sunset
+    '94123': (37.8000, -122.4379),  # Marina
+    '94124': (37.7300, -122.3926),  # Bayview
+    '94127': (37.7367, -122.4564),  # West Portal
+    '94131': (37.7447, -122.4382),  # Glen Park
+    '94132': (37.7232, -122.4748),  # Lake Merced
+    '94133': (37.8023, -122.4101),  # North Beach
+    '94134': (37.7196, -122.4145),  # Visitacion Valley
+    '94158': (37.7714, -122.3892),  # Mission Bay
+}
+
+# How each raw source table maps onto the unified incidents columns
+INCIDENT_SOURCES = {
+    '311_service_requests': {
+        'incident_time': 'created_date',
+        'incident_type': 'category',
+        'description': 'complaint_type',
+        'address': 'incident_address',
+        'neighborhood': 'neighborhood',
+        'latitude': 'latitude',
+        'longitude': 'longitude',
+    },
+    'fire_incidents': {
+        'incident_time': 'Incident Date',
+        'incident_type': 'Primary Situation',
+        'description': 'Action Taken Primary',
+        'address': 'Address',
+        'neighborhood': 'Analysis Neighborhood',
+        'latitude': 'Latitude',
+        'longitude': 'Longitude',
+    },
+    'fire_safety_complaints': {
+        'incident_time': 'Received Date',
+        'incident_type': 'Complaint Item Type Description',
+        'description': 'Disposition',
+        'address': 'Address',
+        'neighborhood': 'Neighborhood  District',
+        'latitude': 'Latitude',
+        'longitude': 'Longitude',
+    },
+    'fire_violations': {
+        'incident_time': 'violation date',
+        'incident_type': 'violation item description',
+        'description': 'Status',
+        'address': 'Address',
+        'neighborhood': 'neighborhood district',
+        'latitude': 'Latitude',
+        'longitude': 'Longitude',
+    },
+    'sffd_service_calls': {
+        'incident_time': 'call_date',
+        'incident_type': 'call_type',
+        'description': 'call_final_disposition',
+        'address': 'address',
+        'neighborhood': 'supervisor_district',
+        'latitude': 'latitude',
+        'longitude': 'longitude',
+    },
+    'sfpd_incidents': {
+        'incident_time': 'timestamp',
+        'incident_type': 'category',
+        'description': 'descript',
+        'address': 'address',
+        'neighborhood': 'pddistrict',
+        'latitude': 'latitude',
+        'longitude': 'longitude',
+    },
+}
+
+# Sources without coordinate columns of their own. Latitude/Longitude are
+# derived once at ingest time from a Location point or the ZIP centroid.
+COORDINATE_SOURCES = {
+    'fire_incidents': ('zip_code', 'ZIP Code'),
+    'fire_safety_complaints': ('location', 'Location'),
+    'fire_violations': ('location', 'Location'),
+}
+
+# Coordinates in Location values such as "{'type': 'Point', 'coordinates': [lon, lat]}"
+LOCATION_PATTERN = r"""coordinates['"]?\s*:\s*\[\s*(?P<lon>-?\d+(?:\.\d+)?)\s*,\s*(?P<lat>-?\d+(?:\.\d+)?)"""
+
+# Integer features of each source's incident time, derived once at ingest
+# time (see derive_time_features) so queries filter and group on integers
+# instead of parsing timestamp strings on every row. Times are UTC, as with
+# SQLite's datetime(); incident_weekday counts from Sunday = 0 like
+# strftime('%w') and incident_year_month is YYYYMM.
+TIME_FEATURE_COLUMNS = [
+    'incident_epoch', 'incident_hour', 'incident_weekday', 'incident_year_month', 'incident_year'
+]
+
+# Indexes on the time features of the source tables the endpoints group by
+TIME_FEATURE_INDEXES = {
+    # Monthly crime counts (distinct unique_key per month)
+    'idx_sfpd_incidents_year_month': ('sfpd_incidents', 'incident_year_month, unique_key'),
+    # Monthly fire counts and the yearly fire neighborhood ranking
+    'idx_fire_incidents_year_month': ('fire_incidents', 'incident_year_month'),
+    'idx_fire_incidents_year_neighborhood': ('fire_incidents', 'incident_year, "Analysis Neighborhood"'),
+}
+
+INCIDENT_COLUMNS = [
+    'source_table', 'source_rowid', 'incident_time', 'incident_type',
+    'description', 'address', 'neighborhood', 'latitude', 'longitude',
+    'has_coords', 'incident_hour', 'incident_weekday'
+]
+
+CREATE_INCIDENTS_SQL = f"""
+    CREATE TABLE IF NOT EXISTS {INCIDENTS_TABLE} (
+        id INTEGER PRIMARY KEY,
+        source_table TEXT NOT NULL,
+        source_rowid INTEGER NOT NULL,
+        incident_time TEXT,
+        incident_type TEXT,
+        description TEXT,
+        address TEXT,
+        neighborhood TEXT,
+        latitude REAL,
+        longitude REAL,
+        has_coords INTEGER NOT NULL DEFAULT 0,
+        incident_hour INTEGER,
+        incident_weekday INTEGER
+    )
+"""
+
+# Pre-aggregated counts behind the danger-analysis endpoint. incident_type is
+# stored as '' rather than NULL so every cell has a well-defined primary key
+# for the ON CONFLICT upsert in record_incident.
+ROLLUP_TABLE = 'incident_rollup'
+
+CREATE_ROLLUP_SQL = f"""
+    CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+        neighborhood TEXT NOT NULL,
+        time_period TEXT NOT NULL,
+        day_type TEXT NOT NULL,
+        incident_type TEXT NOT NULL DEFAULT '',
+        source_table TEXT NOT NULL,
+        incident_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (neighborhood, time_period, day_type, incident_type, source_table)
+    ) WITHOUT ROWID
+"""
+
+# R*Tree over the coordinates of incidents that have them, keyed on incidents.id.
+# R*Tree stores 32-bit floats rounded outwards, so bbox_filter matches boxes
+# that overlap the requested one and then checks the exact coordinates.
+LOCATION_INDEX_TABLE = 'incident_locations'
+BBOX_PROBE_FACTOR = 20
+
+CREATE_LOCATION_INDEX_SQL = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {LOCATION_INDEX_TABLE} USING rtree(
+        id, min_lon, max_lon, min_lat, max_lat
+    )
+"""
+
+# Incident counts per square grid cell, one grid per level. Cells at level L
+# are 360 / 2**(L + 2) degrees wide: about 64 pixels of a web map at zoom L,
+# the usual radius for clustering markers. Coordinate sums place a cluster at
+# the mean position of its incidents rather than the cell center.
+GRID_TABLE = 'incident_grid'
+MIN_GRID_LEVEL = 10
+MAX_GRID_LEVEL = 15
+GRID_LEVELS = range(MIN_GRID_LEVEL, MAX_GRID_LEVEL + 1)
+
+CREATE_GRID_SQL = f"""
+    CREATE TABLE IF NOT EXISTS {GRID_TABLE} (
+        level INTEGER NOT NULL,
+        cell_x INTEGER NOT NULL,
+        cell_y INTEGER NOT NULL,
+        source_table TEXT NOT NULL,
+        incident_type TEXT NOT NULL DEFAULT '',
+        incident_count INTEGER NOT NULL DEFAULT 0,
+        latitude_sum REAL NOT NULL DEFAULT 0,
+        longitude_sum REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (level, cell_x, cell_y, source_table, incident_type)
+    ) WITHOUT ROWID
+"""
+
+TIME_PERIOD_SQL = """
+    CASE
+        WHEN incident_hour BETWEEN 6 AND 11 THEN 'Morning'
+        WHEN incident_hour BETWEEN 12 AND 17 THEN 'Afternoon'
+        WHEN incident_hour BETWEEN 18 AND 21 THEN 'Evening'
+        ELSE 'Night'
+    END
+"""
+
+DAY_TYPE_SQL = """
+    CASE
+        WHEN incident_weekday IN (0, 6) THEN 'Weekend'
+        ELSE 'Weekday'
+    END
+"""
+
+# {sign} is 1 when counting incidents into the rollup and -1 when removing them
+ROLLUP_SELECT_SQL = f"""
+    SELECT
+        neighborhood,
+        {TIME_PERIOD_SQL} AS time_period,
+        {DAY_TYPE_SQL} AS day_type,
+        COALESCE(incident_type, '') AS incident_type,
+        source_table,
+        {{sign}} * COUNT(*) AS incident_count
+    FROM {INCIDENTS_TABLE}
+    WHERE incident_time IS NOT NULL AND neighborhood IS NOT NULL
+"""
+
+
+def grid_cell_size(level):
+    """Width and height in degrees of the grid cells at a level"""
+    return 360 / 2 ** (level + 2)
+
+
+def grid_level(zoom):
+    """Grid level that clusters a web map at the given zoom"""
+    return min(max(zoom, MIN_GRID_LEVEL), MAX_GRID_LEVEL)
+
+
+def grid_cell(latitude, longitude, level):
+    """(cell_x, cell_y) of a point; coordinates are shifted to be positive so truncation floors"""
+    size = grid_cell_size(level)
+    return int((longitude + 180) / size), int((latitude + 90) / size)
+
+
+def grid_cell_bounds(cell_x, cell_y, level):
+    """(min_lon, min_lat, max_lon, max_lat) of a grid cell"""
+    size = grid_cell_size(level)
+    return (cell_x * size - 180, cell_y * size - 90, (cell_x + 1) * size - 180, (cell_y + 1) * size - 90)
+
+
+GRID_LEVELS_SQL = ' UNION ALL '.join(
+    f'SELECT {level} AS level, {grid_cell_size(level)!r} AS cell_size' for level in GRID_LEVELS
+)
+
+# Same cells as grid_cell; {sign} as in ROLLUP_SELECT_SQL
+GRID_SELECT_SQL = f"""
+    SELECT
+        level,
+        CAST((longitude + 180) / cell_size AS INTEGER) AS cell_x,
+        CAST((latitude + 90) / cell_size AS INTEGER) AS cell_y,
+        source_table,
+        COALESCE(incident_type, '') AS incident_type,
+        {{sign}} * COUNT(*) AS incident_count,
+        {{sign}} * SUM(latitude) AS latitude_sum,
+        {{sign}} * SUM(longitude) AS longitude_sum
+    FROM {INCIDENTS_TABLE}, ({GRID_LEVELS_SQL})
+    WHERE has_coords
+"""
+
+# Indexes backing the endpoints that read from the incidents table
+INCIDENT_INDEXES = {
+    'idx_incidents_source_row': 'source_table, source_rowid',
+    # Timeline ordering, optionally filtered by source / coordinates first.
+    # The implicit rowid (id) completes the keyset used for cursor pagination.
+    'idx_incidents_time': 'incident_time, source_table',
+    'idx_incidents_source_time': 'source_table, incident_time',
+    'idx_incidents_coords_time': 'has_coords, incident_time, source_table',
+    'idx_incidents_source_coords_time': 'source_table, has_coords, incident_time',
+    # Covering index for the neighborhood ranking
+    'idx_incidents_neighborhood': 'neighborhood, source_table, incident_type',
+}
+
+
+def zip_coordinates(zip_code):
+    """Approximate (latitude, longitude) for a San Francisco ZIP code"""
+    if zip_code is None or zip_code == '':
+        return None, None
+    zip_code = str(zip_code).split('.')[0]  # Remove .0 if present
+    return SF_ZIP_COORDINATES.get(zip_code, (None, None))
+
+
+def derive_coordinates(values, kind):
+    """
+    Vectorized Latitude/Longitude for a Series of Location strings
+    (kind='location') or ZIP codes (kind='zip_code').
+
+    Returns:
+        DataFrame with float 'Latitude' and 'Longitude' columns (NaN if unknown)
+    """
+    values = values.astype('string')
+    if kind == 'location':
+        extracted = values.str.extract(LOCATION_PATTERN)
+        latitude = pd.to_numeric(extracted['lat'], errors='coerce')
+        longitude = pd.to_numeric(extracted['lon'], errors='coerce')
+    else:
+        zip_codes = values.str.split('.').str[0]
+        latitude = zip_codes.map({z: c[0] for z, c in SF_ZIP_COORDINATES.items()})
+        longitude = zip_codes.map({z: c[1] for z, c in SF_ZIP_COORDINATES.items()})
+    return pd.DataFrame({
+        'Latitude': latitude.astype('float64'),
+        'Longitude': longitude.astype('float64'),
+    }, index=values.index)
+
+
+def derive_time_features(values):
+    """
+    Vectorized TIME_FEATURE_COLUMNS for a Series of timestamps in any of the
+    source formats ('2024-01-05', '2024-01-05T08:30:00',
+    '2024-01-05 08:30:00+00:00', '01/05/2024 08:30:00 AM', ...) or datetimes.
+
+    Returns:
+        DataFrame with one nullable Int64 column per feature (NA if unparseable)
+    """
+    times = pd.to_datetime(values, errors='coerce', utc=True, format='ISO8601')
+    # Only the values the ISO 8601 fast path couldn't read are parsed one by one
+    retry = times.isna() & values.notna()
+    if retry.any():
+        times[retry] = pd.to_datetime(values[retry], errors='coerce', utc=True, format='mixed')
+    times = times.dt.tz_localize(None)
+    return pd.DataFrame({
+        'incident_epoch': (times - pd.Timestamp(0)) // pd.Timedelta(seconds=1),
+        'incident_hour': times.dt.hour,
+        'incident_weekday': (times.dt.dayofweek + 1) % 7,
+        'incident_year_month': times.dt.year * 100 + times.dt.month,
+        'incident_year': times.dt.year,
+    }, index=values.index).astype('Int64')
+
+
+def _quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+def _text(column):
+    return f"NULLIF(TRIM({_quote(column)}), '')"
+
+
+def _coordinate(column):
+    # 0.0 is used as a "no coordinates" sentinel in the raw data
+    return f"NULLIF(CAST(NULLIF(TRIM({_quote(column)}), '') AS REAL), 0.0)"
+
+
+def source_select_sql(source_table):
+    """
+    SELECT statement that maps rows of a raw source table onto the incidents
+    columns (in INCIDENT_COLUMNS order).
+    """
+    mapping = INCIDENT_SOURCES[source_table]
+    incident_time = _quote(mapping['incident_time'])
+
+    return f"""
+        SELECT
+            source_table, source_rowid, incident_time, incident_type,
+            description, address, neighborhood, latitude, longitude,
+            latitude IS NOT NULL AND longitude IS NOT NULL AS has_coords,
+            incident_hour, incident_weekday
+        FROM (
+            SELECT
+                '{source_table}' AS source_table,
+                rowid AS source_rowid,
+                COALESCE(datetime({incident_time}), NULLIF(TRIM({incident_time}), '')) AS incident_time,
+                {_text(mapping['incident_type'])} AS incident_type,
+                {_text(mapping['description'])} AS description,
+                {_text(mapping['address'])} AS address,
+                {_text(mapping['neighborhood'])} AS neighborhood,
+                {_coordinate(mapping['latitude'])} AS latitude,
+                {_coordinate(mapping['longitude'])} AS longitude,
+                incident_hour,
+                incident_weekday
+            FROM {_quote(source_table)}
+        )
+    """
+
+
+def table_exists(conn, table_name):
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?",
+        (table_name,)
+    ).fetchone()
+    return row is not None
+
+
+def table_columns(conn, table_name):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({_quote(table_name)})')]
+
+
+def ensure_coordinate_columns(conn):
+    """
+    Add and backfill Latitude/Longitude on COORDINATE_SOURCES tables of
+    databases that were built before preprocessing derived them.
+    """
+    for source_table, (kind, column) in COORDINATE_SOURCES.items():
+        if not table_exists(conn, source_table):
+            continue
+        columns = table_columns(conn, source_table)
+        if 'Latitude' in columns and 'Longitude' in columns:
+            continue
+
+        conn.execute(f'ALTER TABLE {_quote(source_table)} ADD COLUMN "Latitude" REAL')
+        conn.execute(f'ALTER TABLE {_quote(source_table)} ADD COLUMN "Longitude" REAL')
+        if column not in columns:
+            continue
+        values = pd.read_sql_query(
+            f'SELECT rowid AS source_rowid, {_quote(column)} AS value FROM {_quote(source_table)}',
+            conn, index_col='source_rowid'
+        )['value']
+        coords = derive_coordinates(values, kind).dropna()
+        conn.executemany(
+            f'UPDATE {_quote(source_table)} SET "Latitude" = ?, "Longitude" = ? WHERE rowid = ?',
+            zip(coords['Latitude'].tolist(), coords['Longitude'].tolist(), coords.index.tolist())
+        )
+    conn.commit()
+
+
+def update_time_features(cursor, source_table, rowid_sql, params=()):
+    """
+    (Re)derive the TIME_FEATURE_COLUMNS of the source rows selected by
+    rowid_sql (a SELECT returning source rowids) from their incident time.
+    """
+    time_column = _quote(INCIDENT_SOURCES[source_table]['incident_time'])
+    rows = cursor.execute(
+        f'SELECT rowid, {time_column} FROM {_quote(source_table)} WHERE rowid IN ({rowid_sql})',
+        params
+    ).fetchall()
+    if not rows:
+        return
+    rowids = [row[0] for row in rows]
+    features = derive_time_features(pd.Series([row[1] for row in rows], index=rowids, dtype=object))
+    values = features.astype(object).where(features.notna(), None)
+    assignments = ', '.join(f'{column} = ?' for column in TIME_FEATURE_COLUMNS)
+    cursor.executemany(
+        f'UPDATE {_quote(source_table)} SET {assignments} WHERE rowid = ?',
+        (row + [rowid] for row, rowid in zip(values.values.tolist(), rowids))
+    )
+
+
+def ensure_time_feature_columns(conn):
+    """
+    Add and backfill the TIME_FEATURE_COLUMNS of source tables loaded before
+    preprocessing derived them (or by a loader that doesn't), and create
+    their indexes.
+    """
+    for source_table in INCIDENT_SOURCES:
+        if not table_exists(conn, source_table):
+            continue
+        columns = table_columns(conn, source_table)
+        missing = [column for column in TIME_FEATURE_COLUMNS if column not in columns]
+        if not missing:
+            continue
+        for column in missing:
+            conn.execute(f'ALTER TABLE {_quote(source_table)} ADD COLUMN {column} INTEGER')
+        update_time_features(conn.cursor(), source_table, f'SELECT rowid FROM {_quote(source_table)}')
+
+    for name, (source_table, columns) in TIME_FEATURE_INDEXES.items():
+        if table_exists(conn, source_table):
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {_quote(source_table)} ({columns})')
+    conn.commit()
+
+
+def create_incident_indexes(conn):
+    for name, columns in INCIDENT_INDEXES.items():
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {INCIDENTS_TABLE} ({columns})')
+
+
+def build_incidents_table(conn):
+    """
+    (Re)build the incidents table from every source table present in the
+    database. Indexes are created after the bulk load.
+
+    Returns:
+        Dictionary of source table -> number of rows loaded
+    """
+    ensure_coordinate_columns(conn)
+    ensure_time_feature_columns(conn)
+    cursor = conn.cursor()
+    cursor.execute(f'DROP TABLE IF EXISTS {INCIDENTS_TABLE}')
+    cursor.execute(CREATE_INCIDENTS_SQL)
+
+    columns = ', '.join(INCIDENT_COLUMNS)
+    counts = {}
+    for source_table in INCIDENT_SOURCES:
+        if not table_exists(conn, source_table):
+            continue
+        cursor.execute(f'INSERT INTO {INCIDENTS_TABLE} ({columns}) {source_select_sql(source_table)}')
+        counts[source_table] = cursor.rowcount
+
+    create_incident_indexes(conn)
+    conn.commit()
+    build_incident_rollup(conn)
+    build_location_index(conn)
+    build_incident_grid(conn)
+    return counts
+
+
+def build_incident_rollup(conn):
+    """(Re)build the rollup table from the incidents table"""
+    cursor = conn.cursor()
+    cursor.execute(f'DROP TABLE IF EXISTS {ROLLUP_TABLE}')
+    cursor.execute(CREATE_ROLLUP_SQL)
+    cursor.execute(f"""
+        INSERT INTO {ROLLUP_TABLE}
+        {ROLLUP_SELECT_SQL.format(sign=1)}
+        GROUP BY 1, 2, 3, 4, 5
+    """)
+    conn.commit()
+
+
+def build_location_index(conn):
+    """(Re)build the R*Tree of incident coordinates from the incidents table"""
+    cursor = conn.cursor()
+    cursor.execute(f'DROP TABLE IF EXISTS {LOCATION_INDEX_TABLE}')
+    cursor.execute(CREATE_LOCATION_INDEX_SQL)
+    _index_locations(cursor, '1', ())
+    conn.commit()
+
+
+def build_incident_grid(conn):
+    """(Re)build the grid cell counts of every level from the incidents table"""
+    cursor = conn.cursor()
+    cursor.execute(f'DROP TABLE IF EXISTS {GRID_TABLE}')
+    cursor.execute(CREATE_GRID_SQL)
+    cursor.execute(f"""
+        INSERT INTO {GRID_TABLE}
+        {GRID_SELECT_SQL.format(sign=1)}
+        GROUP BY 1, 2, 3, 4, 5
+    """)
+    conn.commit()
+
+
+def ensure_incidents_table(conn):
+    """
+    Build the incidents table and the tables derived from it if the database
+    doesn't have them yet, or rebuild them if the incidents table predates
+    the time features.
+    """
+    if not table_exists(conn, INCIDENTS_TABLE) or 'incident_hour' not in table_columns(conn, INCIDENTS_TABLE):
+        build_incidents_table(conn)
+        return
+    ensure_time_feature_columns(conn)
+    if not table_exists(conn, ROLLUP_TABLE):
+        build_incident_rollup(conn)
+    if not table_exists(conn, LOCATION_INDEX_TABLE):
+        build_location_index(conn)
+    if not table_exists(conn, GRID_TABLE):
+        build_incident_grid(conn)
+
+
+def bbox_filter(conn, bbox, limit=None):
+    """
+    WHERE clause and parameters restricting incidents to a
+    (min_lon, min_lat, max_lon, max_lat) box.
+
+    Matches come from the location index, unless a limit is given and the box
+    holds more than BBOX_PROBE_FACTOR times that many incidents (e.g. the
+    whole city): then walking the time index with an exact coordinate check
+    reaches the limit sooner than sorting every match.
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    exact_sql = 'longitude BETWEEN ? AND ? AND latitude BETWEEN ? AND ?'
+    exact_params = [min_lon, max_lon, min_lat, max_lat]
+    index_sql = f"""
+        SELECT id FROM {LOCATION_INDEX_TABLE}
+        WHERE max_lon >= ? AND min_lon <= ? AND max_lat >= ? AND min_lat <= ?
+    """
+
+    if limit:
+        probe = limit * BBOX_PROBE_FACTOR
+        matches = conn.execute(
+            f'SELECT COUNT(*) FROM ({index_sql} LIMIT ?)', (*exact_params, probe)
+        ).fetchone()[0]
+        if matches >= probe:
+            return exact_sql, exact_params
+
+    return f'id IN ({index_sql}) AND {exact_sql}', exact_params * 2
+
+
+def _adjust_rollup(cursor, where_sql, params, sign):
+    """Add (sign=1) or remove (sign=-1) the incidents matching where_sql from the rollup cells"""
+    cursor.execute(f"""
+        INSERT INTO {ROLLUP_TABLE}
+        {ROLLUP_SELECT_SQL.format(sign=sign)} AND {where_sql}
+        GROUP BY 1, 2, 3, 4, 5
+        ON CONFLICT (neighborhood, time_period, day_type, incident_type, source_table)
+        DO UPDATE SET incident_count = incident_count + excluded.incident_count
+    """, params)
+
+
+def _adjust_grid(cursor, where_sql, params, sign):
+    """Add (sign=1) or remove (sign=-1) the incidents matching where_sql from the grid cells of every level"""
+    cursor.execute(f"""
+        INSERT INTO {GRID_TABLE}
+        {GRID_SELECT_SQL.format(sign=sign)} AND {where_sql}
+        GROUP BY 1, 2, 3, 4, 5
+        ON CONFLICT (level, cell_x, cell_y, source_table, incident_type)
+        DO UPDATE SET
+            incident_count = incident_count + excluded.incident_count,
+            latitude_sum = latitude_sum + excluded.latitude_sum,
+            longitude_sum = longitude_sum + excluded.longitude_sum
+    """, params)
+
+
+def _index_locations(cursor, where_sql, params):
+    """Add the incidents matching where_sql that have coordinates to the location index"""
+    cursor.execute(f"""
+        INSERT INTO {LOCATION_INDEX_TABLE} (id, min_lon, max_lon, min_lat, max_lat)
+        SELECT id, longitude, longitude, latitude, latitude
+        FROM {INCIDENTS_TABLE}
+        WHERE has_coords AND {where_sql}
+    """, params)
+
+
+def record_incident(cursor, source_table, source_rowid):
+    """
+    Copy one freshly inserted source row into the incidents table. Runs on the
+    caller's cursor so it commits (or rolls back) with the source insert.
+    """
+    update_time_features(cursor, source_table, '?', (source_rowid,))
+    columns = ', '.join(INCIDENT_COLUMNS)
+    cursor.execute(
+        f'INSERT INTO {INCIDENTS_TABLE} ({columns}) '
+        f'SELECT * FROM ({source_select_sql(source_table)}) WHERE source_rowid = ?',
+        (source_rowid,)
+    )
+    incident_id = cursor.lastrowid
+
+    # Bump the matching rollup and grid cells in place
+    _adjust_rollup(cursor, 'id = ?', (incident_id,), 1)
+    _adjust_grid(cursor, 'id = ?', (incident_id,), 1)
+    _index_locations(cursor, 'id = ?', (incident_id,))
+
+
+def refresh_incidents(cursor, source_table, rowid_sql, params=()):
+    """
+    Re-derive the time features, incidents, rollup and grid counts and indexed
+    locations of the source rows selected by rowid_sql (a SELECT returning
+    source rowids) after a bulk insert or update.
+    """
+    update_time_features(cursor, source_table, rowid_sql, params)
+
+    # Select by id: given the source_table/source_rowid filter alone, the planner
+    # prefers idx_incidents_source_time for the rollup's incident_time IS NOT NULL
+    # and scans every incident of the source
+    selected = (f'id IN (SELECT id FROM {INCIDENTS_TABLE} '
+                f'WHERE source_table = ? AND source_rowid IN ({rowid_sql}))')
+    selected_params = (source_table, *params)
+
+    _adjust_rollup(cursor, selected, selected_params, -1)
+    _adjust_grid(cursor, selected, selected_params, -1)
+    cursor.execute(
+        f'DELETE FROM {LOCATION_INDEX_TABLE} WHERE id IN (SELECT id FROM {INCIDENTS_TABLE} WHERE {selected})',
+        selected_params
+    )
+    cursor.execute(f'DELETE FROM {INCIDENTS_TABLE} WHERE {selected}', selected_params)
+
+    last_id = cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {INCIDENTS_TABLE}').fetchone()[0]
+    columns = ', '.join(INCIDENT_COLUMNS)
+    cursor.execute(
+        f'INSERT INTO {INCIDENTS_TABLE} ({columns}) '
+        f'SELECT * FROM ({source_select_sql(source_table)}) WHERE source_rowid IN ({rowid_sql})',
+        params
+    )
+    _adjust_rollup(cursor, 'id > ?', (last_id,), 1)
+    _adjust_grid(cursor, 'id > ?', (last_id,), 1)
+    _index_locations(cursor, 'id > ?', (last_id,))
+    cursor.execute(f'DELETE FROM {ROLLUP_TABLE} WHERE incident_count <= 0')
+    cursor.execute(f'DELETE FROM {GRID_TABLE} WHERE incident_count <= 0')
+
+
+def main():
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(__file__), '..', 'sql_databases', 'processed_data.db')
+    conn = sqlite3.connect(db_path)
+    counts = build_incidents_table(conn)
+    conn.close()
+    print(f"Built {INCIDENTS_TABLE} table in {db_path}: {counts}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,400 @@
+"""
+Index advisor and planner statistics maintenance for processed_data.db.
+
+The indexes preprocessing.py creates (QUERY_INDEXES) were picked by reading
+query plans by hand, and every new endpoint or rewritten query means doing it
+again. This tool does it repeatably: it requests every read route in
+benchmark.BENCHMARK_ROUTES with the slow-query recorder catching every
+statement, and reports the statements whose EXPLAIN QUERY PLAN has full
+scans or temporary B-trees. For each of those it tries candidate indexes on
+the columns the statement filters, joins, groups or sorts on, plus covering
+variants (every column it reads) and partial variants (WHERE col IS NOT NULL
+when the statement has that filter), in an in-memory copy of the schema and
+planner statistics where creating an index costs nothing. It proposes the
+candidate whose plan has the fewest scans and sorts left. Existing indexes
+that no read route's plan uses are listed too.
+
+--analyze refreshes the planner statistics with ANALYZE before advising (so
+the advice is based on them) and runs PRAGMA optimize at the end; --apply
+also creates the proposed indexes. sqlite_stat4 histograms are only
+collected by SQLite builds compiled with SQLITE_ENABLE_STAT4, and the report
+says whether this one was.
+
+Usage:
+    python index_advisor.py [db_path] [--analyze] [--apply] [--output index_report.json]
+"""
+
+import argparse
+import collections
+import contextlib
+import itertools
+import json
+import os
+import re
+import sqlite3
+import sys
+
+import slow_queries
+from benchmark import BENCHMARK_ROUTES, send_request, serving
+from slow_queries import explain, plan_problems
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'sql_databases', 'processed_data.db')
+
+ADVISED_STATEMENTS = ('SELECT', 'WITH')
+MAX_KEY_COLUMNS = 3      # columns of an index before the covering ones
+MAX_CANDIDATE_KEYS = 5   # filter/group/sort columns per table tried as keys
+MAX_INDEX_COLUMNS = 8    # covering candidates wider than this are not tried
+CANDIDATE_INDEX = 'index_advisor_candidate'
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+IDENTIFIER = re.compile(r'"((?:[^"]|"")+)"|\b([A-Za-z_][A-Za-z0-9_]*)\b')
+SELECT_LIST = re.compile(r'\bSELECT\b.*?\bFROM\b', re.IGNORECASE | re.DOTALL)
+INDEX_IN_PLAN = re.compile(r'USING (?:COVERING )?INDEX (\S+)')
+
+
+def _name_part(name):
+    return re.sub(r'\W+', '_', name.lower()).strip('_')
+
+
+class Index(collections.namedtuple('Index', ['table', 'columns', 'where'])):
+    """A proposed index: columns of table, partial on where (or None)"""
+
+    @property
+    def name(self):
+        parts = [_name_part(self.table)] + [_name_part(column) for column in self.columns]
+        return 'idx_' + '_'.join(parts) + ('_partial' if self.where else '')
+
+    def create_sql(self, name=None):
+        columns = ', '.join(f'"{column}"' for column in self.columns)
+        where = f' WHERE {self.where}' if self.where else ''
+        return f'CREATE INDEX IF NOT EXISTS "{name or self.name}" ON "{self.table}" ({columns}){where}'
+
+
+def read_routes():
+    return [route for route in BENCHMARK_ROUTES if not route.writes]
+
+
+@contextlib.contextmanager
+def recording_every_statement():
+    """Record every statement in the slow-query log (and nothing in its file)"""
+    saved = dict(slow_queries.settings)
+    slow_queries.configure(enabled=True, threshold_ms=0, log_path=None, max_records=100000)
+    slow_queries.log.clear()
+    try:
+        yield
+    finally:
+        slow_queries.settings.update(saved)
+        slow_queries.log.clear()
+
+
+def collect_statements(db_path, routes=None):
+    """
+    SELECT statements the read routes execute against db_path.
+
+    Returns:
+        List of {route, sql, parameters}, one per distinct statement and
+        parameters, in the order they were first executed
+    """
+    statements = {}
+    with recording_every_statement(), serving(db_path) as client:
+        for route in routes or read_routes():
+            slow_queries.log.clear()
+            send_request(client, route)
+            for record in reversed(slow_queries.log.records()):
+                sql = record['sql']
+                if not sql.upper().startswith(ADVISED_STATEMENTS) or 'sqlite_' in sql:
+                    continue
+                key = (sql, json.dumps(record['parameters']))
+                statements.setdefault(key, {'route': route.name, 'sql': sql, 'parameters': record['parameters']})
+    return list(statements.values())
+
+
+def table_columns(conn):
+    """Column names of every ordinary table (not virtual or R*Tree shadow tables)"""
+    rows = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table' AND sql IS NOT NULL").fetchall()
+    virtual = [name for name, sql in rows if sql.upper().startswith('CREATE VIRTUAL TABLE')]
+    columns = {}
+    for name, sql in rows:
+        if name.startswith('sqlite_') or name in virtual or any(name.startswith(f'{v}_') for v in virtual):
+            continue
+        columns[name] = [row[1] for row in conn.execute(f'PRAGMA table_info("{name}")')]
+    return columns
+
+
+def what_if_database(conn):
+    """
+    In-memory copy of conn's schema and planner statistics (sqlite_stat1), in
+    which candidate indexes can be created and planned against instantly.
+    """
+    memory = sqlite3.connect(':memory:')
+    rows = conn.execute("SELECT type, name, sql FROM sqlite_master WHERE sql IS NOT NULL").fetchall()
+    virtual = [name for kind, name, sql in rows if kind == 'table' and sql.upper().startswith('CREATE VIRTUAL TABLE')]
+    order = {'table': 0, 'index': 1, 'view': 2, 'trigger': 3}
+    for kind, name, sql in sorted(rows, key=lambda row: order[row[0]]):
+        # Shadow tables are created along with their virtual table
+        if name.startswith('sqlite_') or any(name.startswith(f'{v}_') for v in virtual):
+            continue
+        memory.execute(sql)
+
+    has_stats = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()
+    if has_stats:
+        memory.execute('ANALYZE')
+        memory.execute('DELETE FROM sqlite_stat1')
+        memory.executemany('INSERT INTO sqlite_stat1 VALUES (?, ?, ?)',
+                           conn.execute('SELECT tbl, idx, stat FROM sqlite_stat1'))
+        # Makes SQLite reload the statistics
+        memory.execute('ANALYZE sqlite_master')
+    memory.commit()
+    return memory
+
+
+def plan_cost(plan):
+    """
+    Sortable cost of a query plan: full scans that read table rows, then
+    temporary B-trees and automatic indexes, then scans of a covering index,
+    then index lookups that still read the table row.
+    """
+    steps = [step.strip() for step in plan]
+    problems = plan_problems(plan)
+    covered_scans = sum('COVERING INDEX' in step for step in problems['full_scans'])
+    return (
+        len(problems['full_scans']) - covered_scans,
+        len(problems['temp_b_trees']) + sum('AUTOMATIC' in step for step in steps),
+        covered_scans,
+        sum(step.startswith('SEARCH ') and 'USING INDEX' in step for step in steps),
+    )
+
+
+def _identifiers(sql):
+    for quoted, bare in IDENTIFIER.findall(STRING_LITERAL.sub("''", sql)):
+        yield (quoted.replace('""', '"') if quoted else bare).lower()
+
+
+def referenced_columns(sql, columns):
+    """
+    Columns of a table a statement references, in order of first use: those
+    it filters, joins, groups or sorts on (anywhere outside a SELECT list),
+    and those it only reads.
+    """
+    by_name = {column.lower(): column for column in columns}
+    used = dict.fromkeys(by_name[name] for name in _identifiers(sql) if name in by_name)
+    keys = dict.fromkeys(by_name[name] for name in _identifiers(SELECT_LIST.sub(' FROM ', sql)) if name in by_name)
+    return list(keys), [column for column in used if column not in keys]
+
+
+def candidate_indexes(sql, table, columns):
+    """Indexes on table that could serve sql: key permutations, their covering and partial variants"""
+    keys, others = referenced_columns(sql, columns)
+    keys = keys[:MAX_CANDIDATE_KEYS]
+    not_null = [
+        f'"{column}" IS NOT NULL' for column in keys + others
+        if re.search(rf'(?:"{re.escape(column)}"|\b{re.escape(column)}\b)\s+IS\s+NOT\s+NULL', sql, re.IGNORECASE)
+    ]
+    wheres = [None] + ([' AND '.join(not_null)] if not_null else [])
+
+    for size in range(1, min(MAX_KEY_COLUMNS, len(keys)) + 1):
+        for key in itertools.permutations(keys, size):
+            rest = tuple(column for column in keys + others if column not in key)
+            variants = [key]
+            if rest and len(key) + len(rest) <= MAX_INDEX_COLUMNS:
+                variants.append(key + rest)
+            for variant in variants:
+                for where in wheres:
+                    yield Index(table, variant, where)
+
+
+def _plan(conn, statement):
+    return explain(conn, statement['sql'], statement['parameters'] or ())
+
+
+def best_index(memory, statement, tables):
+    """
+    Candidate index giving statement the cheapest plan in the what-if
+    database, preferring fewer columns and full indexes on ties.
+
+    Returns:
+        (Index, plan) or (None, None) if no candidate beats the current plan
+    """
+    sql = statement['sql']
+    baseline = plan_cost(_plan(memory, statement))
+    best, best_rank, best_plan = None, None, None
+    referenced = set(_identifiers(sql))
+    for table, columns in tables.items():
+        if table.lower() not in referenced:
+            continue
+        for index in candidate_indexes(sql, table, columns):
+            memory.execute(index.create_sql(CANDIDATE_INDEX))
+            try:
+                plan = _plan(memory, statement)
+            finally:
+                memory.execute(f'DROP INDEX "{CANDIDATE_INDEX}"')
+            cost = plan_cost(plan)
+            rank = (cost, len(index.columns), index.where is not None)
+            if cost < baseline and (best_rank is None or rank < best_rank):
+                best, best_rank, best_plan = index, rank, plan
+    return best, best_plan
+
+
+def _serves(index, other):
+    """Whether other makes index redundant: same table and predicate, index's columns a prefix of other's"""
+    return (index.table == other.table and index.where == other.where
+            and other.columns[:len(index.columns)] == index.columns)
+
+
+def existing_indexes(conn):
+    """Index.columns of every index in the database, by name"""
+    indexes = {}
+    for name, table, sql in conn.execute(
+            "SELECT name, tbl_name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"):
+        columns = tuple(row[2] for row in conn.execute(f'PRAGMA index_info("{name}")'))
+        where = re.split(r'\sWHERE\s', sql, maxsplit=1, flags=re.IGNORECASE)[1:] or [None]
+        where = where[0]
+        indexes[name] = Index(table, columns, where)
+    return indexes
+
+
+def advise(conn, statements):
+    """
+    Plan every statement and propose indexes for those with full scans or temporary B-trees.
+
+    Returns:
+        Report dictionary: statements (with their plans before and after the
+        proposed indexes), proposed_indexes and unused_indexes
+    """
+    memory = what_if_database(conn)
+    tables = table_columns(conn)
+    existing = existing_indexes(conn)
+
+    results = []
+    used = set()
+    proposals = []
+    for statement in statements:
+        try:
+            plan = _plan(conn, statement)
+        except sqlite3.Error as e:
+            results.append({**statement, 'error': str(e)})
+            continue
+        used.update(name for step in plan for name in INDEX_IN_PLAN.findall(step))
+        problems = plan_problems(plan)
+        result = {**statement, 'plan': plan, **problems}
+        if problems['full_scans'] or problems['temp_b_trees']:
+            index, _ = best_index(memory, statement, tables)
+            if index is not None and not any(_serves(index, other) for other in existing.values()):
+                result['index'] = index
+                proposals.append(index)
+        results.append(result)
+
+    # Drop proposals served by a longer proposal on the same table
+    proposals = list(dict.fromkeys(proposals))
+    proposals = [index for index in proposals
+                 if not any(other != index and _serves(index, other) for other in proposals)]
+
+    for index in proposals:
+        memory.execute(index.create_sql())
+    for result in results:
+        index = result.pop('index', None)
+        if 'plan' not in result:
+            continue
+        after = _plan(memory, result)
+        result['plan_after'] = after
+        result['improved'] = plan_cost(after) < plan_cost(result['plan'])
+        result['proposed_index'] = index.create_sql() if index is not None else None
+    memory.close()
+
+    # pk_ indexes are the natural keys incremental loads merge on
+    unused = sorted(name for name in existing if name not in used and not name.startswith('pk_'))
+    return {
+        'statements': results,
+        'proposed_indexes': [index.create_sql() for index in proposals],
+        'unused_indexes': unused,
+    }
+
+
+def analyze(conn):
+    """Refresh the planner statistics; returns whether sqlite_stat4 was collected"""
+    conn.execute('ANALYZE')
+    conn.commit()
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat4'").fetchone() is not None
+
+
+def apply_indexes(conn, index_sql):
+    """Create indexes and gather statistics for them, then let SQLite refresh any stale statistics"""
+    created = []
+    for sql in index_sql:
+        name = re.search(r'INDEX IF NOT EXISTS "([^"]+)"', sql).group(1)
+        print(f"Creating {name}...")
+        conn.execute(sql)
+        conn.execute(f'ANALYZE "{name}"')
+        created.append(name)
+    conn.execute('PRAGMA optimize')
+    conn.commit()
+    return created
+
+
+def print_report(report):
+    problems = [s for s in report['statements'] if s.get('full_scans') or s.get('temp_b_trees')]
+    print(f"{len(report['statements'])} statements, {len(problems)} with full scans or temporary B-trees")
+    for statement in problems:
+        sql = statement['sql']
+        print(f"\n[{statement['route']}] {sql[:117] + '...' if len(sql) > 120 else sql}")
+        for step in statement['full_scans'] + statement['temp_b_trees']:
+            print(f"    {step}")
+        if statement.get('proposed_index'):
+            print(f"  -> {statement['proposed_index']}")
+        if statement.get('improved') and not statement.get('proposed_index'):
+            print("  -> served by another proposed index")
+
+    print("\nProposed indexes:")
+    for sql in report['proposed_indexes'] or ['(none)']:
+        print(f"  {sql}")
+    if report['unused_indexes']:
+        print("\nIndexes no read route uses (write paths may still need them):")
+        for name in report['unused_indexes']:
+            print(f"  {name}")
+    statistics = report.get('statistics')
+    if statistics:
+        stat4 = 'collected' if statistics['stat4'] else 'not available in this SQLite build'
+        print(f"\nANALYZE: sqlite_stat1 refreshed, sqlite_stat4 {stat4}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Propose indexes for the API queries and refresh planner statistics')
+    parser.add_argument('db_path', nargs='?', default=DEFAULT_DB_PATH, help='Database to advise on')
+    parser.add_argument('--analyze', action='store_true',
+                        help='Run ANALYZE before advising and PRAGMA optimize afterwards')
+    parser.add_argument('--apply', action='store_true', help='Create the proposed indexes (implies --analyze)')
+    parser.add_argument('--output', default=None, help='Write the report as JSON to this file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.exists(args.db_path):
+        print(f"No database at {args.db_path}", file=sys.stderr)
+        return 1
+
+    conn = sqlite3.connect(args.db_path)
+    try:
+        statistics = None
+        if args.analyze or args.apply:
+            statistics = {'stat4': analyze(conn)}
+
+        report = advise(conn, collect_statements(args.db_path))
+        report['database'] = args.db_path
+        report['statistics'] = statistics
+        if args.apply:
+            report['created_indexes'] = apply_indexes(conn, report['proposed_indexes'])
+        elif args.analyze:
+            conn.execute('PRAGMA optimize')
+    finally:
+        conn.close()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Keys for rows created through the API.
+
+Each writable table has a counter row in key_sequences. Allocating a key
+bumps the counter in the caller's transaction, so concurrent writers (which
+SQLite serializes) never receive the same key, and a rolled-back insert gives
+its key back. Counters start at KEY_BASE, above every key in the source
+datasets, so app keys keep the 10-digit format. A collision with an
+existing row (e.g. a random key from before the counter existed) is caught
+by an indexed lookup or by the table's unique index, and the next key is tried.
+The counters and key indexes are created once per database, by
+prepare_key_sequences at build time and app startup, not on every insert.
+"""
+
+import sqlite3
+import threading
+
+KEY_SEQUENCES_TABLE = 'key_sequences'
+
+# Writable table -> column holding its generated key
+KEY_COLUMNS = {
+    '311_service_requests': 'unique_key',
+    'sfpd_incidents': 'unique_key',
+    'fire_incidents': 'Incident Number',
+}
+
+KEY_BASE = 1000000000
+MAX_KEY_ATTEMPTS = 10
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _has_index_on(cursor, table, column):
+    for index in cursor.execute(f'PRAGMA index_list({_quote(table)})').fetchall():
+        first = cursor.execute(f'PRAGMA index_info({_quote(index[1])})').fetchone()
+        if first is not None and first[2] == column:
+            return True
+    return False
+
+
+def ensure_key_sequence(cursor, table):
+    """
+    Create the sequence table and the table's counter if missing, and index
+    the key column so collision checks don't scan the table.
+    """
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {KEY_SEQUENCES_TABLE} (
+            source_table TEXT PRIMARY KEY,
+            next_key INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute(
+        f'INSERT OR IGNORE INTO {KEY_SEQUENCES_TABLE} (source_table, next_key) VALUES (?, ?)',
+        (table, KEY_BASE)
+    )
+    column = KEY_COLUMNS[table]
+    if not _has_index_on(cursor, table, column):
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {_quote(f"idx_{table}_key")} ON {_quote(table)} ({_quote(column)})'
+        )
+
+
+# Database files whose counters and key indexes prepare_key_sequences has committed
+_prepared_databases = set()
+_prepared_lock = threading.Lock()
+
+
+def _database_path(cursor):
+    return cursor.execute('PRAGMA database_list').fetchone()[2]
+
+
+def prepare_key_sequences(conn):
+    """
+    Run ensure_key_sequence for every writable table of a database and commit,
+    so allocate_key skips it from then on. Meant for build time and app
+    startup: indexing a key column of a large table takes a while.
+    """
+    cursor = conn.cursor()
+    for table in KEY_COLUMNS:
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()
+        if exists:
+            ensure_key_sequence(cursor, table)
+    conn.commit()
+    db_path = _database_path(cursor)
+    cursor.close()
+    if db_path:
+        with _prepared_lock:
+            _prepared_databases.add(db_path)
+
+
+def allocate_key(cursor, table):
+    """
+    Next unused key for table, as a string. Runs in the caller's transaction.
+
+    Raises:
+        RuntimeError: if MAX_KEY_ATTEMPTS consecutive keys are already taken
+    """
+    if _database_path(cursor) not in _prepared_databases:
+        # Not prepared (e.g. a database used outside the app): set up in this transaction
+        ensure_key_sequence(cursor, table)
+    column = KEY_COLUMNS[table]
+    for _ in range(MAX_KEY_ATTEMPTS):
+        key = cursor.execute(
+            f'UPDATE {KEY_SEQUENCES_TABLE} SET next_key = next_key + 1 '
+            f'WHERE source_table = ? RETURNING next_key - 1',
+            (table,)
+        ).fetchone()[0]
+        key = str(key)
+        taken = cursor.execute(
+            f'SELECT 1 FROM {_quote(table)} WHERE {_quote(column)} = ? LIMIT 1', (key,)
+        ).fetchone()
+        if taken is None:
+            return key
+    raise RuntimeError(f"Could not allocate a key for '{table}'")
+
+
+def insert_with_key(cursor, table, query, values):
+    """
+    Execute an INSERT ... RETURNING whose first placeholder is the table's
+    key, allocating a fresh key and retrying if the unique index rejects it.
+
+    Returns:
+        The row returned by the INSERT
+    """
+    for _ in range(MAX_KEY_ATTEMPTS):
+        key = allocate_key(cursor, table)
+        try:
+            cursor.execute(query, (key, *values))
+        except sqlite3.IntegrityError as e:
+            if 'UNIQUE' not in str(e):
+                raise
+            continue
+        return cursor.fetchone()
+    raise RuntimeError(f"Could not allocate a key for '{table}'")
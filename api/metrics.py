@@ -0,0 +1,364 @@
+"""
+Request metrics in the Prometheus text format, served at /metrics.
+
+Every handler catches its own exceptions, so the logs say nothing about which
+endpoint is slow or why. Request hooks record, per route, the latency of
+each request and how it splits into SQL (time spent executing statements and
+fetching their rows, measured by TimedCursor on pooled connections), JSON
+serialization, and the Python in between (mostly converting rows to
+records). Rows fetched and response bytes are recorded per route as well,
+and the connection pool, response cache, write queue and geocoder counters
+are exported alongside them when /metrics is scraped.
+
+Streamed responses (those without a Content-Length) keep executing SQL and
+serializing after the handler returns; they are recorded when the stream is
+closed, so their latency covers the whole body.
+"""
+
+import bisect
+import sqlite3
+import threading
+import time
+
+from flask import Response, g, has_app_context, request
+from flask.json.provider import DefaultJSONProvider
+
+import slow_queries
+
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Cumulative histogram per label combination.
+
+    Args:
+        name: Metric name
+        help: One-line description
+        labelnames: Names of the labels every observation carries
+        buckets: Upper bounds of the buckets, ascending (+Inf is implied)
+    """
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, (list(counts), total, count))
+                            for labels, (counts, total, count) in self._series.items())
+        names = self.labelnames + ('le',)
+        for labels, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{_labels(names, labels + (_number(bound),))} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class Registry:
+    """Histograms recorded by the request hooks, plus gauges read from stats() callables at scrape time"""
+
+    def __init__(self):
+        self.histograms = []
+        self._collectors = []
+
+    def histogram(self, *args, **kwargs):
+        histogram = Histogram(*args, **kwargs)
+        self.histograms.append(histogram)
+        return histogram
+
+    def register_stats(self, prefix, stats, label=None):
+        """
+        Export the numeric values of stats() as gauges named {prefix}_{key}.
+        If label is given, stats() returns {label value: {key: value}}.
+        """
+        self._collectors.append((prefix, stats, label))
+
+    def clear(self):
+        for histogram in self.histograms:
+            histogram.clear()
+
+    def _gauges(self, prefix, stats, label):
+        values = {}
+        series = stats().items() if label else [(None, stats())]
+        for label_value, counters in series:
+            for key, value in counters.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    labels = _labels((label,), (label_value,)) if label else ''
+                    values.setdefault(f'{prefix}_{key}', []).append(f'{labels} {_number(value)}')
+        lines = []
+        for name, samples in values.items():
+            lines.append(f'# TYPE {name} gauge')
+            lines.extend(name + sample for sample in samples)
+        return lines
+
+    def render(self):
+        lines = []
+        for histogram in self.histograms:
+            lines.extend(histogram.render())
+        for prefix, stats, label in self._collectors:
+            lines.extend(self._gauges(prefix, stats, label))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    'api_request_duration_seconds', 'Time to serve a request, including a streamed body',
+    ('method', 'route', 'status'))
+request_phase = registry.histogram(
+    'api_request_phase_seconds', 'Time per request spent executing SQL, in Python and serializing JSON',
+    ('route', 'phase'))
+request_rows = registry.histogram(
+    'api_request_rows', 'Rows fetched from SQLite per request', ('route',), ROW_BUCKETS)
+response_bytes = registry.histogram(
+    'api_response_bytes', 'Size of the response body', ('route',), BYTE_BUCKETS)
+sql_statements = registry.histogram(
+    'api_request_sql_statements', 'SQL statements executed per request', ('route',), ROW_BUCKETS)
+
+# enabled: record requests (False skips the hooks and cursor timing; /metrics still answers)
+settings = {
+    'enabled': True,
+}
+
+
+def configure(**options):
+    """Update settings, e.g. configure(enabled=False)"""
+    unknown = set(options) - set(settings)
+    if unknown:
+        raise ValueError(f"Unknown metrics settings: {', '.join(sorted(unknown))}")
+    settings.update(options)
+
+
+class RequestTimings:
+    """Accumulated per request by cursors and the JSON provider"""
+
+    __slots__ = ('start', 'sql', 'serialize', 'rows', 'statements')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql = 0.0
+        self.serialize = 0.0
+        self.rows = 0
+        self.statements = 0
+
+
+def current_timings():
+    """Timings of the request being served, or None outside a recorded request"""
+    if not has_app_context():
+        return None
+    return g.get('request_timings')
+
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursor that adds the time spent in execute and fetch calls, and the rows
+    fetched, to the timings of the request it was executed in, and times
+    each statement until it is done (fetched to the end, replaced by the
+    next execute, or closed) for the slow-query log.
+    """
+
+    _timings = None
+    _statement = None
+
+    def _run(self, method, sql, parameters, recorded_parameters):
+        self._end_statement()
+        self._timings = current_timings()
+        self._statement = slow_queries.start(self.connection, sql, recorded_parameters)
+        if self._timings is None and self._statement is None:
+            return method(self, sql, parameters)
+        if self._timings is not None:
+            self._timings.statements += 1
+        return self._timed(method, sql, parameters)
+
+    def _timed(self, method, *args):
+        steps = getattr(self.connection, 'vm_steps', 0)
+        start = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            if self._timings is not None:
+                self._timings.sql += elapsed
+            if self._statement is not None:
+                self._statement.add(elapsed, getattr(self.connection, 'vm_steps', 0) - steps)
+
+    def _count(self, rows):
+        if self._timings is not None:
+            self._timings.rows += rows
+        if self._statement is not None:
+            self._statement.rows += rows
+
+    def _end_statement(self):
+        statement = self._statement
+        if statement is not None:
+            self._statement = None
+            statement.end()
+
+    def execute(self, sql, parameters=()):
+        return self._run(sqlite3.Cursor.execute, sql, parameters, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(sqlite3.Cursor.executemany, sql, seq_of_parameters, None)
+
+    def fetchall(self):
+        if self._timings is None and self._statement is None:
+            return super().fetchall()
+        rows = self._timed(sqlite3.Cursor.fetchall)
+        self._count(len(rows))
+        self._end_statement()
+        return rows
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        if self._timings is None and self._statement is None:
+            return super().fetchmany(size)
+        rows = self._timed(sqlite3.Cursor.fetchmany, size)
+        self._count(len(rows))
+        if len(rows) < size:
+            self._end_statement()
+        return rows
+
+    def fetchone(self):
+        if self._timings is None and self._statement is None:
+            return super().fetchone()
+        row = self._timed(sqlite3.Cursor.fetchone)
+        if row is None:
+            self._end_statement()
+        else:
+            self._count(1)
+        return row
+
+    def __next__(self):
+        if self._timings is None and self._statement is None:
+            return super().__next__()
+        try:
+            row = self._timed(sqlite3.Cursor.__next__)
+        except StopIteration:
+            self._end_statement()
+            raise
+        self._count(1)
+        return row
+
+    def close(self):
+        self._end_statement()
+        super().close()
+
+    def __del__(self):
+        self._end_statement()
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, adding the time spent in dumps to the request's serialize time"""
+
+    def dumps(self, obj, **kwargs):
+        timings = current_timings()
+        if timings is None:
+            return super().dumps(obj, **kwargs)
+        start = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            timings.serialize += time.perf_counter() - start
+
+
+def add_serialize_time(seconds):
+    """Count serialization done outside Flask's JSON provider (e.g. streamed batches)"""
+    timings = current_timings()
+    if timings is not None:
+        timings.serialize += seconds
+
+
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else '<unmatched>'
+
+
+def _start_request():
+    if settings['enabled']:
+        g.request_timings = RequestTimings()
+
+
+def _record(timings, method, route, status, size):
+    total = time.perf_counter() - timings.start
+    python = max(total - timings.sql - timings.serialize, 0.0)
+    request_duration.observe(total, method, route, status)
+    request_phase.observe(timings.sql, route, 'sql')
+    request_phase.observe(python, route, 'python')
+    request_phase.observe(timings.serialize, route, 'serialize')
+    request_rows.observe(timings.rows, route)
+    sql_statements.observe(timings.statements, route)
+    if size is not None:
+        response_bytes.observe(size, route)
+
+
+def _counting(chunks, counter):
+    for chunk in chunks:
+        counter[0] += len(chunk.encode() if isinstance(chunk, str) else chunk)
+        yield chunk
+
+
+def _finish_request(response):
+    timings = g.get('request_timings')
+    if timings is None:
+        return response
+    labels = (request.method, _route(), str(response.status_code))
+    if response.content_length is None:
+        counter = [0]
+        response.response = _counting(response.response, counter)
+        response.call_on_close(lambda: _record(timings, *labels, counter[0]))
+    else:
+        _record(timings, *labels, response.content_length)
+    return response
+
+
+def metrics_response():
+    return Response(registry.render(), content_type=PROMETHEUS_MIMETYPE)
+
+
+def init_app(app):
+    app.json = TimedJSONProvider(app)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
@@ -4,12 +4,29 @@ import pandas as pd
 import sqlite3
 import datetime
 import os
-import random
-import string
+import io
 import json
-import ast
+import threading
+import base64
 from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderServiceError
+import db_pool
+import metrics
+import slow_queries
+import response_cache
+from response_cache import cached, invalidate
+from key_allocator import insert_with_key, prepare_key_sequences
+from streaming import stream_rows
+from arrow_stream import stream_arrow
+from source_merge import execute_per_source
+from bulk_ingest import ingest_ndjson, DEFAULT_CHUNK_SIZE, MAX_CHUNK_SIZE
+import geocoding
+import write_queue
+import gazetteer
+from incidents import (
+    GRID_TABLE, INCIDENTS_TABLE, INCIDENT_SOURCES, ROLLUP_TABLE,
+    bbox_filter, ensure_incidents_table, grid_cell, grid_cell_bounds, grid_cell_size, grid_level,
+    record_incident, zip_coordinates
+)
 
 app = Flask(__name__)
 
@@ -29,12 +46,69 @@ RESULTS_DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'sql_databases',
 
 geolocator = Nominatim(user_agent="sf-public-safety-dashboard")
 
+# Pooled connections are returned to the pool when the app context tears down
+db_pool.init_app(app)
 
-def get_db_connection(db_path=DB_PATH):
-    """Create a database connection"""
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Per-route latency, SQL/Python/serialization time, rows and bytes for /metrics
+metrics.init_app(app)
+metrics.registry.register_stats('api_db_pool', db_pool.pool.stats)
+metrics.registry.register_stats('api_response_cache', response_cache.cache.stats)
+metrics.registry.register_stats('api_write_queue', write_queue.stats, label='database')
+metrics.registry.register_stats('api_geocode_cache', geocoding.cache.stats)
+metrics.registry.register_stats('api_geocode_worker', lambda: geocoding.stats()['workers'], label='database')
+metrics.registry.register_stats('api_slow_queries', slow_queries.log.stats)
+
+
+def get_db_connection(db_path=None):
+    """Get a pooled database connection for the current request"""
+    return db_pool.get_pooled_connection(db_path or DB_PATH)
+
+
+# Databases whose incidents table prepare_database has checked
+_prepared_databases = set()
+_prepare_lock = threading.Lock()
+
+
+@app.before_request
+def prepare_database():
+    """
+    Build the incidents table and the tables derived from it (or migrate them),
+    and the key counters and indexes of the create endpoints, before the first
+    request against a database, so the app works the same under a WSGI server
+    as with `python queries.py`.
+    """
+    db_path = DB_PATH
+    if db_path in _prepared_databases or not os.path.exists(db_path):
+        return
+    with _prepare_lock:
+        if db_path not in _prepared_databases:
+            # A connection of its own, so the one-off build isn't timed as part of the request
+            conn = sqlite3.connect(db_path)
+            try:
+                ensure_incidents_table(conn)
+                prepare_key_sequences(conn)
+            finally:
+                conn.close()
+            _prepared_databases.add(db_path)
+
+
+# /metrics and /debug/* expose SQL parameters (user addresses) and server internals,
+# so they only answer these clients; add a scraper's address to let it in
+INTERNAL_ENDPOINT_CLIENTS = {'127.0.0.1', '::1'}
+
+
+@app.before_request
+def restrict_internal_endpoints():
+    """
+    Refuse /metrics and /debug/* to clients outside INTERNAL_ENDPOINT_CLIENTS.
+    A request forwarded by a proxy (X-Forwarded-For) is treated as remote, since
+    a proxy on the same host would otherwise make every client look local.
+    """
+    if request.path != '/metrics' and not request.path.startswith('/debug/'):
+        return None
+    if request.remote_addr in INTERNAL_ENDPOINT_CLIENTS and 'X-Forwarded-For' not in request.headers:
+        return None
+    return jsonify({"error": "Forbidden"}), 403
 
 
 def parse_float(value):
@@ -44,7 +118,43 @@ def parse_float(value):
         return None
 
 
-def geocode_address(address, zip_code=None):
+def parse_bbox(value):
+    """
+    'minLon,minLat,maxLon,maxLat' query parameter as a tuple of floats, or
+    None if it isn't four numbers forming a box.
+    """
+    try:
+        bbox = tuple(float(part) for part in value.split(','))
+    except ValueError:
+        return None
+    if len(bbox) != 4:
+        return None
+    min_lon, min_lat, max_lon, max_lat = bbox
+    if not (-180 <= min_lon <= max_lon <= 180 and -90 <= min_lat <= max_lat <= 90):
+        return None
+    return bbox
+
+
+def encode_cursor(values):
+    """Encode the sort key of the last row of a page as an opaque cursor"""
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    """Decode a cursor produced by encode_cursor. Returns None if it is invalid."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != length:
+        return None
+    return values
+
+
+def nominatim_geocode(address, zip_code=None):
+    """Geocode an address with Nominatim. Service errors are raised so the geocode worker can retry."""
     if not address:
         return None, None
 
@@ -53,178 +163,144 @@ def geocode_address(address, zip_code=None):
         query_parts.append(str(zip_code))
     query = ", ".join(query_parts)
 
-    try:
-        location = geolocator.geocode(query, timeout=5)
-        if location:
-            return location.latitude, location.longitude
-    except GeocoderServiceError:
-        pass
-
+    location = geolocator.geocode(query, timeout=5)
+    if location:
+        return location.latitude, location.longitude
     return None, None
 
 
+# Rows created without coordinates are geocoded in the background, rate limited for Nominatim
+geocoding.configure(geocoder=nominatim_geocode)
+
+
 # Query 1: All Incidents by Time
+TIMELINE_FORMATS = ['json', 'ndjson', 'arrow']
+TIMELINE_COLUMNS = [
+    'source_table', 'incident_time', 'incident_type', 'description',
+    'address', 'neighborhood', 'latitude', 'longitude'
+]
+
+
+def timeline_record(row):
+    """JSON record of an incidents row selected by getIncidentTimeline"""
+    return {column: row[column] for column in TIMELINE_COLUMNS}
+
+
 @app.route('/api/incidents/timeline', methods=['GET'])
 def getIncidentTimeline():
     """
     Returns all incidents from multiple data sources combined and ordered by time.
     Query Parameters:
     - limit (integer): Max number of incidents to return
-    - source (string): Filter by source table
+    - source (string): Filter by source table, or a comma-separated list of source tables
     - prioritize_coords (boolean): If true, prioritize records with valid coordinates (for map rendering)
+    - cursor (string): Opaque next_cursor value from a previous page (keyset pagination)
+    - bbox (string): 'minLon,minLat,maxLon,maxLat'; only incidents inside this box
+    - stream (boolean): If true, stream the JSON response with count/sources/next_cursor after the data
+    - format (string): 'json' (default), 'ndjson' (streamed, one incident per line and a final
+      {"summary": {...}} line) or 'arrow' (streamed Arrow IPC record batches, without the summary)
     """
     try:
         limit = request.args.get('limit', type=int)
         source = request.args.get('source', type=str)
         prioritize_coords = request.args.get('prioritize_coords', 'false').lower() == 'true'
+        cursor_token = request.args.get('cursor', type=str)
+        bbox_param = request.args.get('bbox', type=str)
+        stream = request.args.get('stream', 'false').lower() == 'true'
+        output_format = request.args.get('format', 'json').lower()
 
-        # Valid source tables
-        valid_sources = [
-            '311_service_requests',
-            'fire_incidents',
-            'fire_safety_complaints',
-            'fire_violations',
-            'sffd_service_calls',
-            'sfpd_incidents'
-        ]
+        if output_format not in TIMELINE_FORMATS:
+            return jsonify({"error": f"format must be one of: {', '.join(TIMELINE_FORMATS)}"}), 400
 
-        # Validate source if provided
-        if source and source not in valid_sources:
+        # Validate sources against the source registry, keeping request order without repeats
+        sources = list(dict.fromkeys(name for name in (source or '').split(',') if name))
+        if any(name not in INCIDENT_SOURCES for name in sources):
             return jsonify({"error": "Invalid source table"}), 400
 
+        bbox = None
+        if bbox_param:
+            bbox = parse_bbox(bbox_param)
+            if bbox is None:
+                return jsonify({"error": "Invalid bbox, expected minLon,minLat,maxLon,maxLat"}), 400
+
+        # Keyset: the ORDER BY columns, all descending, ending in the unique id
+        sort_key = ['incident_time', 'source_table', 'id']
+        if prioritize_coords:
+            sort_key.insert(0, 'has_coords')
+
+        after = None
+        if cursor_token:
+            after = decode_cursor(cursor_token, len(sort_key))
+            if after is None:
+                return jsonify({"error": "Invalid cursor"}), 400
+
         conn = get_db_connection()
-        cursor = conn.cursor()
 
-        # Build the query - fetch location column for fire_safety_complaints and fire_violations
-        query = """
+        query = f"""
             SELECT
-                '311_service_requests' AS source_table,
-                created_date AS incident_time,
-                category AS incident_type,
-                complaint_type AS description,
-                incident_address AS address,
+                id,
+                has_coords,
+                source_table,
+                incident_time,
+                incident_type,
+                description,
+                address,
                 neighborhood,
                 latitude,
-                longitude,
-                NULL AS location_json,
-                NULL AS zip_code
-            FROM "311_service_requests"
-            WHERE created_date IS NOT NULL
+                longitude
+            FROM {INCIDENTS_TABLE}
+            WHERE incident_time IS NOT NULL
+        """
+        params = []
 
-            UNION ALL
+        # Source filter; its value is bound per source when the query runs
+        if sources:
+            query += " AND source_table = ?"
 
-            SELECT
-                'fire_incidents' AS source_table,
-                "Incident Date" AS incident_time,
-                "Primary Situation" AS incident_type,
-                "Action Taken Primary" AS description,
-                Address AS address,
-                "Analysis Neighborhood" AS neighborhood,
-                NULL AS latitude,
-                NULL AS longitude,
-                NULL AS location_json,
-                "ZIP Code" AS zip_code
-            FROM fire_incidents
-            WHERE "Incident Date" IS NOT NULL
+        # Only incidents in the visible area, found through the R*Tree
+        if bbox is not None:
+            bbox_sql, bbox_values = bbox_filter(conn, bbox, limit)
+            query += " AND " + bbox_sql
+            params.extend(bbox_values)
 
-            UNION ALL
+        # Seek past the last row of the previous page through the index
+        if after is not None:
+            query += f" AND ({', '.join(sort_key)}) < ({', '.join('?' for _ in sort_key)})"
+            params.extend(after)
 
-            SELECT
-                'fire_safety_complaints' AS source_table,
-                "Received Date" AS incident_time,
-                "Complaint Item Type Description" AS incident_type,
-                Disposition AS description,
-                Address AS address,
-                "Neighborhood  District" AS neighborhood,
-                NULL AS latitude,
-                NULL AS longitude,
-                Location AS location_json,
-                NULL AS zip_code
-            FROM fire_safety_complaints
-            WHERE "Received Date" IS NOT NULL
-
-            UNION ALL
+        # Only prioritize coordinates if requested (for map rendering)
+        query += " ORDER BY " + ", ".join(f"{column} DESC" for column in sort_key)
 
-            SELECT
-                'fire_violations' AS source_table,
-                "violation date" AS incident_time,
-                "violation item description" AS incident_type,
-                Status AS description,
-                Address AS address,
-                "neighborhood district" AS neighborhood,
-                NULL AS latitude,
-                NULL AS longitude,
-                Location AS location_json,
-                NULL AS zip_code
-            FROM fire_violations
-            WHERE "violation date" IS NOT NULL
-
-            UNION ALL
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
 
-            SELECT
-                'sffd_service_calls' AS source_table,
-                call_date AS incident_time,
-                call_type AS incident_type,
-                call_final_disposition AS description,
-                address,
-                supervisor_district AS neighborhood,
-                latitude,
-                longitude,
-                NULL AS location_json,
-                NULL AS zip_code
-            FROM sffd_service_calls
-            WHERE call_date IS NOT NULL
+        # Several sources run as one index-ordered, limited query each, merged on the sort key
+        if sources:
+            cursor = execute_per_source(conn, query, params, sources, sort_key, limit)
+        else:
+            cursor = conn.execute(query, params)
 
-            UNION ALL
+        if output_format == 'arrow':
+            return stream_arrow(conn, cursor, TIMELINE_COLUMNS)
 
-            SELECT
-                'sfpd_incidents' AS source_table,
-                timestamp AS incident_time,
-                category AS incident_type,
-                descript AS description,
-                address,
-                pddistrict AS neighborhood,
-                latitude,
-                longitude,
-                NULL AS location_json,
-                NULL AS zip_code
-            FROM sfpd_incidents
-            WHERE timestamp IS NOT NULL
-        """
+        if stream or output_format == 'ndjson':
+            # Rows are serialized as they are fetched; the summary follows the last one
+            seen = {'count': 0, 'sources': {}, 'last': None}
 
-        # Wrap query in subquery for proper ordering
-        wrapped_query = f"""
-            SELECT * FROM (
-                {query}
-            )
-        """
-        
-        # Add source filter if provided
-        if source:
-            wrapped_query = f"""
-                SELECT * FROM (
-                    {wrapped_query}
-                ) WHERE source_table = ?
-            """
-            # Only prioritize coordinates if requested (for map rendering)
-            if prioritize_coords:
-                # Use CAST to handle string coordinates, and filter out 0.0 values
-                wrapped_query += " ORDER BY CASE WHEN latitude IS NOT NULL AND longitude IS NOT NULL AND CAST(latitude AS REAL) != 0 AND CAST(longitude AS REAL) != 0 THEN 0 ELSE 1 END, incident_time DESC"
-            else:
-                wrapped_query += " ORDER BY incident_time DESC"
-            if limit:
-                wrapped_query += f" LIMIT {limit}"
-            cursor.execute(wrapped_query, (source,))
-        else:
-            # Only prioritize coordinates if requested (for map rendering)
-            if prioritize_coords:
-                # Use CAST to handle string coordinates, and filter out 0.0 values
-                wrapped_query += " ORDER BY CASE WHEN latitude IS NOT NULL AND longitude IS NOT NULL AND CAST(latitude AS REAL) != 0 AND CAST(longitude AS REAL) != 0 THEN 0 ELSE 1 END, incident_time DESC"
-            else:
-                wrapped_query += " ORDER BY incident_time DESC"
-            if limit:
-                wrapped_query += f" LIMIT {limit}"
-            cursor.execute(wrapped_query)
+            def to_record(row):
+                seen['count'] += 1
+                seen['sources'][row['source_table']] = seen['sources'].get(row['source_table'], 0) + 1
+                seen['last'] = row
+                return timeline_record(row)
+
+            def summary():
+                next_cursor = None
+                if limit and seen['count'] == limit:
+                    next_cursor = encode_cursor([seen['last'][column] for column in sort_key])
+                return {"count": seen['count'], "sources": seen['sources'], "next_cursor": next_cursor}
+
+            return stream_rows(conn, cursor, to_record, summary, fmt=output_format)
 
         rows = cursor.fetchall()
 
@@ -232,54 +308,217 @@ def getIncidentTimeline():
         data = []
         sources = {}
         for row in rows:
-            # Parse coordinates
-            lat = row['latitude']
-            lon = row['longitude']
-            
-            # For fire_safety_complaints and fire_violations, parse location string
-            if row['location_json']:
-                try:
-                    # Try parsing as Python literal (dict string)
-                    location_data = ast.literal_eval(row['location_json'])
-                    if location_data and 'coordinates' in location_data:
-                        lon = location_data['coordinates'][0]
-                        lat = location_data['coordinates'][1]
-                except (ValueError, SyntaxError, KeyError, IndexError, TypeError):
-                    # Fallback: try JSON parsing
-                    try:
-                        location_data = json.loads(row['location_json'])
-                        if location_data and 'coordinates' in location_data:
-                            lon = location_data['coordinates'][0]
-                            lat = location_data['coordinates'][1]
-                    except (json.JSONDecodeError, KeyError, IndexError, TypeError):
-                        lat, lon = None, None
-            
-            # For fire_incidents, use ZIP Code to get approximate coordinates
-            elif row['source_table'] == 'fire_incidents' and row['zip_code']:
-                zip_code = str(row['zip_code']).split('.')[0]  # Remove .0 if present
-                if zip_code in SF_ZIP_COORDINATES:
-                    lat, lon = SF_ZIP_COORDINATES[zip_code]
-                else:
-                    lat, lon = None, None
-            
-            data.append({
-                "source_table": row['source_table'],
-                "incident_time": row['incident_time'],
-                "incident_type": row['incident_type'],
-                "description": row['description'],
-                "address": row['address'],
-                "neighborhood": row['neighborhood'],
-                "latitude": lat,
-                "longitude": lon
-            })
+            data.append(timeline_record(row))
             sources[row['source_table']] = sources.get(row['source_table'], 0) + 1
 
         conn.close()
 
+        # A full page means there may be more rows after the last one
+        next_cursor = None
+        if limit and len(rows) == limit:
+            next_cursor = encode_cursor([rows[-1][column] for column in sort_key])
+
         return jsonify({
             "data": data,
             "count": len(data),
-            "sources": sources
+            "sources": sources,
+            "next_cursor": next_cursor
+        })
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+## Incidents feed: the columns the map draws, for every incident with coordinates
+FEED_COLUMNS = ['source_table', 'incident_time', 'incident_type', 'latitude', 'longitude']
+
+
+def parse_time_param(value):
+    """'YYYY-MM-DD[ HH:MM:SS]' query parameter as the incidents table's time text, or None if invalid"""
+    try:
+        return datetime.datetime.fromisoformat(value).strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+
+
+@app.route('/api/incidents/feed', methods=['GET'])
+def getIncidentFeed():
+    """
+    Streams source, time, type and coordinates of incidents with coordinates, newest first.
+    Query Parameters:
+    - source (string): Filter by source table
+    - since (string): Only incidents at or after this time ('YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS')
+    - until (string): Only incidents before this time
+    - bbox (string): 'minLon,minLat,maxLon,maxLat'; only incidents inside this box
+    - limit (integer): Max number of incidents to return
+    - format (string): 'json' (default, {"data": [...], "count", "sources"}), 'ndjson' or 'arrow'
+    """
+    try:
+        source = request.args.get('source', type=str)
+        limit = request.args.get('limit', type=int)
+        output_format = request.args.get('format', 'json').lower()
+
+        if output_format not in TIMELINE_FORMATS:
+            return jsonify({"error": f"format must be one of: {', '.join(TIMELINE_FORMATS)}"}), 400
+        if source and source not in INCIDENT_SOURCES:
+            return jsonify({"error": "Invalid source table"}), 400
+
+        query = f"""
+            SELECT {', '.join(FEED_COLUMNS)}
+            FROM {INCIDENTS_TABLE}
+            WHERE has_coords = 1 AND incident_time IS NOT NULL
+        """
+        params = []
+        if source:
+            query += " AND source_table = ?"
+            params.append(source)
+        for name, operator in (('since', '>='), ('until', '<')):
+            value = request.args.get(name, type=str)
+            if value:
+                bound = parse_time_param(value)
+                if bound is None:
+                    return jsonify({"error": f"Invalid {name} time"}), 400
+                query += f" AND incident_time {operator} ?"
+                params.append(bound)
+        bbox = None
+        bbox_param = request.args.get('bbox', type=str)
+        if bbox_param:
+            bbox = parse_bbox(bbox_param)
+            if bbox is None:
+                return jsonify({"error": "Invalid bbox, expected minLon,minLat,maxLon,maxLat"}), 400
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        if bbox is not None:
+            bbox_sql, bbox_values = bbox_filter(conn, bbox, limit)
+            query += " AND " + bbox_sql
+            params.extend(bbox_values)
+        query += " ORDER BY incident_time DESC"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        cursor.execute(query, params)
+
+        if output_format == 'arrow':
+            return stream_arrow(conn, cursor, FEED_COLUMNS)
+
+        seen = {'count': 0, 'sources': {}}
+
+        def to_record(row):
+            seen['count'] += 1
+            seen['sources'][row['source_table']] = seen['sources'].get(row['source_table'], 0) + 1
+            return {column: row[column] for column in FEED_COLUMNS}
+
+        return stream_rows(conn, cursor, to_record, lambda: dict(seen), fmt=output_format)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# Cluster breakdowns -> grid column and response key
+CLUSTER_BREAKDOWNS = {
+    'source': ('source_table', 'sources'),
+    'type': ('incident_type', 'types'),
+}
+
+
+@app.route('/api/incidents/clusters', methods=['GET'])
+def getIncidentClusters():
+    """
+    Returns incident counts per map grid cell for a zoom level, read from the precomputed grid.
+    Query Parameters:
+    - zoom (integer, required): Web map zoom level
+    - bbox (string): 'minLon,minLat,maxLon,maxLat'; only cells overlapping this box
+    - source (string): Filter by source table
+    - breakdown (string): Comma-separated 'source' and/or 'type' counts per cell
+    """
+    try:
+        zoom = request.args.get('zoom', type=int)
+        source = request.args.get('source', type=str)
+        breakdown_param = request.args.get('breakdown', default='', type=str)
+
+        if zoom is None or not 0 <= zoom <= 22:
+            return jsonify({"error": "zoom must be an integer between 0 and 22"}), 400
+        if source and source not in INCIDENT_SOURCES:
+            return jsonify({"error": "Invalid source table"}), 400
+        breakdown = [name for name in breakdown_param.split(',') if name]
+        if any(name not in CLUSTER_BREAKDOWNS for name in breakdown):
+            return jsonify({"error": f"breakdown must be a list of: {', '.join(CLUSTER_BREAKDOWNS)}"}), 400
+
+        level = grid_level(zoom)
+        breakdown_columns = [CLUSTER_BREAKDOWNS[name][0] for name in breakdown]
+        query = f"""
+            SELECT
+                cell_x,
+                cell_y,
+                {''.join(column + ', ' for column in breakdown_columns)}
+                SUM(incident_count) AS incident_count,
+                SUM(latitude_sum) AS latitude_sum,
+                SUM(longitude_sum) AS longitude_sum
+            FROM {GRID_TABLE}
+            WHERE level = ?
+        """
+        params = [level]
+
+        bbox_param = request.args.get('bbox', type=str)
+        if bbox_param:
+            bbox = parse_bbox(bbox_param)
+            if bbox is None:
+                return jsonify({"error": "Invalid bbox, expected minLon,minLat,maxLon,maxLat"}), 400
+            min_x, min_y = grid_cell(bbox[1], bbox[0], level)
+            max_x, max_y = grid_cell(bbox[3], bbox[2], level)
+            query += " AND cell_x BETWEEN ? AND ? AND cell_y BETWEEN ? AND ?"
+            params.extend([min_x, max_x, min_y, max_y])
+        if source:
+            query += " AND source_table = ?"
+            params.append(source)
+        query += f" GROUP BY {', '.join(['cell_x', 'cell_y'] + breakdown_columns)}"
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+
+        # Fold the breakdown rows of each cell into one cluster
+        cells = {}
+        for row in cursor.fetchall():
+            key = (row['cell_x'], row['cell_y'])
+            cell = cells.get(key)
+            if cell is None:
+                cell = cells[key] = {
+                    'count': 0, 'latitude_sum': 0.0, 'longitude_sum': 0.0,
+                    **{CLUSTER_BREAKDOWNS[name][1]: {} for name in breakdown}
+                }
+            cell['count'] += row['incident_count']
+            cell['latitude_sum'] += row['latitude_sum']
+            cell['longitude_sum'] += row['longitude_sum']
+            for name in breakdown:
+                column, field = CLUSTER_BREAKDOWNS[name]
+                cell[field][row[column]] = cell[field].get(row[column], 0) + row['incident_count']
+
+        conn.close()
+
+        data = []
+        for (cell_x, cell_y), cell in cells.items():
+            count = cell.pop('count')
+            data.append({
+                "cell": f"{level}/{cell_x}/{cell_y}",
+                "count": count,
+                "latitude": cell.pop('latitude_sum') / count,
+                "longitude": cell.pop('longitude_sum') / count,
+                "bounds": grid_cell_bounds(cell_x, cell_y, level),
+                **cell
+            })
+        data.sort(key=lambda item: item['count'], reverse=True)
+
+        return jsonify({
+            "data": data,
+            "zoom": zoom,
+            "level": level,
+            "cell_size": grid_cell_size(level),
+            "total_cells": len(data),
+            "total_incidents": sum(item['count'] for item in data)
         })
 
     except Exception as e:
@@ -294,80 +533,42 @@ def getTopNeighborhoods():
     Query Parameters:
     - limit (integer): Max neighborhoods (default 20)
     - min_incidents (integer): Minimum incidents threshold
+    - bbox (string): 'minLon,minLat,maxLon,maxLat'; only count incidents inside this box
     """
     try:
         limit = request.args.get('limit', default=20, type=int)
         min_incidents = request.args.get('min_incidents', type=int)
+        bbox_param = request.args.get('bbox', type=str)
 
         # Validate limit
         if limit <= 0:
             return jsonify({"error": "Invalid limit parameter. Must be positive integer."}), 400
 
+        bbox = None
+        if bbox_param:
+            bbox = parse_bbox(bbox_param)
+            if bbox is None:
+                return jsonify({"error": "Invalid bbox, expected minLon,minLat,maxLon,maxLat"}), 400
+
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        # Build query with results database table
-        query = """
+        query = f"""
             SELECT
                 neighborhood,
                 COUNT(*) as incident_count,
                 COUNT(DISTINCT source_table) as data_sources,
                 COUNT(DISTINCT incident_type) as incident_types
-            FROM (
-                SELECT
-                    '311_service_requests' AS source_table,
-                    category AS incident_type,
-                    neighborhood
-                FROM "311_service_requests"
-                WHERE neighborhood IS NOT NULL AND neighborhood != ''
-
-                UNION ALL
-
-                SELECT
-                    'fire_incidents' AS source_table,
-                    "Primary Situation" AS incident_type,
-                    "Analysis Neighborhood" AS neighborhood
-                FROM fire_incidents
-                WHERE "Analysis Neighborhood" IS NOT NULL AND "Analysis Neighborhood" != ''
-
-                UNION ALL
-
-                SELECT
-                    'fire_safety_complaints' AS source_table,
-                    "Complaint Item Type Description" AS incident_type,
-                    "Neighborhood  District" AS neighborhood
-                FROM fire_safety_complaints
-                WHERE "Neighborhood  District" IS NOT NULL AND "Neighborhood  District" != ''
-
-                UNION ALL
-
-                SELECT
-                    'fire_violations' AS source_table,
-                    "violation item description" AS incident_type,
-                    "neighborhood district" AS neighborhood
-                FROM fire_violations
-                WHERE "neighborhood district" IS NOT NULL AND "neighborhood district" != ''
-
-                UNION ALL
-
-                SELECT
-                    'sffd_service_calls' AS source_table,
-                    call_type AS incident_type,
-                    supervisor_district AS neighborhood
-                FROM sffd_service_calls
-                WHERE supervisor_district IS NOT NULL AND supervisor_district != ''
-
-                UNION ALL
-
-                SELECT
-                    'sfpd_incidents' AS source_table,
-                    category AS incident_type,
-                    pddistrict AS neighborhood
-                FROM sfpd_incidents
-                WHERE pddistrict IS NOT NULL AND pddistrict != ''
-            )
-            GROUP BY neighborhood
+            FROM {INCIDENTS_TABLE}
+            WHERE neighborhood IS NOT NULL
         """
+        params = []
+        # Counts every incident in the box, so the R*Tree always pays off
+        if bbox is not None:
+            bbox_sql, bbox_values = bbox_filter(conn, bbox)
+            query += " AND " + bbox_sql
+            params.extend(bbox_values)
+        query += " GROUP BY neighborhood"
 
         # Add min_incidents filter if provided
         if min_incidents is not None:
@@ -375,7 +576,7 @@ def getTopNeighborhoods():
 
         query += f" ORDER BY incident_count DESC LIMIT {limit}"
 
-        cursor.execute(query)
+        cursor.execute(query, params)
         rows = cursor.fetchall()
 
         # Convert to list of dictionaries
@@ -443,85 +644,16 @@ def getDangerAnalysis():
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        # Build query with time parsing
-        query = """
-            WITH time_parsed AS (
-                SELECT
-                    neighborhood,
-                    incident_time,
-                    incident_type,
-                    CASE
-                        WHEN CAST(SUBSTR(incident_time, 12, 2) AS INTEGER) BETWEEN 6 AND 11 THEN 'Morning'
-                        WHEN CAST(SUBSTR(incident_time, 12, 2) AS INTEGER) BETWEEN 12 AND 17 THEN 'Afternoon'
-                        WHEN CAST(SUBSTR(incident_time, 12, 2) AS INTEGER) BETWEEN 18 AND 21 THEN 'Evening'
-                        ELSE 'Night'
-                    END AS time_period,
-                    CASE
-                        WHEN CAST(strftime('%w', incident_time) AS INTEGER) IN (0, 6) THEN 'Weekend'
-                        ELSE 'Weekday'
-                    END AS day_type
-                FROM (
-                    SELECT
-                        neighborhood,
-                        created_date AS incident_time,
-                        category AS incident_type
-                    FROM "311_service_requests"
-                    WHERE created_date IS NOT NULL AND neighborhood IS NOT NULL AND neighborhood != ''
-
-                    UNION ALL
-
-                    SELECT
-                        "Analysis Neighborhood" AS neighborhood,
-                        "Incident Date" AS incident_time,
-                        "Primary Situation" AS incident_type
-                    FROM fire_incidents
-                    WHERE "Incident Date" IS NOT NULL AND "Analysis Neighborhood" IS NOT NULL AND "Analysis Neighborhood" != ''
-
-                    UNION ALL
-
-                    SELECT
-                        "Neighborhood  District" AS neighborhood,
-                        "Received Date" AS incident_time,
-                        "Complaint Item Type Description" AS incident_type
-                    FROM fire_safety_complaints
-                    WHERE "Received Date" IS NOT NULL AND "Neighborhood  District" IS NOT NULL AND "Neighborhood  District" != ''
-
-                    UNION ALL
-
-                    SELECT
-                        "neighborhood district" AS neighborhood,
-                        "violation date" AS incident_time,
-                        "violation item description" AS incident_type
-                    FROM fire_violations
-                    WHERE "violation date" IS NOT NULL AND "neighborhood district" IS NOT NULL AND "neighborhood district" != ''
-
-                    UNION ALL
-
-                    SELECT
-                        supervisor_district AS neighborhood,
-                        call_date AS incident_time,
-                        call_type AS incident_type
-                    FROM sffd_service_calls
-                    WHERE call_date IS NOT NULL AND supervisor_district IS NOT NULL AND supervisor_district != ''
-
-                    UNION ALL
-
-                    SELECT
-                        pddistrict AS neighborhood,
-                        timestamp AS incident_time,
-                        category AS incident_type
-                    FROM sfpd_incidents
-                    WHERE timestamp IS NOT NULL AND pddistrict IS NOT NULL AND pddistrict != ''
-                )
-            )
+        # Every filter combination is answered from the pre-aggregated rollup cells
+        query = f"""
             SELECT
                 neighborhood,
                 time_period,
                 day_type,
-                COUNT(*) as incident_count,
-                COUNT(DISTINCT incident_type) as incident_types,
-                ROUND(COUNT(*) * 100.0 / SUM(COUNT(*)) OVER (PARTITION BY neighborhood), 2) as pct_of_neighborhood_incidents
-            FROM time_parsed
+                SUM(incident_count) as incident_count,
+                COUNT(DISTINCT NULLIF(incident_type, '')) as incident_types,
+                ROUND(SUM(incident_count) * 100.0 / SUM(SUM(incident_count)) OVER (PARTITION BY neighborhood), 2) as pct_of_neighborhood_incidents
+            FROM {ROLLUP_TABLE}
             WHERE 1=1
         """
 
@@ -593,6 +725,7 @@ def getDangerAnalysis():
 
 # Query 4: Incident Type Breakdown
 @app.route('/stats/incident_type_breakdown', methods=['GET'])
+@cached('sfpd_incidents', 'fire_incidents')
 def incident_type_breakdown():
     """
     Returns the total and percentage of incidents for each type (crime, fire).
@@ -655,6 +788,7 @@ def incident_type_breakdown():
 
 # Query 5: Monthly Incident Aggregation
 @app.route('/stats/monthly_incidents', methods=['GET'])
+@cached('sfpd_incidents', 'fire_incidents')
 def monthly_incidents():
     """
     Aggregates monthly counts of crime and fire incidents across years.
@@ -672,22 +806,22 @@ def monthly_incidents():
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        # Query to aggregate by month
+        # Query to aggregate by month, on the YYYYMM month derived at ingest
         query = """
             WITH crime AS (
                 SELECT
-                    strftime('%Y-%m', timestamp) AS month,
+                    incident_year_month AS month,
                     COUNT(DISTINCT unique_key) AS cnt
                 FROM sfpd_incidents
-                WHERE timestamp IS NOT NULL
+                WHERE incident_year_month IS NOT NULL
                 GROUP BY 1
             ),
             fire AS (
                 SELECT
-                    strftime('%Y-%m', "Incident Date") AS month,
+                    incident_year_month AS month,
                     COUNT(*) AS cnt
                 FROM fire_incidents
-                WHERE "Incident Date" IS NOT NULL
+                WHERE incident_year_month IS NOT NULL
                 GROUP BY 1
             ),
             months AS (
@@ -696,7 +830,7 @@ def monthly_incidents():
                 SELECT month FROM fire
             )
             SELECT
-                m.month,
+                printf('%04d-%02d', m.month / 100, m.month % 100) AS month,
                 COALESCE(c.cnt, 0) AS crime_cnt,
                 COALESCE(f.cnt, 0) AS fire_cnt,
                 COALESCE(c.cnt, 0) + COALESCE(f.cnt, 0) AS total_incidents
@@ -729,6 +863,7 @@ def monthly_incidents():
 
 ## Query 6: Top Crime Categories
 @app.route('/stats/top_crime_categories', methods=['GET'])
+@cached('sfpd_incidents')
 def top_crime_categories():
     '''
     Returns the top 10 most frequently reported crime categories from the SFPD incidents dataset as a single JSON object
@@ -762,6 +897,7 @@ def top_crime_categories():
         return jsonify({"error": str(e)}), 500
 ## Query 7: Top 10 Primary Fire Scenarios and Associated Primary Response Actions
 @app.route('/api/fire/primary_situation', methods=['GET'])
+@cached('fire_incidents')
 def primary_situation_common_action():
     '''
     This API gets a json array of {primary_situation: (string), 
@@ -806,6 +942,7 @@ def primary_situation_common_action():
 
 ## Query 8: generates a listing of inspections that are not completed, showing the most recent inspection start dates first.
 @app.route('/api/fire/incomplete_inspections', methods=['GET'])
+@cached('fire_inspections')
 def incomplete_inspections():
     '''
     This api returns the incomplete inspections as an json array
@@ -855,6 +992,7 @@ def incomplete_inspections():
 
 ## Query 9:  Top Fire Neighborhoods
 @app.route('/api/fire/top-neighborhoods', methods=['GET'])
+@cached('fire_incidents')
 def getTopFireNeighborhoods():
     '''
     Returns, for each of the latest M years (default: 3), 
@@ -895,7 +1033,7 @@ def getTopFireNeighborhoods():
     query = f"""
     WITH neighborhood_stats AS (
     SELECT
-    CAST(strftime('%Y', "Incident Date") AS INTEGER) AS year,
+    incident_year AS year,
     "Analysis Neighborhood" AS neighborhood,
     COUNT(*) AS total_fires,
     ROUND(COUNT(*) * 100.0 / (SELECT COUNT(*) FROM fire_incidents WHERE "Analysis Neighborhood" IS NOT NULL AND "Analysis Neighborhood" != ''), 2) AS percentage_of_total
@@ -954,6 +1092,7 @@ def getTopFireNeighborhoods():
 
 ## Query 10: SFFD Response Time by Call Type
 @app.route('/api/sffd/response-times', methods=['GET'])
+@cached('sffd_service_calls')
 def getResponseTimes():
     '''
     Returns the average, minimum, and maximum response time (in minutes) for each SFFD call type, 
@@ -1043,207 +1182,255 @@ def getResponseTimes():
         return jsonify({"error": str(e)}), 500
 
 
+## Prometheus metrics
+@app.route('/metrics', methods=['GET'])
+def getMetrics():
+    """
+    Returns request metrics in the Prometheus text format: per-route latency,
+    SQL/Python/serialization time, rows fetched and response size histograms,
+    plus the connection pool, response cache, write queue and geocoder counters.
+    """
+    return metrics.metrics_response()
+
+
+## Slow queries
+@app.route('/debug/slow-queries', methods=['GET'])
+def getSlowQueries():
+    """
+    Returns the most recent statements that took at least threshold_ms, newest first,
+    each with its SQL, parameters, route, duration_ms, rows, vm_steps and query plan
+    (full_scans and temp_b_trees list the plan steps worth an index).
+    Query Parameters:
+    - limit (integer): Max records (default: all kept)
+    """
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit <= 0:
+        return jsonify({"error": "Invalid limit parameter. Must be positive integer."}), 400
+
+    return jsonify({
+        "threshold_ms": slow_queries.settings['threshold_ms'],
+        "stats": slow_queries.log.stats(),
+        "data": slow_queries.log.records(limit)
+    })
+
+
+## Connection pool statistics
+@app.route('/debug/db-pool', methods=['GET'])
+def getDbPoolStats():
+    """
+    Returns counters for the SQLite connection pool:
+    opened, closed, checkouts, reused, in_use and idle connections.
+    """
+    return jsonify(db_pool.pool.stats())
+
+
+## Geocoding statistics
+@app.route('/debug/geocoding', methods=['GET'])
+def getGeocodingStats():
+    """
+    Returns geocode cache counters (hits, misses, stores) and, per database,
+    the background worker counters (geocoded, cached, errors, dropped).
+    """
+    return jsonify(geocoding.stats())
+
+
+## Write queue statistics
+@app.route('/debug/write-queue', methods=['GET'])
+def getWriteQueueStats():
+    """
+    Returns, per database, the group-commit writer counters:
+    submitted, committed, failed, batches, largest_batch and pending writes.
+    """
+    return jsonify(write_queue.stats())
+
+
+## Response cache statistics
+@app.route('/debug/response-cache', methods=['GET'])
+def getResponseCacheStats():
+    """
+    Returns counters for the Query 4-10 response cache:
+    hits, misses, expired, evictions, entries, cached bytes and table versions.
+    """
+    return jsonify(response_cache.cache.stats())
+
+
 ### INCIDENT REPORT PAGE API FOR CREATING INCIDENT INTO DATABASES
-## CREATE 311 SERVICE REQUEST
-@app.route('/api/311-requests', methods = ['POST'])
-def create_311_service_request():
+# Fields a record must have (non-empty) to be inserted, per table
+REQUIRED_FIELDS = {
+    '311_service_requests': ["category", "complaint_type", "descriptor", "incident_address", "neighborhood"],
+    'sfpd_incidents': ["category", "descript", "address"],
+    'fire_incidents': ["Address", "Incident Date", "Primary Situation", "Analysis Neighborhood"],
+}
+
+
+def missing_field(data, table):
+    """First required field of table that data lacks, or None"""
+    for field in REQUIRED_FIELDS[table]:
+        if field not in data or not data.get(field):
+            return field
+    return None
+
+
+def require_fields(data, table):
+    field = missing_field(data, table)
+    if field is not None:
+        raise ValueError(f"Missing required field '{field}'")
+
+
+def stored_row(cursor, table, rowid):
     """
-    columns in the "311_service_requests" table: ['unique_key', 'created_date', 'closed_date', 
-    'resolution_action_updated_date', 'status', 'status_notes', 'agency_name', 'category', 
-    'complaint_type', 'descriptor', 'incident_address', 'supervisor_district', 'neighborhood', 
-    'location', 'source', 'media_url', 'latitude', 'longitude', 'police_district']
+    A source row as stored, including the time features record_incident
+    derives after the INSERT (its RETURNING row has them as NULL).
+    """
+    return cursor.execute(f'SELECT * FROM "{table}" WHERE rowid = ?', (rowid,)).fetchone()
 
+
+def submit_write(work):
+    """
+    Run work(cursor) as one write to the API database and return its result
+    once committed: through the group-commit writer (see write_queue.py), or
+    on the request's pooled connection when the write queue is disabled.
     """
+    if write_queue.settings['enabled']:
+        future = write_queue.writer_for(DB_PATH).submit(work)
+        return future.result(timeout=write_queue.settings['timeout'])
+
     conn = get_db_connection()
     cursor = conn.cursor()
+    try:
+        result = work(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return result
+
+
+def insert_311_request(cursor, data):
+    """
+    Insert one 311 service request, queueing it for geocoding when its
+    coordinates are neither given nor known locally. The caller commits and
+    maintains the incidents table.
+
+    Returns:
+        (rowid, inserted row, geocode_pending)
+    """
+    require_fields(data, '311_service_requests')
+    conn = cursor.connection
 
     ## auto-generated values to enter
     created_timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S+00:00')
     status = "Open"
     source = 'Web'
-    ## generating unique key
-    cursor.execute('''SELECT DISTINCT unique_key FROM "311_service_requests" ''')
-    existing_keys = [row[0] for row in cursor.fetchall()]
-    existing_keys_set = set(existing_keys)
-    def generate_unique_key():
-        k = 0
-        default_length_of_digits = 10
-        while k < 10:
-            new_key = ''.join(random.choices(string.digits, k=default_length_of_digits))
-            
-            # Check if it doesn't exist
-            if new_key not in existing_keys_set:
-                return new_key
-            k +=1
-    unique_key = generate_unique_key()
-
-    ## get data
-    data = request.get_json()
-    required_fields = ["category", "complaint_type", "descriptor", "incident_address", "neighborhood"]
-    for field in required_fields:
-        if field not in data or not data.get(field):
-            return jsonify({"error": f"Missing required field '{field}'"}), 400
-    try:
-        latitude = parse_float(data.get("latitude"))
-        longitude = parse_float(data.get("longitude"))
 
-        if latitude is None or longitude is None:
-            zip_code = data.get("zip_code")
-            geocoded_lat, geocoded_lon = geocode_address(data.get("incident_address"), zip_code)
+    latitude = parse_float(data.get("latitude"))
+    longitude = parse_float(data.get("longitude"))
+
+    # Missing coordinates come from the geocode cache or the gazetteer,
+    # or are filled in later by the worker
+    geocode_pending = False
+    if latitude is None or longitude is None:
+        cached_coordinates = geocoding.cache.lookup(conn, data.get("incident_address"), data.get("zip_code"))
+        if cached_coordinates is None:
+            cached_coordinates = gazetteer.lookup(conn, data.get("incident_address"))
+        if cached_coordinates is None:
+            geocode_pending = True
+        else:
             if latitude is None:
-                latitude = geocoded_lat
+                latitude = cached_coordinates[0]
             if longitude is None:
-                longitude = geocoded_lon
+                longitude = cached_coordinates[1]
 
-        query = """
-        INSERT INTO "311_service_requests" (
-            unique_key, created_date, closed_date,
-            resolution_action_updated_date, status, status_notes,
-            agency_name, category, complaint_type, descriptor,
-            incident_address, supervisor_district, neighborhood,
-            location, source, media_url, latitude, longitude, police_district
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 
-                ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        RETURNING *;
-        """
-        values = (
-            unique_key,                   # unique_key
-            created_timestamp,            # created_date
-            None,                         # closed_date
-            None,                         # resolution_action_updated_date
-            status,                       # status
-            None,                         # status_notes
-            None,                         # agency_name
-            data.get('category'),
-            data.get('complaint_type'),
-            data.get('descriptor'),
-            data.get('incident_address'),
-            None,                         # supervisor_district
-            data.get('neighborhood'),
-            None,                         # location
-            source,
-            None,                         # media_url
-            latitude,
-            longitude,
-            None                          # police_district
-        )
-        cursor.execute(query, values)
-        result = cursor.fetchone()
-        conn.commit()
-        cursor.close()
-        return jsonify({
-            'success': True,
-            'message': '311 service request created successfully',
-            'data': dict(result)
-        }), 201
-    except Exception as e:
-        conn.rollback()
-        return jsonify({"error": str(e)}), 500
-
-## add sfpd incident
-@app.route('/api/sfpd_incidents', methods = ['POST'])
-def create_sfpd_incident():
+    query = """
+    INSERT INTO "311_service_requests" (
+        unique_key, created_date, closed_date,
+        resolution_action_updated_date, status, status_notes,
+        agency_name, category, complaint_type, descriptor,
+        incident_address, supervisor_district, neighborhood,
+        location, source, media_url, latitude, longitude, police_district
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 
+            ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    RETURNING *;
     """
-    columns in the "sfpd_incidents" table: 
-    ['unique_key', 'category', 'descript', 'dayofweek', 
-    'pddistrict', 'resolution', 'address', 'longitude', 
-    'latitude', 'location', 'pdid', 'timestamp']
+    # unique_key is allocated by insert_with_key
+    values = (
+        created_timestamp,            # created_date
+        None,                         # closed_date
+        None,                         # resolution_action_updated_date
+        status,                       # status
+        None,                         # status_notes
+        None,                         # agency_name
+        data.get('category'),
+        data.get('complaint_type'),
+        data.get('descriptor'),
+        data.get('incident_address'),
+        None,                         # supervisor_district
+        data.get('neighborhood'),
+        None,                         # location
+        source,
+        None,                         # media_url
+        latitude,
+        longitude,
+        None                          # police_district
+    )
+    result = insert_with_key(cursor, '311_service_requests', query, values)
+    source_rowid = cursor.lastrowid
+    if geocode_pending:
+        geocoding.enqueue(cursor, '311_service_requests', source_rowid,
+                          data.get("incident_address"), data.get("zip_code"))
+    return source_rowid, result, geocode_pending
+
 
+def insert_sfpd_incident(cursor, data):
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    Insert one SFPD incident. The caller commits and maintains the incidents table.
 
+    Returns:
+        (rowid, inserted row)
+    """
+    require_fields(data, 'sfpd_incidents')
 
     ## auto-generated values to enter
     created_timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S+00:00')
-    status = "Open"
-    source = 'Web'
-    ## generating unique key
-    cursor.execute('''SELECT DISTINCT unique_key FROM sfpd_incidents ''')
-    existing_keys = [row[0] for row in cursor.fetchall()]
-    existing_keys_set = set(existing_keys)
-    def generate_unique_key():
-        k = 0
-        default_length_of_digits = 10
-        while k < 10:
-            new_key = ''.join(random.choices(string.digits, k=default_length_of_digits))
-            
-            # Check if it doesn't exist
-            if new_key not in existing_keys_set:
-                return new_key
-            k +=1
-    unique_key = generate_unique_key()
-
-    ## get data
-    data = request.get_json()
-    required_fields = ["category", "descript", "address"]
-    for field in required_fields:
-        if field not in data or not data.get(field):
-            return jsonify({"error": f"Missing required field '{field}'"}), 400
-    try:
-        query = """
-            INSERT INTO sfpd_incidents (
-                unique_key, category, descript, dayofweek, pddistrict,
-                resolution, address, longitude, latitude, location, pdid, timestamp
-            )
-            VALUES (?,?,?,?,?,?,?,?,?,?,?,?)
-            RETURNING *;
-        """
 
-        values = (
-            unique_key,
-            data.get("category"),
-            data.get("descript"),
-            data.get("dayofweek"),
-            data.get("pddistrict"),
-            data.get("resolution"),
-            data.get("address"),
-            data.get("longitude"),
-            data.get("latitude"),
-            data.get("location"),
-            data.get("pdid"),
-            data.get("timestamp") or created_timestamp
+    query = """
+        INSERT INTO sfpd_incidents (
+            unique_key, category, descript, dayofweek, pddistrict,
+            resolution, address, longitude, latitude, location, pdid, timestamp
         )
-        cursor.execute(query, values)
-        result = cursor.fetchone()
-        conn.commit()
-        cursor.close()
-        return jsonify({
-            'success': True,
-            'message': 'SFPD incident created successfully',
-            'data': dict(result)
-        }), 201
-    except Exception as e:
-        conn.rollback()
-        return jsonify({"error": str(e)}), 500
+        VALUES (?,?,?,?,?,?,?,?,?,?,?,?)
+        RETURNING *;
+    """
 
-@app.route('/api/fire-incidents', methods=['POST'])
-def create_fire_incident():
-    data = request.get_json()
+    # unique_key is allocated by insert_with_key
+    values = (
+        data.get("category"),
+        data.get("descript"),
+        data.get("dayofweek"),
+        data.get("pddistrict"),
+        data.get("resolution"),
+        data.get("address"),
+        data.get("longitude"),
+        data.get("latitude"),
+        data.get("location"),
+        data.get("pdid"),
+        data.get("timestamp") or created_timestamp
+    )
+    result = insert_with_key(cursor, 'sfpd_incidents', query, values)
+    return cursor.lastrowid, result
 
-    required_fields = ["Address", "Incident Date", "Primary Situation", "Analysis Neighborhood"]
-    for field in required_fields:
-        if field not in data or not data.get(field):
-            return jsonify({"error": f"Missing required field '{field}'"}), 400
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    ## generating unique incident number
-    cursor.execute('''SELECT DISTINCT "Incident Number" FROM fire_incidents ''')
-    existing_keys = [row[0] for row in cursor.fetchall()]
-    existing_keys_set = set(existing_keys)
-    def generate_unique_key():
-        k = 0
-        default_length_of_digits = 10
-        while k < 10:
-            new_key = ''.join(random.choices(string.digits, k=default_length_of_digits))
-            
-            # Check if it doesn't exist
-            if new_key not in existing_keys_set:
-                return new_key
-            k +=1
-    incident_number = generate_unique_key()
+def insert_fire_incident(cursor, data):
+    """
+    Insert one fire incident. The caller commits and maintains the incidents table.
+
+    Returns:
+        (rowid, inserted row)
+    """
+    require_fields(data, 'fire_incidents')
 
     query = """
         INSERT INTO fire_incidents (
@@ -1254,14 +1441,19 @@ def create_fire_incident():
             "Fire Fatalities", "Fire Injuries", "Civilian Fatalities",
             "Civilian Injuries", "Number of Alarms", "Primary Situation",
             "Mutual Aid", "Action Taken Primary", "Action Taken Secondary",
-            "Property Use", "Supervisor District", "Analysis Neighborhood"
+            "Property Use", "Supervisor District", "Analysis Neighborhood",
+            "Latitude", "Longitude"
         ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,
-                  ?,?,?,?,?,?,?,?,?,?)
+                  ?,?,?,?,?,?,?,?,?,?,?,?)
         RETURNING *;
     """
 
+    # Fire incidents only carry an address and ZIP code: store the block
+    # centroid when the gazetteer knows the block, else the ZIP centroid
+    latitude, longitude = gazetteer.lookup(cursor.connection, data.get("Address")) or zip_coordinates(data.get("ZIP Code"))
+
+    # "Incident Number" is allocated by insert_with_key
     values = (
-        incident_number,
         data.get("Exposure Number"),
         data.get("ID"),
         data.get("Address"),
@@ -1289,50 +1481,176 @@ def create_fire_incident():
         data.get("Action Taken Secondary"),
         data.get("Property Use"),
         data.get("Supervisor District"),
-        data.get("Analysis Neighborhood")
+        data.get("Analysis Neighborhood"),
+        latitude,
+        longitude
     )
+    result = insert_with_key(cursor, 'fire_incidents', query, values)
+    return cursor.lastrowid, result
+
+
+## CREATE 311 SERVICE REQUEST
+@app.route('/api/311-requests', methods = ['POST'])
+def create_311_service_request():
+    """
+    columns in the "311_service_requests" table: ['unique_key', 'created_date', 'closed_date', 
+    'resolution_action_updated_date', 'status', 'status_notes', 'agency_name', 'category', 
+    'complaint_type', 'descriptor', 'incident_address', 'supervisor_district', 'neighborhood', 
+    'location', 'source', 'media_url', 'latitude', 'longitude', 'police_district']
+
+    """
+    ## get data
+    data = request.get_json()
+    field = missing_field(data, '311_service_requests')
+    if field is not None:
+        return jsonify({"error": f"Missing required field '{field}'"}), 400
+
+    def write(cursor):
+        source_rowid, result, geocode_pending = insert_311_request(cursor, data)
+        record_incident(cursor, '311_service_requests', source_rowid)
+        return dict(stored_row(cursor, '311_service_requests', source_rowid)), geocode_pending
 
     try:
-        cursor.execute(query, values)
-        result = cursor.fetchone()
-        conn.commit()
-        cursor.close()
-        return jsonify({"success": True, 
-                    "message": "Fire Incident created successfully",
-                 "data": dict(result)}), 201
+        result, geocode_pending = submit_write(write)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    invalidate('311_service_requests')
+    if geocode_pending:
+        geocoding.notify_database(DB_PATH)
+    return jsonify({
+        'success': True,
+        'message': '311 service request created successfully',
+        'data': result,
+        'geocode_pending': geocode_pending
+    }), 201
 
+## add sfpd incident
+@app.route('/api/sfpd_incidents', methods = ['POST'])
+def create_sfpd_incident():
+    """
+    columns in the "sfpd_incidents" table: 
+    ['unique_key', 'category', 'descript', 'dayofweek', 
+    'pddistrict', 'resolution', 'address', 'longitude', 
+    'latitude', 'location', 'pdid', 'timestamp']
+
+    """
+    ## get data
+    data = request.get_json()
+    field = missing_field(data, 'sfpd_incidents')
+    if field is not None:
+        return jsonify({"error": f"Missing required field '{field}'"}), 400
+
+    def write(cursor):
+        source_rowid, result = insert_sfpd_incident(cursor, data)
+        record_incident(cursor, 'sfpd_incidents', source_rowid)
+        return dict(stored_row(cursor, 'sfpd_incidents', source_rowid))
+
+    try:
+        result = submit_write(write)
     except Exception as e:
-        conn.rollback()
         return jsonify({"error": str(e)}), 500
 
-   # San Francisco ZIP code to approximate latitude/longitude mapping
-SF_ZIP_COORDINATES = {
-    '94102': (37.7799, -122.4193),  # Civic Center
-    '94103': (37.7728, -122.4099),  # SOMA
-    '94104': (37.7914, -122.4016),  # Financial District
-    '94105': (37.7883, -122.3902),  # Rincon Hill
-    '94107': (37.7641, -122.3936),  # Potrero Hill
-    '94108': (37.7923, -122.4079),  # Chinatown
-    '94109': (37.7926, -122.4208),  # Nob Hill
-    '94110': (37.7487, -122.4160),  # Mission
-    '94111': (37.7984, -122.4040),  # Financial District North
-    '94112': (37.7202, -122.4428),  # Outer Mission
-    '94114': (37.7579, -122.4360),  # Castro
-    '94115': (37.7866, -122.4362),  # Western Addition
-    '94116': (37.7439, -122.4862),  # Outer Sunset
-    '94117': (37.7703, -122.4414),  # Haight-Ashbury
-    '94118': (37.7820, -122.4630),  # Richmond
-    '94121': (37.7768, -122.4979),  # Outer Richmond
-    '94122': (37.7586, -122.4856),  # Sunset
-    '94123': (37.8000, -122.4379),  # Marina
-    '94124': (37.7300, -122.3926),  # Bayview
-    '94127': (37.7367, -122.4564),  # West Portal
-    '94131': (37.7447, -122.4382),  # Glen Park
-    '94132': (37.7232, -122.4748),  # Lake Merced
-    '94133': (37.8023, -122.4101),  # North Beach
-    '94134': (37.7196, -122.4145),  # Visitacion Valley
-    '94158': (37.7714, -122.3892),  # Mission Bay
-}
- 
+    invalidate('sfpd_incidents')
+    return jsonify({
+        'success': True,
+        'message': 'SFPD incident created successfully',
+        'data': result
+    }), 201
+
+@app.route('/api/fire-incidents', methods=['POST'])
+def create_fire_incident():
+    data = request.get_json()
+
+    field = missing_field(data, 'fire_incidents')
+    if field is not None:
+        return jsonify({"error": f"Missing required field '{field}'"}), 400
+
+    def write(cursor):
+        source_rowid, result = insert_fire_incident(cursor, data)
+        record_incident(cursor, 'fire_incidents', source_rowid)
+        return dict(stored_row(cursor, 'fire_incidents', source_rowid))
+
+    try:
+        result = submit_write(write)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    invalidate('fire_incidents')
+    return jsonify({"success": True, 
+                "message": "Fire Incident created successfully",
+             "data": result}), 201
+
+
+### BULK INGEST: one JSON record per line (NDJSON), committed in chunks
+BULK_READ_BUFFER = 64 * 1024
+
+
+def bulk_ingest_response(source_table, insert_row, after_commit=None):
+    """
+    Stream the NDJSON request body into source_table (see bulk_ingest.py).
+
+    Query Parameters:
+        chunk_size: Records per transaction (default 500, max 5000)
+    """
+    chunk_size = request.args.get('chunk_size', DEFAULT_CHUNK_SIZE, type=int)
+    if not 1 <= chunk_size <= MAX_CHUNK_SIZE:
+        return jsonify({"error": f"chunk_size must be between 1 and {MAX_CHUNK_SIZE}"}), 400
+
+    try:
+        # request.stream reads lines a byte at a time; buffer it
+        stream = io.BufferedReader(request.stream, BULK_READ_BUFFER)
+        # Each chunk is one write through the group-commit writer, not a
+        # transaction on the request's pooled connection
+        summary = ingest_ndjson(submit_write, stream, source_table, insert_row,
+                                chunk_size=chunk_size, after_commit=after_commit)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    if summary['received'] == 0:
+        return jsonify({"error": "Request body has no NDJSON records"}), 400
+    return jsonify({'success': summary['failed'] == 0, **summary}), 200
+
+
+@app.route('/api/311-requests/bulk', methods=['POST'])
+def bulk_create_311_service_requests():
+    """
+    Creates 311 service requests from an NDJSON body, one request per line
+    with the fields of POST /api/311-requests. Returns per-line results with
+    the new unique_key and whether the row awaits geocoding.
+    """
+    def insert_row(cursor, data):
+        source_rowid, result, geocode_pending = insert_311_request(cursor, data)
+        return source_rowid, {'unique_key': result['unique_key'], 'geocode_pending': geocode_pending}
+
+    return bulk_ingest_response('311_service_requests', insert_row,
+                                after_commit=lambda: geocoding.notify_database(DB_PATH))
+
+
+@app.route('/api/sfpd_incidents/bulk', methods=['POST'])
+def bulk_create_sfpd_incidents():
+    """
+    Creates SFPD incidents from an NDJSON body, one incident per line with the
+    fields of POST /api/sfpd_incidents. Returns per-line results with the new unique_key.
+    """
+    def insert_row(cursor, data):
+        source_rowid, result = insert_sfpd_incident(cursor, data)
+        return source_rowid, {'unique_key': result['unique_key']}
+
+    return bulk_ingest_response('sfpd_incidents', insert_row)
+
+
+@app.route('/api/fire-incidents/bulk', methods=['POST'])
+def bulk_create_fire_incidents():
+    """
+    Creates fire incidents from an NDJSON body, one incident per line with the
+    fields of POST /api/fire-incidents. Returns per-line results with the new Incident Number.
+    """
+    def insert_row(cursor, data):
+        source_rowid, result = insert_fire_incident(cursor, data)
+        return source_rowid, {'Incident Number': result['Incident Number']}
+
+    return bulk_ingest_response('fire_incidents', insert_row)
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
@@ -0,0 +1,137 @@
+"""
+In-process cache for the aggregate endpoints (Query 4-10).
+
+Those endpoints recompute the same GROUP BYs on every page load while their
+source tables change a few times a day. Responses are cached as the JSON
+bytes that were sent, keyed on the path, the sorted query arguments and the
+data version of every table the endpoint reads. The POST handlers bump the
+version of the table they write, so later requests miss and recompute;
+entries keyed on old versions simply age out of the LRU. The TTL bounds how
+stale a response can get when the database changes outside this process
+(another worker, or preprocessing.py --incremental).
+
+Cached responses carry an ETag, and a matching If-None-Match is answered
+with 304 Not Modified.
+"""
+
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, make_response, request
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL = 600  # seconds
+
+
+class ResponseCache:
+    """
+    LRU of serialized responses with a per-entry expiry, plus the data
+    version of each table.
+
+    Args:
+        max_entries: Entries kept before the least recently used is evicted
+        ttl: Seconds an entry stays valid
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0}
+
+    def versions(self, tables):
+        """Current data version of each table"""
+        with self._lock:
+            return tuple(self._versions.get(table, 0) for table in tables)
+
+    def bump(self, *tables):
+        """Mark tables as changed, invalidating every response that read them"""
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+    def get(self, key):
+        """(body, etag) for key, or None if missing or expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            body, etag, expires = entry
+            if expires <= now:
+                del self._entries[key]
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return body, etag
+
+    def set(self, key, body, ttl=None):
+        """Store a serialized body and return its ETag"""
+        etag = hashlib.sha1(body).hexdigest()
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (body, etag, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        return etag
+
+    def clear(self):
+        """Drop every entry and reset the table versions and counters"""
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self._stats = dict.fromkeys(self._stats, 0)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = sum(len(entry[0]) for entry in self._entries.values())
+            stats['versions'] = dict(self._versions)
+        return stats
+
+
+cache = ResponseCache()
+
+
+def cached(*tables, ttl=None):
+    """
+    Cache a GET view's 200 JSON responses until one of tables changes or
+    the TTL runs out. Error responses are never cached.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = (request.path, tuple(sorted(request.args.items(multi=True))), cache.versions(tables))
+            entry = cache.get(key)
+            status = 'HIT'
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or not response.is_json:
+                    return response
+                body = response.get_data()
+                entry = body, cache.set(key, body, ttl)
+                status = 'MISS'
+
+            body, etag = entry
+            response = current_app.response_class(body, mimetype='application/json')
+            response.set_etag(etag)
+            response.headers['X-Cache'] = status
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+
+def invalidate(*tables):
+    """Bump the data version of tables after a write"""
+    cache.bump(*tables)
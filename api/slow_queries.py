@@ -0,0 +1,243 @@
+"""
+Slow-query log with the query plan of every slow statement.
+
+Several endpoints build their SQL with f-strings (LIMIT, ORDER BY, HAVING),
+so the statement text varies per request and a slow statement can't be
+found by grepping for it. TimedCursor (metrics.py) times every statement on
+a pooled connection from execute to its last fetch; once one has taken
+longer than threshold_ms, it is recorded with its parameters, the route it
+ran for, the rows it returned, the virtual machine steps SQLite spent on it
+(counted by a progress handler every step_interval steps, so a proxy for the
+rows it scanned), and its EXPLAIN QUERY PLAN, with the full scans and
+temporary B-trees in the plan listed separately.
+
+The most recent records are served by /debug/slow-queries, and every record
+is appended as a JSON line to a rotating log file once its statement is
+done.
+"""
+
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+from flask import has_request_context, request
+
+DEFAULT_LOG_PATH = os.path.join(os.path.dirname(__file__), 'logs', 'slow_queries.log')
+
+# enabled: time statements and record the slow ones
+# threshold_ms: statements taking at least this long are recorded
+# max_records: records kept for /debug/slow-queries
+# log_path: rotating JSON-lines file the records are appended to (None: no file)
+# max_bytes, backup_count: size of a log file before it is rotated, and rotated files kept
+# step_interval: VM steps between progress handler calls on connections opened afterwards
+settings = {
+    'enabled': True,
+    'threshold_ms': 100,
+    'max_records': 200,
+    'log_path': DEFAULT_LOG_PATH,
+    'max_bytes': 10 * 1024 * 1024,
+    'backup_count': 3,
+    'step_interval': 1000,
+}
+
+
+def configure(**options):
+    """Update settings, e.g. configure(threshold_ms=50, log_path=None)"""
+    unknown = set(options) - set(settings)
+    if unknown:
+        raise ValueError(f"Unknown slow query settings: {', '.join(sorted(unknown))}")
+    settings.update(options)
+
+
+def track_vm_steps(conn):
+    """Count the VM steps conn executes, in conn.vm_steps (rounded to step_interval)"""
+    interval = settings['step_interval']
+    conn.vm_steps = 0
+
+    def progress():
+        conn.vm_steps += interval
+        return 0
+
+    conn.set_progress_handler(progress, interval)
+
+
+def explain(conn, sql, parameters=()):
+    """EXPLAIN QUERY PLAN of a statement, one line per step indented by depth"""
+    # A plain cursor, so the EXPLAIN isn't timed itself
+    cursor = conn.cursor(sqlite3.Cursor)
+    try:
+        rows = cursor.execute(f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()
+    finally:
+        cursor.close()
+    depths = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depths[node_id] = depths.get(parent, -1) + 1
+        lines.append('  ' * depths[node_id] + detail)
+    return lines
+
+
+def plan_problems(plan):
+    """
+    Steps of a query plan that read more than they need to.
+
+    Returns:
+        dict with full_scans (SCAN steps over a table or index) and
+        temp_b_trees (sorts and groupings that need a temporary B-tree)
+    """
+    steps = [line.strip() for line in plan]
+    return {
+        'full_scans': [
+            step for step in steps
+            if step.startswith('SCAN ') and not step.startswith(('SCAN CONSTANT ROW', 'SCAN (subquery'))
+        ],
+        'temp_b_trees': [step for step in steps if 'TEMP B-TREE' in step],
+    }
+
+
+def _json_value(value):
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return repr(value)
+
+
+def _parameters(parameters):
+    if isinstance(parameters, dict):
+        return {key: _json_value(value) for key, value in parameters.items()}
+    return [_json_value(value) for value in parameters]
+
+
+class SlowQueryLog:
+    """Most recent slow-query records, and the rotating file they are written to"""
+
+    def __init__(self):
+        self._records = deque()
+        self._lock = threading.Lock()
+        self._stats = {'statements': 0, 'recorded': 0}
+        self._logger = logging.getLogger('slow_queries')
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        self._log_path = None
+
+    def count(self):
+        with self._lock:
+            self._stats['statements'] += 1
+
+    def add(self, record):
+        with self._lock:
+            self._stats['recorded'] += 1
+            self._records.append(record)
+            while len(self._records) > settings['max_records']:
+                self._records.popleft()
+
+    def write(self, record):
+        """Append a finished record to the log file"""
+        path = settings['log_path']
+        if path is None:
+            return
+        with self._lock:
+            if path != self._log_path:
+                for handler in list(self._logger.handlers):
+                    self._logger.removeHandler(handler)
+                    handler.close()
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                self._logger.addHandler(RotatingFileHandler(
+                    path, maxBytes=settings['max_bytes'], backupCount=settings['backup_count']
+                ))
+                self._log_path = path
+            line = json.dumps(record)
+        self._logger.info(line)
+
+    def records(self, limit=None):
+        """Records, most recent first"""
+        with self._lock:
+            records = [dict(record) for record in reversed(self._records)]
+        return records[:limit]
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._stats = dict.fromkeys(self._stats, 0)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['kept'] = len(self._records)
+        return stats
+
+
+log = SlowQueryLog()
+
+
+class Statement:
+    """
+    Time, rows and VM steps of one executed statement, accumulated over its
+    execute and fetch calls until it is done.
+    """
+
+    __slots__ = ('conn', 'sql', 'parameters', 'seconds', 'rows', 'vm_steps', 'record')
+
+    def __init__(self, conn, sql, parameters):
+        self.conn = conn
+        self.sql = sql
+        self.parameters = parameters
+        self.seconds = 0.0
+        self.rows = 0
+        self.vm_steps = 0
+        self.record = None
+
+    def add(self, seconds, vm_steps=0):
+        self.seconds += seconds
+        self.vm_steps += vm_steps
+        if self.record is None:
+            if self.seconds * 1000 >= settings['threshold_ms']:
+                self.record = self._capture()
+                log.add(self.record)
+        else:
+            self._update(self.record)
+
+    def _update(self, record):
+        record['duration_ms'] = round(self.seconds * 1000, 3)
+        record['rows'] = self.rows
+        record['vm_steps'] = self.vm_steps
+
+    def _capture(self):
+        """Record the statement; runs while the connection is still held by the caller"""
+        record = {
+            'time': datetime.datetime.now().isoformat(timespec='milliseconds'),
+            'route': None,
+            'request': None,
+            'sql': ' '.join(self.sql.split()),
+            'parameters': None if self.parameters is None else _parameters(self.parameters),
+        }
+        if has_request_context():
+            rule = request.url_rule
+            record['route'] = rule.rule if rule is not None else None
+            record['request'] = f'{request.method} {request.full_path.rstrip("?")}'
+        self._update(record)
+        try:
+            record['plan'] = explain(self.conn, self.sql, self.parameters or ())
+        except Exception as e:
+            # e.g. a statement that EXPLAIN can't prepare, or executemany parameters
+            record['plan'] = []
+            record['plan_error'] = str(e)
+        record.update(plan_problems(record['plan']))
+        return record
+
+    def end(self):
+        if self.record is not None:
+            self._update(self.record)
+            log.write(self.record)
+
+
+def start(conn, sql, parameters):
+    """Statement to time for a statement about to execute, or None when the log is disabled"""
+    if not settings['enabled']:
+        return None
+    log.count()
+    return Statement(conn, sql, parameters)
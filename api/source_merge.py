@@ -0,0 +1,62 @@
+"""
+K-way merge of per-source queries over the incidents table.
+
+A filter on several sources (source_table IN (...)) can't be answered in
+index order: SQLite reads every matching row from idx_incidents_source_time
+and sorts them before returning the first. Running the query once per
+source instead keeps each branch in index order with the LIMIT pushed into
+it, so a branch reads at most limit index entries, and heapq.merge
+interleaves the branches as rows are fetched.
+"""
+
+import heapq
+import itertools
+
+
+class MergedCursor:
+    """
+    Read-only cursor over several executed cursors whose rows are each
+    ordered by sort_key descending, yielding at most limit rows in that order.
+    Supports what the timeline's response paths use: description,
+    fetchmany, fetchall and close.
+    """
+
+    def __init__(self, cursors, sort_key, limit=None):
+        self._cursors = cursors
+        self.description = cursors[0].description
+        merged = heapq.merge(
+            *cursors, key=lambda row: tuple(row[column] for column in sort_key), reverse=True
+        )
+        self._rows = itertools.islice(merged, limit)
+
+    def fetchmany(self, size=1):
+        return list(itertools.islice(self._rows, size))
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def close(self):
+        for cursor in self._cursors:
+            cursor.close()
+
+
+def execute_per_source(conn, query, params, sources, sort_key, limit=None):
+    """
+    Execute a query once per source and merge the results.
+
+    Args:
+        conn: Database connection
+        query: SELECT whose first placeholder is a `source_table = ?` filter,
+            ordered by sort_key descending (and limited to limit rows)
+        params: Parameters of the other placeholders
+        sources: Source tables, one branch each
+        sort_key: Columns the branches are ordered by, all descending
+        limit: Max rows of the merged result
+
+    Returns:
+        The cursor of the only branch, or a MergedCursor over several
+    """
+    if len(sources) == 1:
+        return conn.execute(query, [sources[0], *params])
+    cursors = [conn.execute(query, [source, *params]) for source in sources]
+    return MergedCursor(cursors, sort_key, limit)
@@ -0,0 +1,98 @@
+"""
+Streamed JSON and NDJSON responses over a database cursor.
+
+Rows are read with fetchmany(batch_size) and serialized one batch at a time,
+so a response holds at most one batch in memory and its first bytes go out
+as soon as the first batch is read. Summary fields that depend on every row
+(counts, next page cursor) are computed while streaming and written last:
+after the "data" array of a JSON object, or as a final {"summary": ...}
+line of an NDJSON stream.
+"""
+
+import json
+import time
+
+from flask import Response, stream_with_context
+
+from metrics import add_serialize_time
+
+STREAM_BATCH_SIZE = 500
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'))
+
+
+def iter_batches(cursor, batch_size=STREAM_BATCH_SIZE):
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def _json_chunks(cursor, to_record, summary, batch_size):
+    yield '{"data":['
+    first = True
+    error = None
+    try:
+        for rows in iter_batches(cursor, batch_size):
+            records = [to_record(row) for row in rows]
+            start = time.perf_counter()
+            chunk = ','.join(_dumps(record) for record in records)
+            add_serialize_time(time.perf_counter() - start)
+            yield chunk if first else ',' + chunk
+            first = False
+    except Exception as e:
+        # The status line is already sent; report the error in the body
+        error = str(e)
+    fields = summary()
+    if error is not None:
+        fields['error'] = error
+    tail = ''.join(f',{_dumps(key)}:{_dumps(value)}' for key, value in fields.items())
+    yield ']' + tail + '}'
+
+
+def _ndjson_chunks(cursor, to_record, summary, batch_size):
+    try:
+        for rows in iter_batches(cursor, batch_size):
+            records = [to_record(row) for row in rows]
+            start = time.perf_counter()
+            chunk = ''.join(_dumps(record) + '\n' for record in records)
+            add_serialize_time(time.perf_counter() - start)
+            yield chunk
+    except Exception as e:
+        yield _dumps({'error': str(e)}) + '\n'
+        return
+    yield _dumps({'summary': summary()}) + '\n'
+
+
+def stream_rows(conn, cursor, to_record, summary, fmt='json', batch_size=None):
+    """
+    Streamed response of the rows of an executed cursor.
+
+    Args:
+        conn: Connection of the cursor, closed once the stream ends
+        cursor: Cursor with an executed SELECT
+        to_record: Callable row -> JSON-serializable record; may also tally summary values
+        summary: Callable () -> dict of fields written after the last row
+        fmt: 'json' for {"data": [...], **summary} or 'ndjson' for one record per line
+        batch_size: Rows fetched and serialized at a time (default STREAM_BATCH_SIZE)
+
+    Returns:
+        Flask Response
+    """
+    chunks = _ndjson_chunks if fmt == 'ndjson' else _json_chunks
+    batch_size = batch_size or STREAM_BATCH_SIZE
+
+    def generate():
+        try:
+            yield from chunks(cursor, to_record, summary, batch_size)
+        finally:
+            cursor.close()
+            conn.close()
+
+    mimetype = NDJSON_MIMETYPE if fmt == 'ndjson' else 'application/json'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
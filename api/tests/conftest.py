@@ -9,6 +9,11 @@ from unittest.mock import Mock, patch
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import queries
+import response_cache
+import geocoding
+import write_queue
+import slow_queries
+from incidents import build_incidents_table
 
 
 @pytest.fixture
@@ -18,6 +23,35 @@ def app():
     return queries.app
 
 
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    """Start every test with an empty response cache"""
+    response_cache.cache.clear()
+    yield
+    response_cache.cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def no_background_geocoding():
+    """Keep geocode worker threads out of tests; tests drain the job queue themselves"""
+    with patch.dict(geocoding.settings, {'autostart': False}):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def no_slow_query_file():
+    """Keep slow statements of tests out of the slow-query log file"""
+    with patch.dict(slow_queries.settings, {'log_path': None}):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def stop_write_queues():
+    """Stop writer threads started by a test, so each test database gets a fresh writer"""
+    yield
+    write_queue.stop_all(timeout=5)
+
+
 @pytest.fixture
 def client(app):
     """Create a test client for the Flask app"""
@@ -96,7 +130,9 @@ def test_db():
             "Action Taken Secondary" TEXT,
             "Property Use" TEXT,
             "Supervisor District" TEXT,
-            "Analysis Neighborhood" TEXT
+            "Analysis Neighborhood" TEXT,
+            "Latitude" REAL,
+            "Longitude" REAL
         )
     ''')
 
@@ -107,7 +143,9 @@ def test_db():
             Disposition TEXT,
             Address TEXT,
             "Neighborhood  District" TEXT,
-            Location TEXT
+            Location TEXT,
+            Latitude REAL,
+            Longitude REAL
         )
     ''')
 
@@ -118,7 +156,9 @@ def test_db():
             Status TEXT,
             Address TEXT,
             "neighborhood district" TEXT,
-            Location TEXT
+            Location TEXT,
+            Latitude REAL,
+            Longitude REAL
         )
     ''')
 
@@ -167,6 +207,7 @@ def test_db():
     ''')
 
     conn.commit()
+    build_incidents_table(conn)
     conn.close()
 
     yield db_path
@@ -189,8 +230,8 @@ def mock_geolocator():
 
 @pytest.fixture
 def mock_db_connection(test_db):
-    """Mock database connection to use test database"""
-    with patch('queries.get_db_connection') as mock_conn:
+    """Mock database connection (and the write queue's database) to use test database"""
+    with patch('queries.get_db_connection') as mock_conn, patch('queries.DB_PATH', test_db):
         def get_test_conn(db_path=None):
             conn = sqlite3.connect(test_db)
             conn.row_factory = sqlite3.Row
@@ -198,3 +239,10 @@ def mock_db_connection(test_db):
 
         mock_conn.side_effect = get_test_conn
         yield mock_conn
+
+
+@pytest.fixture
+def pooled_test_db(test_db):
+    """Serve requests from the test database through pooled (timed) connections"""
+    with patch('queries.DB_PATH', test_db):
+        yield test_db
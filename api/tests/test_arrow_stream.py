@@ -0,0 +1,81 @@
+import pytest
+import json
+import sqlite3
+import sys
+import os
+import datetime
+from unittest.mock import patch
+
+import pyarrow as pa
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arrow_stream import DictionaryEncoder, record_batches, ARROW_MIMETYPE
+
+
+def read_arrow(response):
+    return pa.ipc.open_stream(response.data).read_all()
+
+
+class TestDictionaryEncoder:
+    """Test cases for DictionaryEncoder"""
+
+    def test_dictionary_grows_across_batches(self):
+        """Test later batches reuse earlier codes and append new values"""
+        encoder = DictionaryEncoder()
+        first = encoder.encode(['a', 'b', 'a'])
+        second = encoder.encode(['c', None, 'b'])
+
+        assert first.indices.to_pylist() == [0, 1, 0]
+        assert second.indices.to_pylist() == [2, None, 1]
+        assert second.dictionary.to_pylist()[:2] == first.dictionary.to_pylist()
+        assert second.to_pylist() == ['c', None, 'b']
+
+
+class TestRecordBatches:
+    """Test cases for record_batches function"""
+
+    def test_types_and_batches(self):
+        """Test columns are typed, unparseable times are null and rows are split into batches"""
+        conn = sqlite3.connect(':memory:')
+        cursor = conn.execute('''
+            SELECT 1 AS id, 'sfpd_incidents' AS source_table, '2024-01-02 03:04:05' AS incident_time, 37.7 AS latitude
+            UNION ALL SELECT 2, 'sfpd_incidents', 'sometime', NULL
+            UNION ALL SELECT 3, 'fire_incidents', NULL, 37.8
+        ''')
+        batches = list(record_batches(cursor, ['source_table', 'incident_time', 'latitude'], batch_size=2))
+        table = pa.Table.from_batches(batches)
+
+        assert [batch.num_rows for batch in batches] == [2, 1]
+        assert table.schema.field('source_table').type == pa.dictionary(pa.int32(), pa.string())
+        assert table.column('incident_time').to_pylist() == [datetime.datetime(2024, 1, 2, 3, 4, 5), None, None]
+        assert table.column('latitude').to_pylist() == [37.7, None, 37.8]
+        assert 'id' not in table.schema.names
+
+
+class TestArrowEndpoints:
+    """Test cases for format=arrow on the incidents endpoints"""
+
+    def test_timeline_arrow_matches_json(self, client, mock_db_connection):
+        """Test the Arrow timeline holds the same rows as the JSON timeline"""
+        expected = json.loads(client.get('/api/incidents/timeline?limit=3').data)['data']
+        with patch('streaming.STREAM_BATCH_SIZE', 2):
+            response = client.get('/api/incidents/timeline?limit=3&format=arrow')
+        table = read_arrow(response)
+
+        assert response.status_code == 200
+        assert response.mimetype == ARROW_MIMETYPE
+        rows = table.to_pylist()
+        for row in rows:
+            row['incident_time'] = row['incident_time'].strftime('%Y-%m-%d %H:%M:%S')
+        assert rows == expected
+
+    def test_feed_arrow(self, client, mock_db_connection):
+        """Test the Arrow feed has the map columns of incidents with coordinates"""
+        response = client.get('/api/incidents/feed?format=arrow')
+        table = read_arrow(response)
+
+        assert table.schema.names == ['source_table', 'incident_time', 'incident_type', 'latitude', 'longitude']
+        assert table.num_rows == 4
+        assert None not in table.column('latitude').to_pylist()
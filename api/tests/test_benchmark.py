@@ -0,0 +1,116 @@
+import pytest
+import json
+import sqlite3
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import queries
+import benchmark
+from benchmark import percentile, compare, benchmark_database, synthetic_database, BENCHMARK_ROUTES
+
+
+@pytest.fixture(scope='module')
+def synthetic_db(tmp_path_factory):
+    return synthetic_database('3K', str(tmp_path_factory.mktemp('synthetic')))
+
+
+def results_with(p95_ms, status=200):
+    return {'scales': {'1M': {'routes': {'timeline': {'status': status, 'p95_ms': p95_ms}}}}}
+
+
+class TestPercentile:
+    """Test cases for percentile function"""
+
+    def test_interpolates_between_ranks(self):
+        """Test percentiles match linear interpolation between the closest ranks"""
+        values = [4, 1, 3, 2, 5]
+
+        assert percentile(values, 50) == 3
+        assert percentile(values, 95) == pytest.approx(4.8)
+        assert percentile([7], 99) == 7
+        assert percentile([], 50) is None
+
+
+class TestCompare:
+    """Test cases for compare function"""
+
+    def test_flags_slowdowns_beyond_tolerance(self):
+        """Test only slowdowns larger than the tolerance are regressions"""
+        assert compare(results_with(12.0), results_with(10.0), tolerance=0.25) == []
+        regressions = compare(results_with(13.0), results_with(10.0), tolerance=0.25)
+
+        assert [(r['scale'], r['route'], r['change']) for r in regressions] == [('1M', 'timeline', '+30%')]
+
+    def test_flags_status_changes(self):
+        """Test a route that starts failing is a regression however fast it is"""
+        regressions = compare(results_with(1.0, status=500), results_with(10.0))
+
+        assert regressions[0]['change'] == 'status'
+
+    def test_ignores_new_routes_and_scales(self):
+        """Test routes and scales missing from the baseline are not compared"""
+        assert compare(results_with(10.0), {'scales': {'10M': results_with(1.0)['scales']['1M']}}) == []
+
+
+class TestSyntheticDatabase:
+    """Test cases for the synthetic databases the benchmark runs on"""
+
+    def test_tables_and_skew(self, synthetic_db):
+        """Test every source reaches the incidents table and neighborhoods are skewed"""
+        conn = sqlite3.connect(synthetic_db)
+        sources = dict(conn.execute('SELECT source_table, COUNT(*) FROM incidents GROUP BY 1'))
+        neighborhoods = [row[0] for row in conn.execute('''
+            SELECT COUNT(*) FROM "311_service_requests" GROUP BY neighborhood ORDER BY 1 DESC
+        ''')]
+        inspections = conn.execute('SELECT COUNT(*) FROM fire_inspections').fetchone()[0]
+        conn.close()
+
+        assert set(sources) == set(queries.INCIDENT_SOURCES)
+        assert sum(sources.values()) + inspections == 3000
+        assert neighborhoods[0] > 3 * neighborhoods[-1]
+
+    def test_same_seed_same_database(self, synthetic_db, tmp_path):
+        """Test a scale and seed always generate the same rows"""
+        again = synthetic_database('3K', str(tmp_path))
+        query = 'SELECT * FROM sfpd_incidents ORDER BY rowid LIMIT 50'
+        first, second = sqlite3.connect(synthetic_db), sqlite3.connect(again)
+
+        assert first.execute(query).fetchall() == second.execute(query).fetchall()
+        first.close()
+        second.close()
+
+
+class TestBenchmarkDatabase:
+    """Test cases for benchmark_database function"""
+
+    def test_every_route_succeeds(self, synthetic_db):
+        """Test every benchmarked route answers successfully on a synthetic database"""
+        previous_path = queries.DB_PATH
+        results = benchmark_database(synthetic_db, iterations=2)
+
+        assert set(results) == {route.name for route in BENCHMARK_ROUTES}
+        for name, stats in results.items():
+            assert stats['status'] in (200, 201), name
+            assert stats['p50_ms'] <= stats['p95_ms'] <= stats['p99_ms']
+            assert stats['peak_memory_kb'] > 0
+        assert queries.DB_PATH == previous_path
+
+    def test_read_only_and_baseline_exit_status(self, synthetic_db, tmp_path):
+        """Test --read-only skips writes and a slower run against a baseline exits with 1"""
+        baseline_path = tmp_path / 'baseline.json'
+        output_path = tmp_path / 'results.json'
+        args = ['--db', synthetic_db, '--read-only', '--iterations', '1', '--output', str(output_path)]
+
+        assert benchmark.main(args + ['--save-baseline', str(baseline_path)]) == 0
+        results = json.loads(output_path.read_text())
+        routes = results['scales'][os.path.splitext(os.path.basename(synthetic_db))[0]]['routes']
+        assert 'create_sfpd' not in routes and 'timeline' in routes
+
+        baseline = json.loads(baseline_path.read_text())
+        for stats in next(iter(baseline['scales'].values()))['routes'].values():
+            stats['p95_ms'] = 0.0001
+        baseline_path.write_text(json.dumps(baseline))
+        assert benchmark.main(args + ['--baseline', str(baseline_path)]) == 1
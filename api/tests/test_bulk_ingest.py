@@ -0,0 +1,227 @@
+import pytest
+import json
+import sqlite3
+import sys
+import os
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import response_cache
+import write_queue
+from bulk_ingest import iter_ndjson, ingest_ndjson
+from incidents import INCIDENTS_TABLE, ROLLUP_TABLE
+
+
+def ndjson(*records):
+    return '\n'.join(record if isinstance(record, str) else json.dumps(record) for record in records) + '\n'
+
+
+def committing_write(conn):
+    """A write function for ingest_ndjson that commits each chunk on conn"""
+    def write(work):
+        cursor = conn.cursor()
+        try:
+            result = work(cursor)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        return result
+    return write
+
+
+def post_bulk(client, path, body, **params):
+    response = client.post(path, data=body, content_type='application/x-ndjson', query_string=params)
+    return response, json.loads(response.data)
+
+
+SFPD_RECORD = {
+    'category': 'Larceny',
+    'descript': 'Theft',
+    'address': '1 Test St',
+    'pddistrict': 'Mission',
+    'timestamp': '2024-01-08 13:00:00'
+}
+
+
+class TestIterNdjson:
+    """Test cases for iter_ndjson function"""
+
+    def test_lines(self):
+        """Test blank lines are skipped and bad lines reported with their line number"""
+        lines = [b'{"a": 1}\n', b'\n', b'not json\n', b'[1, 2]\n', b'{"b": 2}']
+        parsed = list(iter_ndjson(lines))
+
+        assert [line for line, _, _ in parsed] == [1, 3, 4, 5]
+        assert parsed[0] == (1, {'a': 1}, None)
+        assert parsed[1][2].startswith('Invalid JSON')
+        assert parsed[2] == (4, None, 'Expected a JSON object')
+        assert parsed[3] == (5, {'b': 2}, None)
+
+
+class TestIngestNdjson:
+    """Test cases for ingest_ndjson function"""
+
+    def test_failed_row_is_rolled_back_alone(self):
+        """Test a row failing halfway through leaves nothing behind while its chunk commits"""
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE TABLE items (name TEXT UNIQUE)')
+        conn.execute('CREATE TABLE item_log (name TEXT)')
+        conn.commit()
+
+        def insert_row(cursor, record):
+            # The log row is written before the UNIQUE check fails
+            cursor.execute('INSERT INTO item_log VALUES (?)', (record['name'],))
+            cursor.execute('INSERT INTO items VALUES (?)', (record['name'],))
+            return cursor.lastrowid, {'name': record['name']}
+
+        summary = ingest_ndjson(committing_write(conn), ndjson({'name': 'a'}, {'name': 'a'}, {'name': 'b'}).splitlines(),
+                                'items', insert_row, chunk_size=2)
+        items = conn.execute('SELECT name FROM items ORDER BY name').fetchall()
+        log = conn.execute('SELECT name FROM item_log ORDER BY name').fetchall()
+
+        assert summary['received'] == 3
+        assert summary['created'] == 2
+        assert summary['failed'] == 1
+        assert summary['results'][1]['status'] == 'error'
+        assert 'UNIQUE' in summary['results'][1]['error']
+        assert items == log == [('a',), ('b',)]
+        assert not conn.in_transaction
+
+    def test_after_commit_runs_per_chunk(self):
+        """Test the after_commit hook runs once per committed chunk"""
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE TABLE items (name TEXT)')
+        commits = []
+
+        def insert_row(cursor, record):
+            cursor.execute('INSERT INTO items VALUES (?)', (record['name'],))
+            return cursor.lastrowid, {}
+
+        records = [{'name': str(i)} for i in range(5)]
+        ingest_ndjson(committing_write(conn), ndjson(*records).splitlines(), 'items', insert_row, chunk_size=2,
+                      after_commit=lambda: commits.append(conn.execute('SELECT COUNT(*) FROM items').fetchone()[0]))
+
+        assert commits == [2, 4, 5]
+
+    def test_failed_write_fails_its_chunk(self):
+        """Test a chunk whose write fails reports its rows as errors and the next chunk still runs"""
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE TABLE items (name TEXT)')
+        write = committing_write(conn)
+        calls = []
+
+        def flaky_write(work):
+            calls.append(work)
+            if len(calls) == 1:
+                raise sqlite3.OperationalError('database is locked')
+            return write(work)
+
+        def insert_row(cursor, record):
+            cursor.execute('INSERT INTO items VALUES (?)', (record['name'],))
+            return cursor.lastrowid, {}
+
+        records = [{'name': str(i)} for i in range(3)]
+        summary = ingest_ndjson(flaky_write, ndjson(*records).splitlines(), 'items', insert_row, chunk_size=2)
+
+        assert (summary['created'], summary['failed']) == (1, 2)
+        assert summary['results'][0]['error'] == 'database is locked'
+        assert conn.execute('SELECT name FROM items').fetchall() == [('2',)]
+
+
+class TestBulkEndpoints:
+    """Test cases for the bulk NDJSON endpoints"""
+
+    def test_bulk_311_requests(self, client, mock_db_connection, test_db):
+        """Test valid lines are created and invalid lines reported, in input order"""
+        body = ndjson(
+            {'category': 'Street Cleaning', 'complaint_type': 'Blocked Street', 'descriptor': 'Debris',
+             'incident_address': '1 Bulk St', 'neighborhood': 'Mission', 'latitude': 37.76, 'longitude': -122.42},
+            {'category': 'Street Cleaning', 'complaint_type': 'Blocked Street'},
+            'not json',
+            {'category': 'Graffiti', 'complaint_type': 'Graffiti', 'descriptor': 'Tag',
+             'incident_address': '2 Bulk St', 'neighborhood': 'Mission'}
+        )
+        response, data = post_bulk(client, '/api/311-requests/bulk', body, chunk_size=2)
+
+        assert response.status_code == 200
+        assert data['success'] is False
+        assert (data['received'], data['created'], data['failed']) == (4, 2, 2)
+        assert [result['status'] for result in data['results']] == ['created', 'error', 'error', 'created']
+        assert data['results'][1]['error'] == "Missing required field 'descriptor'"
+        assert data['results'][0]['geocode_pending'] is False
+        assert data['results'][3]['geocode_pending'] is True
+
+        conn = sqlite3.connect(test_db)
+        keys = {row[0] for row in conn.execute(
+            "SELECT unique_key FROM \"311_service_requests\" WHERE incident_address LIKE '% Bulk St'"
+        )}
+        incidents = conn.execute(f'''
+            SELECT COUNT(*) FROM {INCIDENTS_TABLE}
+            WHERE source_table = '311_service_requests' AND address LIKE '% Bulk St'
+        ''').fetchone()[0]
+        conn.close()
+
+        assert keys == {data['results'][0]['unique_key'], data['results'][3]['unique_key']}
+        assert incidents == 2
+
+    def test_bulk_sfpd_incidents_update_rollup(self, client, mock_db_connection, test_db):
+        """Test bulk rows reach the rollup and invalidate cached responses"""
+        version = response_cache.cache.versions(['sfpd_incidents'])
+        response, data = post_bulk(client, '/api/sfpd_incidents/bulk', ndjson(*[SFPD_RECORD] * 3))
+
+        conn = sqlite3.connect(test_db)
+        count = conn.execute(f'''
+            SELECT incident_count FROM {ROLLUP_TABLE}
+            WHERE neighborhood = 'Mission' AND incident_type = 'Larceny'
+        ''').fetchone()[0]
+        conn.close()
+
+        assert response.status_code == 200
+        assert data['success'] is True
+        assert len({result['unique_key'] for result in data['results']}) == 3
+        # One sample row shares the cell
+        assert count == 4
+        assert response_cache.cache.versions(['sfpd_incidents']) != version
+
+    def test_bulk_writes_go_through_write_queue(self, client, mock_db_connection):
+        """Test each chunk is one write of the group-commit writer"""
+        with patch('queries.write_queue.writer_for', wraps=write_queue.writer_for) as writer_for:
+            response, data = post_bulk(client, '/api/sfpd_incidents/bulk', ndjson(*[SFPD_RECORD] * 3), chunk_size=2)
+
+        assert response.status_code == 200
+        assert data['created'] == 3
+        assert writer_for.call_count == 2
+
+    def test_bulk_fire_incidents(self, client, mock_db_connection):
+        """Test fire incidents get their ZIP centroid like single POSTs"""
+        record = {
+            'Address': '1 Bulk St',
+            'Incident Date': '2024-01-05',
+            'Primary Situation': 'Cooking fire',
+            'Analysis Neighborhood': 'Mission',
+            'ZIP Code': '94110'
+        }
+        response, data = post_bulk(client, '/api/fire-incidents/bulk', ndjson(record, record))
+
+        assert response.status_code == 200
+        assert data['created'] == 2
+        assert data['results'][0]['Incident Number'] != data['results'][1]['Incident Number']
+
+    def test_empty_body(self, client, mock_db_connection):
+        """Test a body without records is rejected"""
+        response, data = post_bulk(client, '/api/sfpd_incidents/bulk', '\n\n')
+
+        assert response.status_code == 400
+        assert 'error' in data
+
+    def test_invalid_chunk_size(self, client, mock_db_connection):
+        """Test chunk_size outside its range is rejected"""
+        response, data = post_bulk(client, '/api/sfpd_incidents/bulk', ndjson(SFPD_RECORD), chunk_size=0)
+
+        assert response.status_code == 400
+        assert 'chunk_size' in data['error']
@@ -0,0 +1,114 @@
+import pytest
+import json
+import sqlite3
+import sys
+import os
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from db_pool import ConnectionPool, get_pooled_connection
+
+
+class TestConnectionPool:
+    """Test cases for ConnectionPool"""
+
+    def test_release_and_reuse(self, test_db):
+        """Test a released connection is handed out again"""
+        pool = ConnectionPool()
+        conn = pool.acquire(test_db)
+        conn.close()
+        again = pool.acquire(test_db)
+
+        assert again is conn
+        assert pool.stats()['opened'] == 1
+        assert pool.stats()['reused'] == 1
+        pool.release(again)
+        pool.close_all()
+
+    def test_pragmas_applied(self, test_db):
+        """Test tuned PRAGMAs are set on new connections"""
+        pool = ConnectionPool()
+        conn = pool.acquire(test_db)
+
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert conn.execute('PRAGMA temp_store').fetchone()[0] == 2
+        assert conn.execute('PRAGMA cache_size').fetchone()[0] == -65536
+        pool.release(conn)
+        pool.close_all()
+
+    def test_release_rolls_back_open_transaction(self, test_db):
+        """Test uncommitted writes are discarded when a connection is returned"""
+        pool = ConnectionPool()
+        conn = pool.acquire(test_db)
+        conn.execute('DELETE FROM sfpd_incidents')
+        pool.release(conn)
+        conn = pool.acquire(test_db)
+
+        assert conn.execute('SELECT COUNT(*) FROM sfpd_incidents').fetchone()[0] == 2
+        pool.release(conn)
+        pool.close_all()
+
+    def test_double_release_is_noop(self, test_db):
+        """Test releasing twice doesn't corrupt the counters"""
+        pool = ConnectionPool()
+        conn = pool.acquire(test_db)
+        pool.release(conn)
+        pool.release(conn)
+
+        stats = pool.stats()
+        assert stats['in_use'] == 0
+        assert stats['idle'] == 1
+        pool.close_all()
+
+    def test_max_idle(self, test_db):
+        """Test connections beyond max_idle are closed on release"""
+        pool = ConnectionPool(max_idle=1)
+        first = pool.acquire(test_db)
+        second = pool.acquire(test_db)
+        pool.release(first)
+        pool.release(second)
+
+        stats = pool.stats()
+        assert stats['idle'] == 1
+        assert stats['closed'] == 1
+        with pytest.raises(sqlite3.ProgrammingError):
+            second.execute('SELECT 1')
+        pool.close_all()
+
+    def test_outside_app_context(self, test_db):
+        """Test a plain connection is returned outside a request"""
+        conn = get_pooled_connection(test_db)
+        conn.close()
+
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute('SELECT 1')
+
+
+class TestPoolWithApp:
+    """Test cases for the pool plugged into the Flask app"""
+
+    def test_requests_reuse_connection(self, client, test_db):
+        """Test consecutive requests reuse one pooled connection"""
+        pool = ConnectionPool()
+        with patch('queries.DB_PATH', test_db), patch('db_pool.pool', pool):
+            for _ in range(3):
+                response = client.get('/api/neighborhoods/danger-analysis')
+                assert response.status_code == 200
+
+            stats = pool.stats()
+        pool.close_all()
+
+        assert stats['opened'] == 1
+        assert stats['checkouts'] == 3
+        assert stats['in_use'] == 0
+
+    def test_pool_stats_endpoint(self, client):
+        """Test /debug/db-pool returns the pool counters"""
+        response = client.get('/debug/db-pool')
+
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        for key in ['opened', 'closed', 'checkouts', 'reused', 'in_use', 'idle']:
+            assert key in data
@@ -0,0 +1,138 @@
+import pytest
+import json
+import sqlite3
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from gazetteer import block_key, build_gazetteer, lookup, refine_zip_coordinates, INTERSECTION_BLOCK
+from incidents import INCIDENTS_TABLE
+
+
+@pytest.fixture
+def gazetteer_db(test_db):
+    """Test database with the gazetteer built from its sample rows"""
+    conn = sqlite3.connect(test_db)
+    conn.execute('''
+        INSERT INTO sfpd_incidents (unique_key, address, latitude, longitude) VALUES
+        ('1', '1400 Block of WALLER ST', 37.7690, -122.4480),
+        ('2', '1400 Block of WALLER ST', 37.7692, -122.4482),
+        ('3', 'LINCOLN WY / 4TH AV', 37.7660, -122.4610),
+        ('4', '1 Block of NOWHERE ST', 90.0, -120.5)
+    ''')
+    conn.commit()
+    build_gazetteer(conn)
+    conn.close()
+    return test_db
+
+
+class TestBlockKey:
+    """Test cases for block_key function"""
+
+    def test_block_addresses(self):
+        """Test house numbers and block descriptions map to the same block"""
+        assert block_key('1400 Block of WALLER ST') == ('WALLER ST', 1400)
+        assert block_key('1423 Waller Street') == ('WALLER ST', 1400)
+        assert block_key('1423A WALLER ST #2, SAN FRANCISCO, CA 94117') == ('WALLER ST', 1400)
+        assert block_key('0 Block of 6TH ST') == ('6TH ST', 0)
+
+    def test_intersections(self):
+        """Test intersection spellings map to one key regardless of order"""
+        expected = ('4TH AVE & LINCOLN WAY', INTERSECTION_BLOCK)
+        assert block_key('LINCOLN WY / 4TH AV') == expected
+        assert block_key('Intersection of 4TH AVE and LINCOLN WAY') == expected
+        assert block_key('4TH AVE/LINCOLN WAY') == expected
+
+    def test_unplaceable(self):
+        """Test addresses without a number or intersection"""
+        assert block_key('Not associated with a specific address') is None
+        assert block_key(None) is None
+
+
+class TestGazetteer:
+    """Test cases for building and querying the gazetteer"""
+
+    def test_block_centroid(self, gazetteer_db):
+        """Test observations of a block are averaged and out-of-city points ignored"""
+        conn = sqlite3.connect(gazetteer_db)
+        lat, lon = lookup(conn, '1455 Waller Street')
+        intersection = lookup(conn, 'Intersection of 4TH AVE and LINCOLN WAY')
+        outside = lookup(conn, '1 NOWHERE ST')
+        conn.close()
+
+        assert lat == pytest.approx(37.7691)
+        assert lon == pytest.approx(-122.4481)
+        assert intersection == (37.7660, -122.4610)
+        assert outside is None
+
+    def test_nearest_block(self, gazetteer_db):
+        """Test an unknown block falls back to the nearest block of its street"""
+        conn = sqlite3.connect(gazetteer_db)
+        near = lookup(conn, '1550 WALLER ST')
+        far = lookup(conn, '1700 WALLER ST')
+        conn.close()
+
+        assert near == pytest.approx((37.7691, -122.4481))
+        assert far is None
+
+    def test_lookup_without_table(self):
+        """Test databases without a gazetteer answer None"""
+        conn = sqlite3.connect(':memory:')
+        assert lookup(conn, '1400 WALLER ST') is None
+
+    def test_refine_zip_coordinates(self, gazetteer_db):
+        """Test fire incidents move from the ZIP centroid to their block centroid"""
+        conn = sqlite3.connect(gazetteer_db)
+        conn.execute('''
+            INSERT INTO fire_incidents ("Incident Number", "Address", "Incident Date", "ZIP Code", "Latitude", "Longitude")
+            VALUES ('F1', '1410 WALLER ST', '2024-01-05 10:00:00', '94117', 37.7700, -122.4400),
+                   ('F2', '1 UNKNOWN ST', '2024-01-05 11:00:00', '94117', 37.7700, -122.4400)
+        ''')
+        conn.commit()
+        updated = refine_zip_coordinates(conn)
+        rows = conn.execute('SELECT "Incident Number", "Latitude" FROM fire_incidents ORDER BY 1').fetchall()
+        incident = conn.execute(f'''
+            SELECT latitude FROM {INCIDENTS_TABLE} WHERE source_table = 'fire_incidents' AND address = '1410 WALLER ST'
+        ''').fetchone()
+        conn.close()
+
+        assert updated == {'fire_incidents': 1}
+        assert rows[0][1] == pytest.approx(37.7691)
+        assert rows[1][1] == 37.7700
+        assert incident[0] == pytest.approx(37.7691)
+
+
+class TestGazetteerLookups:
+    """Test cases for the gazetteer in geocoding and POST handlers"""
+
+    def test_311_request_uses_gazetteer(self, client, mock_db_connection, gazetteer_db):
+        """Test a 311 request on a known block gets coordinates immediately"""
+        payload = {
+            'category': 'Street Cleaning',
+            'complaint_type': 'Blocked Street',
+            'descriptor': 'Street blocked by debris',
+            'incident_address': '1423 Waller Street',
+            'neighborhood': 'Haight Ashbury'
+        }
+        response = client.post('/api/311-requests', data=json.dumps(payload), content_type='application/json')
+        data = json.loads(response.data)
+
+        assert data['geocode_pending'] is False
+        assert data['data']['latitude'] == pytest.approx(37.7691)
+
+    def test_fire_incident_uses_block_centroid(self, client, mock_db_connection, gazetteer_db):
+        """Test a fire incident on a known block gets the block centroid, not the ZIP centroid"""
+        payload = {
+            'Address': '1410 WALLER ST',
+            'Incident Date': '2024-01-05',
+            'Primary Situation': 'Cooking fire',
+            'Analysis Neighborhood': 'Haight Ashbury',
+            'ZIP Code': '94117'
+        }
+        response = client.post('/api/fire-incidents', data=json.dumps(payload), content_type='application/json')
+        data = json.loads(response.data)
+
+        assert response.status_code == 201
+        assert data['data']['Latitude'] == pytest.approx(37.7691)
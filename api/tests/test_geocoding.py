@@ -0,0 +1,191 @@
+import pytest
+import json
+import sqlite3
+import sys
+import os
+import time
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import geocoding
+import write_queue
+from geocoding import (
+    GeocodeCache, GeocodeWorker, normalize_address, normalize_zip,
+    GEOCODE_JOBS_TABLE, MAX_ATTEMPTS
+)
+from incidents import INCIDENTS_TABLE
+
+
+PAYLOAD = {
+    'category': 'Street Cleaning',
+    'complaint_type': 'Blocked Street',
+    'descriptor': 'Street blocked by debris',
+    'incident_address': '123 Test Street',
+    'neighborhood': 'Test District',
+    'zip_code': '94102'
+}
+
+
+class FakeGeocoder:
+    """Local stand-in for Nominatim that records its calls"""
+
+    def __init__(self, result=(37.78, -122.41), error=None):
+        self.result = result
+        self.error = error
+        self.calls = []
+
+    def __call__(self, address, zip_code):
+        self.calls.append((address, zip_code))
+        if self.error:
+            raise self.error
+        return self.result
+
+
+def post_311(client, payload=PAYLOAD):
+    response = client.post('/api/311-requests', data=json.dumps(payload), content_type='application/json')
+    return response, json.loads(response.data)
+
+
+class TestNormalize:
+    """Test cases for cache key normalization"""
+
+    def test_normalize_address(self):
+        """Test case, punctuation and street suffixes don't change the key"""
+        assert normalize_address('123 Test Street.') == normalize_address(' 123  test st ') == '123 TEST ST'
+
+    def test_normalize_zip(self):
+        """Test ZIP codes are cut to five digits"""
+        assert normalize_zip('94102.0') == '94102'
+        assert normalize_zip('94102-1234') == '94102'
+        assert normalize_zip(None) == ''
+
+
+class TestGeocodeCache:
+    """Test cases for GeocodeCache"""
+
+    def test_store_and_lookup(self):
+        """Test a stored address is found under another spelling and counted"""
+        conn = sqlite3.connect(':memory:')
+        cache = GeocodeCache()
+
+        assert cache.lookup(conn, '1 Main Street', '94110') is None
+        cache.store(conn, '1 Main Street', '94110', 37.7, -122.4)
+        assert cache.lookup(conn, '1 MAIN ST', '94110.0') == (37.7, -122.4)
+        assert cache.stats() == {'hits': 1, 'misses': 1, 'stores': 1}
+
+    def test_not_found_expires(self):
+        """Test cached "not found" answers are retried after their TTL"""
+        conn = sqlite3.connect(':memory:')
+        cache = GeocodeCache(not_found_ttl=60)
+        with patch('geocoding.time.time', return_value=1000.0):
+            cache.store(conn, '1 Nowhere Ln', None, None, None)
+            assert cache.lookup(conn, '1 Nowhere Ln') == (None, None)
+        with patch('geocoding.time.time', return_value=1061.0):
+            assert cache.lookup(conn, '1 Nowhere Ln') is None
+
+
+class TestAsyncGeocoding:
+    """Test cases for geocoding 311 requests in the background"""
+
+    def test_post_does_not_call_geocoder(self, client, mock_db_connection, mock_geolocator):
+        """Test a cache miss queues a job instead of geocoding inline"""
+        response, data = post_311(client)
+
+        assert response.status_code == 201
+        assert data['geocode_pending'] is True
+        assert data['data']['latitude'] is None
+        mock_geolocator.geocode.assert_not_called()
+
+    def test_worker_fills_coordinates(self, client, mock_db_connection, test_db):
+        """Test the worker geocodes queued rows, updates incidents and feeds the cache"""
+        _, data = post_311(client)
+        geocoder = FakeGeocoder()
+        worker = GeocodeWorker(test_db, geocoder, min_interval=0, cache=GeocodeCache())
+        worker.run_pending()
+
+        conn = sqlite3.connect(test_db)
+        row = conn.execute(
+            'SELECT latitude, longitude FROM "311_service_requests" WHERE unique_key = ?',
+            (data['data']['unique_key'],)
+        ).fetchone()
+        incident = conn.execute(f'''
+            SELECT latitude, has_coords FROM {INCIDENTS_TABLE}
+            WHERE source_table = '311_service_requests' AND address = '123 Test Street'
+        ''').fetchone()
+        jobs = conn.execute(f'SELECT COUNT(*) FROM {GEOCODE_JOBS_TABLE}').fetchone()[0]
+        conn.close()
+        worker.stop()
+
+        assert geocoder.calls == [('123 Test Street', '94102')]
+        assert row == (37.78, -122.41)
+        assert incident == (37.78, 1)
+        assert jobs == 0
+
+        # The same address, spelled differently, is now answered from the cache
+        _, data = post_311(client, dict(PAYLOAD, incident_address='123 TEST ST'))
+        assert data['geocode_pending'] is False
+        assert data['data']['latitude'] == 37.78
+
+    def test_geocoder_errors_are_retried_then_dropped(self, client, mock_db_connection, test_db):
+        """Test failing geocoder calls back off, aren't cached, and give up after MAX_ATTEMPTS"""
+        post_311(client)
+        geocoder = FakeGeocoder(error=RuntimeError('service down'))
+        cache = GeocodeCache()
+        worker = GeocodeWorker(test_db, geocoder, min_interval=0, cache=cache)
+
+        conn = sqlite3.connect(test_db)
+        for _ in range(MAX_ATTEMPTS):
+            # Skip the back-off delay
+            conn.execute(f'UPDATE {GEOCODE_JOBS_TABLE} SET not_before = 0')
+            conn.commit()
+            assert worker.process_next() is True
+        remaining = conn.execute(f'SELECT COUNT(*) FROM {GEOCODE_JOBS_TABLE}').fetchone()[0]
+        conn.close()
+        worker.stop()
+
+        assert len(geocoder.calls) == MAX_ATTEMPTS
+        assert remaining == 0
+        assert worker.stats()['dropped'] == 1
+        assert cache.stats()['stores'] == 0
+
+    def test_rate_limit(self, client, mock_db_connection, test_db):
+        """Test geocoder calls are spaced by min_interval"""
+        post_311(client)
+        post_311(client, dict(PAYLOAD, incident_address='456 Other St'))
+        worker = GeocodeWorker(test_db, FakeGeocoder(), min_interval=1.0, cache=GeocodeCache())
+        with patch('geocoding.time.sleep') as sleep:
+            worker.run_pending()
+        worker.stop()
+
+        assert sleep.call_count == 1
+        assert 0 < sleep.call_args[0][0] <= 1.0
+
+    def test_worker_writes_go_through_write_queue(self, client, mock_db_connection, test_db):
+        """Test the worker commits through the database's writer, not a connection of its own"""
+        post_311(client)
+        worker = GeocodeWorker(test_db, FakeGeocoder(), min_interval=0, cache=GeocodeCache())
+        before = write_queue.writer_for(test_db).stats()['committed']
+        worker.run_pending()
+        after = write_queue.writer_for(test_db).stats()['committed']
+        in_transaction = worker._conn.in_transaction
+        worker.stop()
+
+        assert after > before
+        assert not in_transaction
+
+    def test_notify_starts_worker(self, client, mock_db_connection, test_db):
+        """Test committing a job wakes a background worker for that database"""
+        geocoder = FakeGeocoder()
+        with patch.dict(geocoding.settings, {'autostart': True, 'geocoder': geocoder, 'min_interval': 0}):
+            _, data = post_311(client)
+            worker = geocoding.worker_for(test_db)
+            deadline = time.monotonic() + 5
+            while not geocoder.calls and time.monotonic() < deadline:
+                time.sleep(0.01)
+            worker.stop(timeout=5)
+        geocoding._workers.pop(test_db, None)
+
+        assert data['geocode_pending'] is True
+        assert geocoder.calls == [('123 Test Street', '94102')]
@@ -0,0 +1,444 @@
+import pytest
+import sqlite3
+import pandas as pd
+import sys
+import os
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from incidents import (
+    derive_coordinates, derive_time_features, zip_coordinates, build_incidents_table, ensure_incidents_table,
+    record_incident, refresh_incidents, bbox_filter, INCIDENTS_TABLE, ROLLUP_TABLE, LOCATION_INDEX_TABLE,
+    GRID_TABLE, GRID_LEVELS, TIME_FEATURE_COLUMNS, grid_cell, grid_cell_bounds, grid_level
+)
+
+
+def ids_in_box(conn, bbox, limit=None):
+    sql, params = bbox_filter(conn, bbox, limit)
+    return sorted(row[0] for row in conn.execute(f'SELECT id FROM {INCIDENTS_TABLE} WHERE {sql}', params))
+
+
+class TestDeriveCoordinates:
+    """Test cases for derive_coordinates function"""
+
+    def test_location_strings(self):
+        """Test Python-literal and JSON Location values are both parsed"""
+        values = pd.Series([
+            "{'type': 'Point', 'coordinates': [-122.41, 37.78]}",
+            '{"type": "Point", "coordinates": [-122.5, 37.7]}',
+            "not a location",
+            None
+        ])
+        coords = derive_coordinates(values, 'location')
+
+        assert coords.loc[0].tolist() == [37.78, -122.41]
+        assert coords.loc[1].tolist() == [37.7, -122.5]
+        assert coords.loc[2:].isna().all().all()
+
+    def test_zip_codes(self):
+        """Test ZIP codes map to their centroid, including float-formatted values"""
+        coords = derive_coordinates(pd.Series(['94110', '94110.0', '10001']), 'zip_code')
+
+        assert coords.loc[0].tolist() == [37.7487, -122.4160]
+        assert coords.loc[1].tolist() == [37.7487, -122.4160]
+        assert coords.loc[2].isna().all()
+
+
+class TestDeriveTimeFeatures:
+    """Test cases for derive_time_features function"""
+
+    def test_source_formats(self):
+        """Test dates, ISO timestamps, UTC offsets and US-style timestamps are all parsed"""
+        values = pd.Series([
+            '2024-01-07',
+            '2024-01-07T08:30:00',
+            '2024-01-07 20:30:00+00:00',
+            '2024-01-07 15:30:00-05:00',
+            '01/07/2024 08:30:00 PM',
+            'not a time',
+            None
+        ])
+        features = derive_time_features(values)
+
+        assert features.loc[0].tolist() == [1704585600, 0, 0, 202401, 2024]
+        assert features.loc[1].tolist() == [1704616200, 8, 0, 202401, 2024]
+        assert features.loc[2].tolist() == features.loc[3].tolist() == features.loc[4].tolist() == [
+            1704659400, 20, 0, 202401, 2024
+        ]
+        assert features.loc[5:].isna().all().all()
+
+    def test_matches_sqlite(self):
+        """Test the features agree with SQLite's strftime on the same timestamps"""
+        values = pd.Series(['2023-12-31 23:59:59', '2024-02-29 06:00:00+00:00', '2024-03-02'])
+        features = derive_time_features(values)
+        conn = sqlite3.connect(':memory:')
+        expected = [
+            list(conn.execute(
+                "SELECT CAST(strftime('%s', ?) AS INTEGER), CAST(strftime('%H', ?) AS INTEGER), "
+                "CAST(strftime('%w', ?) AS INTEGER), CAST(strftime('%Y%m', ?) AS INTEGER), "
+                "CAST(strftime('%Y', ?) AS INTEGER)", [value] * 5
+            ).fetchone())
+            for value in values
+        ]
+        conn.close()
+
+        assert features.values.tolist() == expected
+
+
+class TestZipCoordinates:
+    """Test cases for zip_coordinates function"""
+
+    def test_known_zip(self):
+        """Test known ZIP code, including float-formatted values"""
+        assert zip_coordinates('94110') == (37.7487, -122.4160)
+        assert zip_coordinates('94110.0') == (37.7487, -122.4160)
+
+    def test_unknown_zip(self):
+        """Test unknown or missing ZIP code"""
+        assert zip_coordinates('10001') == (None, None)
+        assert zip_coordinates(None) == (None, None)
+
+
+class TestBuildIncidentsTable:
+    """Test cases for building the unified incidents table"""
+
+    def test_build_counts_every_source(self, test_db):
+        """Test that every row of every source table is loaded"""
+        conn = sqlite3.connect(test_db)
+        counts = build_incidents_table(conn)
+        total = conn.execute(f'SELECT COUNT(*) FROM {INCIDENTS_TABLE}').fetchone()[0]
+        conn.close()
+
+        assert counts['311_service_requests'] == 2
+        assert counts['sfpd_incidents'] == 2
+        assert total == sum(counts.values())
+
+    def test_build_normalizes_columns(self):
+        """Test timestamp, neighborhood and coordinate normalization, backfilling
+        Latitude/Longitude on a database built without them"""
+        conn = sqlite3.connect(':memory:')
+        conn.execute('''
+            CREATE TABLE fire_violations (
+                "violation date" TEXT, "violation item description" TEXT, Status TEXT,
+                Address TEXT, "neighborhood district" TEXT, Location TEXT
+            )
+        ''')
+        conn.execute('''
+            INSERT INTO fire_violations VALUES
+            ('2024-01-05T08:30:00', 'Blocked exit', 'open', '1 Main St', 'Mission',
+             "{'type': 'Point', 'coordinates': [-122.41, 37.78]}"),
+            ('2024-01-06 09:00:00+00:00', 'Alarm', 'closed', '2 Main St', '  ', NULL)
+        ''')
+        build_incidents_table(conn)
+        rows = conn.execute(f'''
+            SELECT incident_time, neighborhood, latitude, longitude, has_coords
+            FROM {INCIDENTS_TABLE} ORDER BY incident_time
+        ''').fetchall()
+        conn.close()
+
+        assert rows[0] == ('2024-01-05 08:30:00', 'Mission', 37.78, -122.41, 1)
+        assert rows[1] == ('2024-01-06 09:00:00', None, None, None, 0)
+
+    def test_build_backfills_time_features(self, test_db):
+        """Test time features are added to source tables loaded without them, with their indexes"""
+        conn = sqlite3.connect(test_db)
+        features = conn.execute(f'''
+            SELECT timestamp, {', '.join(TIME_FEATURE_COLUMNS)} FROM sfpd_incidents ORDER BY timestamp
+        ''').fetchall()
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list('sfpd_incidents')")}
+        conn.close()
+
+        assert features == [
+            ('2024-01-01 12:00:00', 1704110400, 12, 1, 202401, 2024),
+            ('2024-01-03 13:00:00', 1704286800, 13, 3, 202401, 2024),
+        ]
+        assert 'idx_sfpd_incidents_year_month' in indexes
+
+    def test_ensure_rebuilds_incidents_without_time_features(self, test_db):
+        """Test ensure_incidents_table rebuilds an incidents table that predates the time features"""
+        conn = sqlite3.connect(test_db)
+        conn.execute(f'ALTER TABLE {INCIDENTS_TABLE} DROP COLUMN incident_hour')
+        ensure_incidents_table(conn)
+        hours = conn.execute(f'''
+            SELECT incident_hour FROM {INCIDENTS_TABLE}
+            WHERE source_table = 'sfpd_incidents' ORDER BY incident_time
+        ''').fetchall()
+        conn.close()
+
+        assert hours == [(12,), (13,)]
+
+    def test_ensure_builds_only_once(self, test_db):
+        """Test ensure_incidents_table leaves an existing table alone"""
+        conn = sqlite3.connect(test_db)
+        conn.execute(f'DELETE FROM {INCIDENTS_TABLE}')
+        conn.commit()
+        ensure_incidents_table(conn)
+        total = conn.execute(f'SELECT COUNT(*) FROM {INCIDENTS_TABLE}').fetchone()[0]
+        conn.close()
+
+        assert total == 0
+
+    def test_record_incident(self, test_db):
+        """Test a single source row is copied into the incidents table"""
+        conn = sqlite3.connect(test_db)
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO sfpd_incidents (unique_key, timestamp, category, descript, address, pddistrict)
+            VALUES ('1111111111', '2024-02-01 00:00:00', 'Arson', 'Arson', '1 Test St', 'Bayview')
+        ''')
+        record_incident(cursor, 'sfpd_incidents', cursor.lastrowid)
+        conn.commit()
+        row = conn.execute(f'''
+            SELECT source_table, incident_type, neighborhood, has_coords
+            FROM {INCIDENTS_TABLE} WHERE incident_time = '2024-02-01 00:00:00'
+        ''').fetchone()
+        conn.close()
+
+        assert row == ('sfpd_incidents', 'Arson', 'Bayview', 0)
+
+
+class TestIncidentRollup:
+    """Test cases for the incident_rollup table"""
+
+    def test_rollup_matches_incidents(self, test_db):
+        """Test the rollup holds one count per incident with a time and neighborhood"""
+        conn = sqlite3.connect(test_db)
+        rollup_total = conn.execute(f'SELECT SUM(incident_count) FROM {ROLLUP_TABLE}').fetchone()[0]
+        incident_total = conn.execute(f'''
+            SELECT COUNT(*) FROM {INCIDENTS_TABLE}
+            WHERE incident_time IS NOT NULL AND neighborhood IS NOT NULL
+        ''').fetchone()[0]
+        conn.close()
+
+        assert rollup_total == incident_total == 4
+
+    def test_record_incident_updates_rollup_in_place(self, test_db):
+        """Test a new incident increments its existing rollup cell"""
+        conn = sqlite3.connect(test_db)
+        cursor = conn.cursor()
+        # Same neighborhood, type and time bucket as sample row 9876543210
+        cursor.execute('''
+            INSERT INTO sfpd_incidents (unique_key, timestamp, category, descript, address, pddistrict)
+            VALUES ('1111111112', '2024-01-08 13:00:00', 'Larceny', 'Theft', '1 Test St', 'Mission')
+        ''')
+        record_incident(cursor, 'sfpd_incidents', cursor.lastrowid)
+        conn.commit()
+        rows = conn.execute(f'''
+            SELECT time_period, day_type, incident_count FROM {ROLLUP_TABLE}
+            WHERE neighborhood = 'Mission' AND incident_type = 'Larceny'
+        ''').fetchall()
+        conn.close()
+
+        assert rows == [('Afternoon', 'Weekday', 2)]
+
+    def test_rollup_buckets_any_time_format(self, test_db):
+        """Test incidents are bucketed by their parsed time, whatever the source's format"""
+        conn = sqlite3.connect(test_db)
+        cursor = conn.cursor()
+        # Saturday evening, in a format SQLite's date functions can't read
+        cursor.execute('''
+            INSERT INTO sfpd_incidents (unique_key, timestamp, category, descript, address, pddistrict)
+            VALUES ('1111111113', '01/06/2024 07:15:00 PM', 'Vandalism', 'Graffiti', '1 Test St', 'Mission')
+        ''')
+        record_incident(cursor, 'sfpd_incidents', cursor.lastrowid)
+        conn.commit()
+        rows = conn.execute(f'''
+            SELECT time_period, day_type, incident_count FROM {ROLLUP_TABLE}
+            WHERE incident_type = 'Vandalism'
+        ''').fetchall()
+        conn.close()
+
+        assert rows == [('Evening', 'Weekend', 1)]
+
+    def test_refresh_incidents_moves_counts(self, test_db):
+        """Test re-deriving an updated source row moves its rollup count"""
+        conn = sqlite3.connect(test_db)
+        cursor = conn.cursor()
+        cursor.execute("UPDATE sfpd_incidents SET pddistrict = 'Bayview' WHERE unique_key = '9876543210'")
+        refresh_incidents(
+            cursor, 'sfpd_incidents',
+            'SELECT rowid FROM sfpd_incidents WHERE unique_key = ?', ('9876543210',)
+        )
+        conn.commit()
+        rows = conn.execute(f'''
+            SELECT neighborhood, incident_count FROM {ROLLUP_TABLE}
+            WHERE incident_type = 'Larceny'
+        ''').fetchall()
+        total = conn.execute(f'''
+            SELECT COUNT(*) FROM {INCIDENTS_TABLE} WHERE source_table = 'sfpd_incidents'
+        ''').fetchone()[0]
+        conn.close()
+
+        assert rows == [('Bayview', 1)]
+        assert total == 2
+
+    def test_refresh_incidents_rederives_time_features(self, test_db):
+        """Test a changed incident time updates the source row's features and moves its rollup count"""
+        conn = sqlite3.connect(test_db)
+        cursor = conn.cursor()
+        cursor.execute("UPDATE sfpd_incidents SET timestamp = '2024-01-06 23:00:00' WHERE unique_key = '9876543210'")
+        refresh_incidents(
+            cursor, 'sfpd_incidents',
+            'SELECT rowid FROM sfpd_incidents WHERE unique_key = ?', ('9876543210',)
+        )
+        conn.commit()
+        features = conn.execute('''
+            SELECT incident_hour, incident_weekday FROM sfpd_incidents WHERE unique_key = '9876543210'
+        ''').fetchone()
+        rows = conn.execute(f'''
+            SELECT time_period, day_type, incident_count FROM {ROLLUP_TABLE}
+            WHERE incident_type = 'Larceny'
+        ''').fetchall()
+        conn.close()
+
+        assert features == (23, 6)
+        assert rows == [('Night', 'Weekend', 1)]
+
+    def test_ensure_rebuilds_missing_rollup(self, test_db):
+        """Test ensure_incidents_table rebuilds the rollup for older databases"""
+        conn = sqlite3.connect(test_db)
+        conn.execute(f'DROP TABLE {ROLLUP_TABLE}')
+        ensure_incidents_table(conn)
+        total = conn.execute(f'SELECT SUM(incident_count) FROM {ROLLUP_TABLE}').fetchone()[0]
+        conn.close()
+
+        assert total == 4
+
+
+class TestLocationIndex:
+    """Test cases for the incident_locations R*Tree"""
+
+    def test_index_holds_located_incidents(self, test_db):
+        """Test every incident with coordinates is indexed"""
+        conn = sqlite3.connect(test_db)
+        indexed = conn.execute(f'SELECT COUNT(*) FROM {LOCATION_INDEX_TABLE}').fetchone()[0]
+        located = conn.execute(f'SELECT COUNT(*) FROM {INCIDENTS_TABLE} WHERE has_coords').fetchone()[0]
+        conn.close()
+
+        assert indexed == located == 4
+
+    def test_bbox_filter(self, test_db):
+        """Test the box is exact at its edges, with and without the index"""
+        conn = sqlite3.connect(test_db)
+        # Edges on the two sample rows at latitude 37.7849
+        bbox = (-122.4194, 37.7749, -122.4094, 37.7849)
+        expected = [row[0] for row in conn.execute(f'''
+            SELECT id FROM {INCIDENTS_TABLE}
+            WHERE longitude BETWEEN -122.4194 AND -122.4094 AND latitude BETWEEN 37.7749 AND 37.7849
+            ORDER BY id
+        ''')]
+        through_index = ids_in_box(conn, bbox)
+        # limit * BBOX_PROBE_FACTOR <= matches: the index is skipped
+        with patch('incidents.BBOX_PROBE_FACTOR', 1):
+            assert 'IN' not in bbox_filter(conn, bbox, limit=2)[0]
+            through_scan = ids_in_box(conn, bbox, limit=2)
+        conn.close()
+
+        assert len(expected) == 3
+        assert through_index == through_scan == expected
+
+    def test_record_and_refresh_keep_index_in_sync(self, test_db):
+        """Test new and moved incidents are found at their new location only"""
+        conn = sqlite3.connect(test_db)
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO sfpd_incidents (unique_key, timestamp, category, address, pddistrict, latitude, longitude)
+            VALUES ('1111111113', '2024-01-09 10:00:00', 'Arson', '1 Box St', 'Bayview', 37.73, -122.39)
+        ''')
+        record_incident(cursor, 'sfpd_incidents', cursor.lastrowid)
+        conn.commit()
+        new_id = conn.execute(f"SELECT id FROM {INCIDENTS_TABLE} WHERE address = '1 Box St'").fetchone()[0]
+        bayview = (-122.40, 37.72, -122.38, 37.74)
+        assert ids_in_box(conn, bayview) == [new_id]
+
+        cursor.execute("UPDATE sfpd_incidents SET latitude = 37.80, longitude = -122.41 WHERE unique_key = '1111111113'")
+        refresh_incidents(cursor, 'sfpd_incidents', 'SELECT rowid FROM sfpd_incidents WHERE unique_key = ?', ('1111111113',))
+        conn.commit()
+        moved = conn.execute(f"SELECT id FROM {INCIDENTS_TABLE} WHERE address = '1 Box St'").fetchone()[0]
+        indexed = conn.execute(f'SELECT COUNT(*) FROM {LOCATION_INDEX_TABLE}').fetchone()[0]
+
+        assert ids_in_box(conn, bayview) == []
+        assert ids_in_box(conn, (-122.42, 37.79, -122.40, 37.81)) == [moved]
+        assert indexed == 5
+        conn.close()
+
+    def test_ensure_rebuilds_missing_index(self, test_db):
+        """Test ensure_incidents_table builds the location index for older databases"""
+        conn = sqlite3.connect(test_db)
+        conn.execute(f'DROP TABLE {LOCATION_INDEX_TABLE}')
+        ensure_incidents_table(conn)
+        indexed = conn.execute(f'SELECT COUNT(*) FROM {LOCATION_INDEX_TABLE}').fetchone()[0]
+        conn.close()
+
+        assert indexed == 4
+
+
+class TestIncidentGrid:
+    """Test cases for the multi-resolution incident_grid table"""
+
+    def grid_counts(self, conn):
+        return dict(conn.execute(f'SELECT level, SUM(incident_count) FROM {GRID_TABLE} GROUP BY level'))
+
+    def test_every_level_counts_every_located_incident(self, test_db):
+        """Test each level holds all incidents with coordinates, in the cell grid_cell computes"""
+        conn = sqlite3.connect(test_db)
+        counts = self.grid_counts(conn)
+        cells = set(conn.execute(f'SELECT level, cell_x, cell_y FROM {GRID_TABLE}'))
+        conn.close()
+
+        assert counts == {level: 4 for level in GRID_LEVELS}
+        assert (15, *grid_cell(37.7749, -122.4194, 15)) in cells
+
+    def test_cell_bounds_contain_point(self):
+        """Test a point lies within the bounds of its cell"""
+        for level in GRID_LEVELS:
+            min_lon, min_lat, max_lon, max_lat = grid_cell_bounds(*grid_cell(37.7749, -122.4194, level), level)
+            assert min_lon <= -122.4194 < max_lon
+            assert min_lat <= 37.7749 < max_lat
+
+    def test_grid_level_clamps_zoom(self):
+        """Test zooms outside the precomputed levels use the nearest level"""
+        assert grid_level(3) == min(GRID_LEVELS)
+        assert grid_level(12) == 12
+        assert grid_level(20) == max(GRID_LEVELS)
+
+    def test_record_and_refresh_keep_grid_in_sync(self, test_db):
+        """Test new and moved incidents update the cells of every level"""
+        conn = sqlite3.connect(test_db)
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO sfpd_incidents (unique_key, timestamp, category, address, pddistrict, latitude, longitude)
+            VALUES ('1111111114', '2024-01-09 10:00:00', 'Arson', '1 Grid St', 'Bayview', 37.73, -122.39)
+        ''')
+        record_incident(cursor, 'sfpd_incidents', cursor.lastrowid)
+        conn.commit()
+        assert self.grid_counts(conn) == {level: 5 for level in GRID_LEVELS}
+
+        cursor.execute("UPDATE sfpd_incidents SET latitude = 37.80, longitude = -122.41 WHERE unique_key = '1111111114'")
+        refresh_incidents(cursor, 'sfpd_incidents', 'SELECT rowid FROM sfpd_incidents WHERE unique_key = ?', ('1111111114',))
+        conn.commit()
+        old_cell = grid_cell(37.73, -122.39, 15)
+        new_cell = conn.execute(f'''
+            SELECT incident_count, latitude_sum FROM {GRID_TABLE}
+            WHERE level = 15 AND cell_x = ? AND cell_y = ? AND incident_type = 'Arson'
+        ''', grid_cell(37.80, -122.41, 15)).fetchone()
+        emptied = conn.execute(
+            f'SELECT COUNT(*) FROM {GRID_TABLE} WHERE level = 15 AND cell_x = ? AND cell_y = ?', old_cell
+        ).fetchone()[0]
+
+        assert self.grid_counts(conn) == {level: 5 for level in GRID_LEVELS}
+        assert new_cell == (1, pytest.approx(37.80))
+        assert emptied == 0
+        conn.close()
+
+    def test_ensure_rebuilds_missing_grid(self, test_db):
+        """Test ensure_incidents_table builds the grid for older databases"""
+        conn = sqlite3.connect(test_db)
+        conn.execute(f'DROP TABLE {GRID_TABLE}')
+        ensure_incidents_table(conn)
+        counts = self.grid_counts(conn)
+        conn.close()
+
+        assert counts == {level: 4 for level in GRID_LEVELS}
@@ -0,0 +1,140 @@
+import pytest
+import json
+import sqlite3
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import queries
+import index_advisor
+from index_advisor import Index, advise, candidate_indexes, collect_statements, referenced_columns, what_if_database
+
+
+@pytest.fixture
+def events_db():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE events (id INTEGER PRIMARY KEY, kind TEXT, at TEXT, note TEXT)')
+    conn.execute('CREATE INDEX idx_events_note ON events (note)')
+    conn.executemany('INSERT INTO events (kind, at, note) VALUES (?, ?, ?)',
+                     [(f'kind{i % 7}', f'2024-01-{i % 28 + 1:02d}', None) for i in range(500)])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def statement(sql, *parameters):
+    return {'route': 'test', 'sql': sql, 'parameters': list(parameters)}
+
+
+class TestCandidates:
+    """Test cases for referenced_columns and candidate_indexes functions"""
+
+    def test_key_and_read_columns(self):
+        """Test filtered and sorted columns are keys and selected ones are only read"""
+        sql = 'SELECT note, "at" FROM events WHERE kind = ? AND at IS NOT NULL ORDER BY "at"'
+
+        assert referenced_columns(sql, ['id', 'kind', 'at', 'note']) == (['kind', 'at'], ['note'])
+
+    def test_covering_and_partial_variants(self):
+        """Test candidates include covering and IS NOT NULL partial variants"""
+        sql = 'SELECT note FROM events WHERE kind = ? AND at IS NOT NULL ORDER BY at'
+        candidates = set(candidate_indexes(sql, 'events', ['id', 'kind', 'at', 'note']))
+
+        assert Index('events', ('kind', 'at'), None) in candidates
+        assert Index('events', ('kind', 'at', 'note'), None) in candidates
+        assert Index('events', ('kind',), '"at" IS NOT NULL') in candidates
+
+    def test_index_sql(self):
+        """Test index names are derived from the table and columns"""
+        index = Index('fire_incidents', ('Incident Date',), '"Incident Date" IS NOT NULL')
+
+        assert index.create_sql() == (
+            'CREATE INDEX IF NOT EXISTS "idx_fire_incidents_incident_date_partial" '
+            'ON "fire_incidents" ("Incident Date") WHERE "Incident Date" IS NOT NULL'
+        )
+
+
+class TestWhatIfDatabase:
+    """Test cases for what_if_database function"""
+
+    def test_copies_schema_and_statistics(self, events_db):
+        """Test tables, indexes, virtual tables and sqlite_stat1 are copied without rows"""
+        events_db.execute('CREATE VIRTUAL TABLE places USING rtree(id, min_x, max_x)')
+        events_db.execute('ANALYZE')
+        memory = what_if_database(events_db)
+
+        names = {row[0] for row in memory.execute('SELECT name FROM sqlite_master')}
+        assert {'events', 'idx_events_note', 'places', 'places_node'} <= names
+        assert memory.execute('SELECT COUNT(*) FROM events').fetchone()[0] == 0
+        stats = 'SELECT tbl, idx, stat FROM sqlite_stat1 ORDER BY 1, 2'
+        assert memory.execute(stats).fetchall() == events_db.execute(stats).fetchall() != []
+
+
+class TestAdvise:
+    """Test cases for advise function"""
+
+    def test_proposes_index_removing_scan_and_sort(self, events_db):
+        """Test a filtered, sorted statement gets the index that serves both"""
+        report = advise(events_db, [statement('SELECT id FROM events WHERE kind = ? ORDER BY at', 'kind1')])
+        [result] = report['statements']
+
+        assert result['full_scans'] == ['SCAN events']
+        assert result['proposed_index'] == Index('events', ('kind', 'at'), None).create_sql()
+        assert result['plan_after'] == ['SEARCH events USING COVERING INDEX idx_events_kind_at (kind=?)']
+        assert result['improved'] is True
+        assert report['proposed_indexes'] == [result['proposed_index']]
+        assert report['unused_indexes'] == ['idx_events_note']
+
+    def test_shorter_proposals_served_by_longer_ones(self, events_db):
+        """Test an index whose columns prefix another proposal is not proposed separately"""
+        report = advise(events_db, [
+            statement('SELECT COUNT(*) FROM events WHERE kind = ?', 'kind1'),
+            statement('SELECT id FROM events WHERE kind = ? ORDER BY at', 'kind1'),
+        ])
+
+        assert report['proposed_indexes'] == [Index('events', ('kind', 'at'), None).create_sql()]
+        assert all(result['improved'] for result in report['statements'])
+
+    def test_statements_without_problems(self, events_db):
+        """Test statements already served by an index get no proposal"""
+        report = advise(events_db, [statement('SELECT * FROM events WHERE id = ?', 1)])
+
+        assert report['statements'][0]['proposed_index'] is None
+        assert report['proposed_indexes'] == []
+
+
+class TestIndexAdvisorCli:
+    """Test cases for collect_statements and the index advisor CLI"""
+
+    def test_collect_statements(self, test_db):
+        """Test the read routes' SELECTs are collected with their route and DB_PATH is restored"""
+        previous_path = queries.DB_PATH
+        statements = collect_statements(test_db)
+        routes = {s['route'] for s in statements}
+
+        assert {'timeline', 'neighborhood_top', 'monthly_incidents'} <= routes
+        assert all(s['sql'].upper().startswith(('SELECT', 'WITH')) for s in statements)
+        assert queries.DB_PATH == previous_path
+
+    def test_apply(self, test_db, tmp_path):
+        """Test --apply creates the proposed indexes and gathers statistics"""
+        output = tmp_path / 'report.json'
+
+        assert index_advisor.main([test_db, '--apply', '--output', str(output)]) == 0
+        report = json.loads(output.read_text())
+        conn = sqlite3.connect(test_db)
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        has_stats = conn.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0] > 0
+        conn.close()
+
+        assert report['proposed_indexes']
+        assert set(report['created_indexes']) <= indexes
+        assert has_stats
+        assert set(report['statistics']) == {'stat4'}
+
+    def test_missing_database(self, tmp_path):
+        """Test a missing database exits with an error instead of creating one"""
+        assert index_advisor.main([str(tmp_path / 'missing.db')]) == 1
+        assert not (tmp_path / 'missing.db').exists()
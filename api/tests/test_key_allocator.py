@@ -0,0 +1,130 @@
+import pytest
+import json
+import sqlite3
+import sys
+import os
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from key_allocator import allocate_key, insert_with_key, prepare_key_sequences, KEY_BASE, KEY_SEQUENCES_TABLE
+
+
+class TestAllocateKey:
+    """Test cases for allocate_key function"""
+
+    def test_sequential_keys(self, test_db):
+        """Test keys come from a per-table counter starting at KEY_BASE"""
+        conn = sqlite3.connect(test_db)
+        cursor = conn.cursor()
+        keys = [allocate_key(cursor, '311_service_requests') for _ in range(3)]
+        other = allocate_key(cursor, 'sfpd_incidents')
+        conn.close()
+
+        assert keys == [str(KEY_BASE), str(KEY_BASE + 1), str(KEY_BASE + 2)]
+        assert other == str(KEY_BASE)
+
+    def test_skips_taken_keys(self, test_db):
+        """Test a key already present in the table is skipped"""
+        conn = sqlite3.connect(test_db)
+        conn.execute('INSERT INTO sfpd_incidents (unique_key) VALUES (?)', (str(KEY_BASE),))
+        key = allocate_key(conn.cursor(), 'sfpd_incidents')
+        conn.close()
+
+        assert key == str(KEY_BASE + 1)
+
+    def test_rollback_returns_key(self, test_db):
+        """Test a rolled-back allocation doesn't consume the key"""
+        conn = sqlite3.connect(test_db)
+        allocate_key(conn.cursor(), 'sfpd_incidents')
+        conn.commit()
+        allocate_key(conn.cursor(), 'sfpd_incidents')
+        conn.rollback()
+        key = allocate_key(conn.cursor(), 'sfpd_incidents')
+        conn.close()
+
+        assert key == str(KEY_BASE + 1)
+
+    def test_collision_check_uses_index(self, test_db):
+        """Test the key lookup searches an index instead of scanning the table"""
+        conn = sqlite3.connect(test_db)
+        allocate_key(conn.cursor(), 'sfpd_incidents')
+        plan = conn.execute(
+            'EXPLAIN QUERY PLAN SELECT 1 FROM sfpd_incidents WHERE unique_key = ? LIMIT 1', ('1',)
+        ).fetchall()
+        conn.close()
+
+        assert 'USING' in plan[0][3] and 'INDEX' in plan[0][3]
+
+
+class TestPrepareKeySequences:
+    """Test cases for prepare_key_sequences function"""
+
+    def test_prepares_once(self, tmp_path):
+        """Test a prepared database has its counters and key indexes, and allocations skip the setup"""
+        conn = sqlite3.connect(str(tmp_path / 'keys.db'))
+        conn.execute('CREATE TABLE sfpd_incidents (unique_key TEXT, category TEXT)')
+        conn.execute('CREATE TABLE fire_incidents ("Incident Number" TEXT, "Address" TEXT)')
+        conn.commit()
+        prepare_key_sequences(conn)
+        counters = conn.execute(f'SELECT source_table FROM {KEY_SEQUENCES_TABLE} ORDER BY source_table').fetchall()
+        plan = conn.execute(
+            'EXPLAIN QUERY PLAN SELECT 1 FROM fire_incidents WHERE "Incident Number" = ? LIMIT 1', ('1',)
+        ).fetchall()
+
+        with patch('key_allocator.ensure_key_sequence') as ensure:
+            key = allocate_key(conn.cursor(), 'sfpd_incidents')
+        conn.close()
+
+        # Only tables that exist get a counter
+        assert counters == [('fire_incidents',), ('sfpd_incidents',)]
+        assert 'USING' in plan[0][3] and 'INDEX' in plan[0][3]
+        ensure.assert_not_called()
+        assert key == str(KEY_BASE)
+
+
+class TestInsertWithKey:
+    """Test cases for insert_with_key function"""
+
+    def test_retries_on_unique_conflict(self):
+        """Test a key rejected by the unique index is replaced by the next one"""
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE TABLE "311_service_requests" (unique_key TEXT UNIQUE, category TEXT)')
+        conn.execute("INSERT INTO \"311_service_requests\" VALUES ('5', 'taken')")
+        cursor = conn.cursor()
+        # e.g. a concurrent writer took '5' after the collision check
+        with patch('key_allocator.allocate_key', side_effect=['5', '6']):
+            row = insert_with_key(
+                cursor, '311_service_requests',
+                'INSERT INTO "311_service_requests" VALUES (?, ?) RETURNING *', ('Noise',)
+            )
+        conn.close()
+
+        assert row == ('6', 'Noise')
+
+    def test_other_integrity_errors_raise(self):
+        """Test constraint failures unrelated to the key are not retried"""
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE TABLE "311_service_requests" (unique_key TEXT UNIQUE, category TEXT NOT NULL)')
+        with pytest.raises(sqlite3.IntegrityError):
+            insert_with_key(
+                conn.cursor(), '311_service_requests',
+                'INSERT INTO "311_service_requests" VALUES (?, ?)', (None,)
+            )
+        conn.close()
+
+
+class TestCreateEndpointKeys:
+    """Test cases for keys assigned by the POST endpoints"""
+
+    def test_sfpd_keys_are_sequential(self, client, mock_db_connection, mock_geolocator):
+        """Test consecutive SFPD incidents get consecutive, non-null keys"""
+        payload = {'category': 'Arson', 'descript': 'Arson', 'address': '1 Test St'}
+        keys = []
+        for _ in range(2):
+            response = client.post('/api/sfpd_incidents', data=json.dumps(payload), content_type='application/json')
+            assert response.status_code == 201
+            keys.append(json.loads(response.data)['data']['unique_key'])
+
+        assert keys == [str(KEY_BASE), str(KEY_BASE + 1)]
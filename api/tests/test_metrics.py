@@ -0,0 +1,129 @@
+import pytest
+import sqlite3
+import sys
+import os
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import metrics
+from metrics import Histogram, TimedCursor, PROMETHEUS_MIMETYPE
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    """Start every test with empty histograms"""
+    metrics.registry.clear()
+    yield
+    metrics.registry.clear()
+
+
+def scrape(client):
+    """Samples of /metrics as {series: value}"""
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type == PROMETHEUS_MIMETYPE
+    samples = {}
+    for line in response.data.decode().splitlines():
+        if line and not line.startswith('#'):
+            series, value = line.rsplit(' ', 1)
+            samples[series] = float(value)
+    return samples
+
+
+class TestHistogram:
+    """Test cases for Histogram"""
+
+    def test_render(self):
+        """Test buckets are cumulative and labels are escaped"""
+        histogram = Histogram('latency_seconds', 'Latency', ('route',), buckets=(0.1, 1))
+        histogram.observe(0.05, '/a"b')
+        histogram.observe(0.5, '/a"b')
+        histogram.observe(5, '/a"b')
+
+        assert histogram.render() == [
+            '# HELP latency_seconds Latency',
+            '# TYPE latency_seconds histogram',
+            'latency_seconds_bucket{route="/a\\"b",le="0.1"} 1',
+            'latency_seconds_bucket{route="/a\\"b",le="1"} 2',
+            'latency_seconds_bucket{route="/a\\"b",le="+Inf"} 3',
+            'latency_seconds_sum{route="/a\\"b"} 5.55',
+            'latency_seconds_count{route="/a\\"b"} 3',
+        ]
+
+
+class TestTimedCursor:
+    """Test cases for TimedCursor"""
+
+    def test_counts_rows_within_a_request(self, app):
+        """Test statements and fetched rows are added to the request's timings"""
+        conn = sqlite3.connect(':memory:')
+        with app.test_request_context():
+            metrics.g.request_timings = timings = metrics.RequestTimings()
+            cursor = conn.cursor(TimedCursor).execute('SELECT 1 UNION ALL SELECT 2 UNION ALL SELECT 3')
+            first = cursor.fetchone()
+            rest = list(cursor)
+
+        assert first == (1,) and rest == [(2,), (3,)]
+        assert timings.statements == 1
+        assert timings.rows == 3
+        assert timings.sql > 0
+
+    def test_outside_a_request(self):
+        """Test cursors work unchanged without a request to record"""
+        conn = sqlite3.connect(':memory:')
+
+        assert conn.cursor(TimedCursor).execute('SELECT 1').fetchall() == [(1,)]
+
+
+class TestMetricsEndpoint:
+    """Test cases for /metrics"""
+
+    def test_records_route_phases_rows_and_bytes(self, client, pooled_test_db):
+        """Test a request is recorded under its route with SQL time, rows and size"""
+        response = client.get('/api/neighborhood/top')
+        samples = scrape(client)
+        route = 'route="/api/neighborhood/top"'
+
+        assert samples[f'api_request_duration_seconds_count{{method="GET",{route},status="200"}}'] == 1
+        assert samples[f'api_request_phase_seconds_sum{{{route},phase="sql"}}'] > 0
+        assert samples[f'api_request_phase_seconds_count{{{route},phase="serialize"}}'] == 1
+        assert samples[f'api_request_rows_sum{{{route}}}'] == len(response.get_json()['data'])
+        assert samples[f'api_response_bytes_sum{{{route}}}'] == len(response.data)
+        assert samples['api_db_pool_checkouts'] >= 1
+
+    def test_streamed_response_recorded_on_close(self, client, pooled_test_db):
+        """Test a streamed response is recorded, with its rows and bytes, once it is closed"""
+        response = client.get('/api/incidents/timeline?format=ndjson')
+        route = 'route="/api/incidents/timeline"'
+        assert f'api_request_rows_sum{{{route}}}' not in scrape(client)
+
+        response.close()
+        samples = scrape(client)
+
+        assert samples[f'api_request_rows_sum{{{route}}}'] == 4
+        assert samples[f'api_response_bytes_sum{{{route}}}'] == len(response.data)
+        assert samples[f'api_request_phase_seconds_sum{{{route},phase="serialize"}}'] > 0
+
+    def test_errors_and_unmatched_routes(self, client, mock_db_connection):
+        """Test error statuses and requests no route matched get their own series"""
+        client.get('/api/neighborhood/top?limit=0')
+        client.get('/no/such/route')
+        samples = scrape(client)
+
+        assert samples['api_request_duration_seconds_count{method="GET",route="/api/neighborhood/top",status="400"}'] == 1
+        assert samples['api_request_duration_seconds_count{method="GET",route="<unmatched>",status="404"}'] == 1
+
+    def test_disabled(self, client, mock_db_connection):
+        """Test nothing is recorded while metrics are disabled"""
+        with patch.dict(metrics.settings, {'enabled': False}):
+            client.get('/api/neighborhood/top')
+            samples = scrape(client)
+
+        assert not any(series.startswith('api_request') for series in samples)
+
+    def test_configure_rejects_unknown_settings(self):
+        """Test configure() rejects settings it doesn't know"""
+        with pytest.raises(ValueError):
+            metrics.configure(bogus=True)
@@ -0,0 +1,388 @@
+import pytest
+import sqlite3
+import sys
+import os
+
+# Add parent and data_processing directories to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'data_processing')))
+
+from preprocessing import (
+    csv_to_sqlite_table, infer_column_type, load_ddl_schema, process_csv_streaming, process_csv_with_ignore,
+    process_directory
+)
+from incidents import GRID_TABLE, INCIDENTS_TABLE, LOCATION_INDEX_TABLE, ROLLUP_TABLE, record_incident
+
+DDL = '''CREATE DATABASE publicsafety;
+-- a comment
+
+CREATE TABLE "widgets" (
+widget_id VARCHAR(20) NOT NULL,
+price NUMERIC(10, 2),
+in_stock BOOLEAN,
+made_on DATE,
+PRIMARY KEY (widget_id)
+);
+
+CREATE TABLE widget_parts (
+    widget_id VARCHAR(20) NOT NULL,
+    part_number INTEGER NOT NULL,
+    PRIMARY KEY (widget_id, part_number),
+    FOREIGN KEY (widget_id) REFERENCES widgets(widget_id)
+);
+'''
+
+
+def write_csv(path, header, rows):
+    with open(path, 'w') as f:
+        f.write(','.join(header) + '\n')
+        for row in rows:
+            f.write(','.join(row) + '\n')
+    return str(path)
+
+
+@pytest.fixture
+def ddl_schema(tmp_path):
+    """Schema parsed from a two-table DDL file"""
+    path = tmp_path / 'tables.sql'
+    path.write_text(DDL)
+    return load_ddl_schema(str(path))
+
+
+SFPD_HEADER = ['unique_key', 'pdid', 'category', 'descript', 'pddistrict', 'address', 'latitude', 'longitude', 'timestamp']
+SFPD_ROWS = [
+    ['1', '101', 'Larceny', 'Theft', 'Mission', '100 Valencia St', '37.7690', '-122.4220', '2024-01-08 13:00:00'],
+    ['1', '102', 'Assault', 'Battery', 'Mission', '100 Valencia St', '37.7690', '-122.4220', '2024-01-08 13:00:00'],
+    ['2', '201', 'Larceny', 'Theft', 'Southern', '1 Market St', '37.7940', '-122.3950', '2024-01-06 02:30:00'],
+    ['3', '301', 'Vandalism', 'Graffiti', 'Park', '1423 Waller St', '', '', '2023-12-31T23:59:00'],
+]
+REQUESTS_HEADER = ['unique_key', 'created_date', 'category', 'complaint_type', 'incident_address',
+                   'neighborhood', 'latitude', 'longitude']
+REQUESTS_ROWS = [
+    ['5001', '2024-01-05 08:15:00', 'Street Cleaning', 'Debris', '2 Mission St', 'South of Market', '37.7920', '-122.3960'],
+    ['5002', '01/06/2024 07:45:00 PM', 'Graffiti', 'Tag', '3 Haight St', 'Hayes Valley', '37.7730', '-122.4210'],
+]
+
+
+# SFPD_ROWS with one row changed and one added (pdid 1001 sorts before 301 as text)
+CHANGED_SFPD_ROWS = SFPD_ROWS[:2] + [
+    ['2', '201', 'Robbery', 'Theft', 'Southern', '1 Market St', '37.7940', '-122.3950', '2024-01-06 02:30:00'],
+    SFPD_ROWS[3],
+    ['4', '1001', 'Burglary', 'Break-in', 'Richmond', '400 Clement St', '37.7830', '-122.4630', '2024-02-01 09:00:00'],
+]
+
+
+def write_sources(raw_dir, sfpd_rows=SFPD_ROWS, requests_rows=REQUESTS_ROWS):
+    """Raw sfpd_incidents.csv and 311_service_requests.csv for process_directory"""
+    raw_dir.mkdir(exist_ok=True)
+    write_csv(raw_dir / 'sfpd_incidents.csv', SFPD_HEADER, sfpd_rows)
+    write_csv(raw_dir / '311_service_requests.csv', REQUESTS_HEADER, requests_rows)
+    return str(raw_dir)
+
+
+def build_database(tmp_path, raw_dir, name, **options):
+    """Run process_directory into its own output and database directories; returns the database path"""
+    result = process_directory(raw_dir, str(tmp_path / f'{name}_processed'), str(tmp_path / 'ignore.txt'),
+                               create_sql_databases=True, sql_db_dir=str(tmp_path / f'{name}_db'), **options)
+    return result['db_file']
+
+
+def snapshot(db_path):
+    """
+    Rows of the source and derived tables, sorted and without the ids that
+    depend on load order, so databases built different ways compare equal.
+    """
+    conn = sqlite3.connect(db_path)
+    queries = {
+        'sfpd_incidents': 'SELECT * FROM sfpd_incidents',
+        '311_service_requests': 'SELECT * FROM "311_service_requests"',
+        INCIDENTS_TABLE: f'''
+            SELECT source_table, incident_time, incident_type, description, address, neighborhood,
+                   latitude, longitude, has_coords, incident_hour, incident_weekday
+            FROM {INCIDENTS_TABLE}
+        ''',
+        ROLLUP_TABLE: f'SELECT * FROM {ROLLUP_TABLE} WHERE incident_count != 0',
+        GRID_TABLE: f'''
+            SELECT level, cell_x, cell_y, source_table, incident_type, incident_count,
+                   ROUND(latitude_sum, 9), ROUND(longitude_sum, 9)
+            FROM {GRID_TABLE} WHERE incident_count != 0
+        ''',
+        LOCATION_INDEX_TABLE: f'''
+            SELECT i.source_table, i.address, i.incident_time, l.min_lon, l.max_lon, l.min_lat, l.max_lat
+            FROM {LOCATION_INDEX_TABLE} AS l JOIN {INCIDENTS_TABLE} AS i ON i.id = l.id
+        ''',
+    }
+    tables = {name: sorted(conn.execute(sql).fetchall(), key=repr) for name, sql in queries.items()}
+    conn.close()
+    return tables
+
+
+def column_types(conn, table_name):
+    return {row[1]: row[2] for row in conn.execute(f'PRAGMA table_info("{table_name}")')}
+
+
+def pk_index_unique(conn, table_name):
+    return {row[1]: row[2] for row in conn.execute(f'PRAGMA index_list("{table_name}")')}[f'pk_{table_name}']
+
+
+@pytest.fixture
+def ignore_file(tmp_path):
+    """ignore.txt dropping the 'secret' column of items.csv"""
+    path = tmp_path / 'ignore.txt'
+    path.write_text('items.csv:\nIgnore: secret\n\nsfpd_incidents.csv:\nIgnore: descript\n')
+    return str(path)
+
+
+@pytest.fixture
+def items_csv(tmp_path):
+    """
+    21 rows: one all-empty, a 'sparse' column with a single value (95% empty)
+    and an integer 'count' column with a missing value
+    """
+    rows = [[str(i), f'item {i}', f's{i}', '', f'{i}.5', str(i * 3)] for i in range(20)]
+    rows[7][3] = 'only'
+    rows[9][5] = ''
+    rows.insert(11, ['', '', '', '', '', ''])
+    raw_dir = tmp_path / 'raw'
+    raw_dir.mkdir()
+    return write_csv(raw_dir / 'items.csv', ['id', 'name', 'secret', 'sparse', 'value', 'count'], rows)
+
+
+@pytest.fixture
+def fire_incidents_csv(tmp_path):
+    """Fire incidents with midnight-only dates (parsed by apply_extra_preprocessing) and ZIP codes"""
+    rows = [[str(100 + i), f'{i} Fire St', f'2024-01-{i + 1:02d}', '' if i == 4 else '94110', 'Cooking fire']
+            for i in range(10)]
+    raw_dir = tmp_path / 'raw'
+    raw_dir.mkdir()
+    return write_csv(raw_dir / 'fire-incidents.csv',
+                     ['Incident Number', 'Address', 'Incident Date', 'ZIP Code', 'Primary Situation'], rows)
+
+
+def read_text(path):
+    with open(path) as f:
+        return f.read()
+
+
+class TestProcessCsvStreaming:
+    """Test cases for process_csv_streaming function"""
+
+    def test_matches_whole_file_processing(self, tmp_path, items_csv, ignore_file):
+        """Test chunks smaller than the file give the same output as loading it whole"""
+        streamed_path = process_csv_streaming(items_csv, str(tmp_path / 'streamed'), ignore_file, chunksize=4)
+        whole_path = process_csv_with_ignore(items_csv, str(tmp_path / 'whole'), ignore_file)
+        lines = read_text(streamed_path).splitlines()
+
+        # Ignored and 95%-empty columns are dropped, even though 'sparse'
+        # has a value in one of the chunks
+        assert lines[0] == 'id,name,value,count'
+        # The all-empty row is dropped; integers with a missing value stay integers
+        assert len(lines) == 21
+        assert lines[9:11] == ['8,item 8,8.5,24', '9,item 9,9.5,']
+        assert read_text(streamed_path) == read_text(whole_path)
+
+    def test_dates_and_derived_columns_match(self, tmp_path, fire_incidents_csv, ignore_file):
+        """Test parsed dates, ZIP codes and derived columns are written the same way in both modes"""
+        streamed_path = process_csv_streaming(fire_incidents_csv, str(tmp_path / 'streamed'), ignore_file, chunksize=3)
+        whole_path = process_csv_with_ignore(fire_incidents_csv, str(tmp_path / 'whole'), ignore_file)
+        streamed = read_text(streamed_path)
+
+        assert '2024-01-01 00:00:00,94110,' in streamed
+        assert read_text(whole_path) == streamed
+
+
+class TestLoadDdlSchema:
+    """Test cases for load_ddl_schema function"""
+
+    def test_parses_tables(self, ddl_schema):
+        """Test columns are mapped to SQLite types and primary keys collected"""
+        assert ddl_schema['widgets'] == {
+            'columns': {'widget_id': 'TEXT', 'price': 'REAL', 'in_stock': 'TEXT', 'made_on': 'TIMESTAMP'},
+            'primary_key': ['widget_id'],
+        }
+        # Constraint lines are not columns
+        assert ddl_schema['widget_parts'] == {
+            'columns': {'widget_id': 'TEXT', 'part_number': 'INTEGER'},
+            'primary_key': ['widget_id', 'part_number'],
+        }
+
+    def test_missing_file(self, tmp_path):
+        """Test a missing DDL file gives an empty schema"""
+        assert load_ddl_schema(str(tmp_path / 'missing.sql')) == {}
+
+
+class TestInferColumnType:
+    """Test cases for infer_column_type function"""
+
+    @pytest.mark.parametrize('values, expected', [
+        (['1', '-20', ''], 'INTEGER'),
+        (['1', '2.5', '.5', '1e3'], 'REAL'),
+        (['2024-01-05', '2024-01-05T13:45:00', '2024-01-05 13:45:00.123+00:00'], 'TIMESTAMP'),
+        (['1', 'abc'], 'TEXT'),
+        (['', ''], 'TEXT'),
+    ])
+    def test_types(self, values, expected):
+        """Test every non-empty sample value must match for a type to be chosen"""
+        assert infer_column_type(values) == expected
+
+
+class TestCsvToSqliteTable:
+    """Test cases for csv_to_sqlite_table function"""
+
+    def test_types_nulls_and_unique_key(self, tmp_path, ddl_schema):
+        """Test DDL and inferred column types, empty fields as NULL and a UNIQUE key index"""
+        csv_path = write_csv(tmp_path / 'widgets.csv', ['Widget ID', 'Price', 'Count', 'Weight', 'Seen At', 'Note'], [
+            ['007', '9.50', '3', '1.25', '2024-01-05 13:45:00', 'first'],
+            ['008', '', '', '', '', ''],
+        ])
+        conn = sqlite3.connect(':memory:')
+        table_name = csv_to_sqlite_table(csv_path, conn, ddl_schema=ddl_schema)
+        rows = conn.execute(f'SELECT * FROM "{table_name}" ORDER BY rowid').fetchall()
+
+        assert table_name == 'widgets'
+        assert column_types(conn, table_name) == {
+            'Widget ID': 'TEXT', 'Price': 'REAL', 'Count': 'INTEGER',
+            'Weight': 'REAL', 'Seen At': 'TIMESTAMP', 'Note': 'TEXT',
+        }
+        # TEXT keeps the key's leading zeros; REAL and INTEGER store numbers
+        assert rows[0] == ('007', 9.5, 3, 1.25, '2024-01-05 13:45:00', 'first')
+        assert rows[1] == ('008', None, None, None, None, None)
+        assert pk_index_unique(conn, table_name) == 1
+
+    def test_repeated_keys_get_non_unique_index(self, tmp_path, ddl_schema):
+        """Test a key that repeats in the data falls back to a non-unique index instead of failing"""
+        csv_path = write_csv(tmp_path / 'widgets.csv', ['Widget ID', 'Price'], [
+            ['1', '1.00'],
+            ['1', '2.00'],
+        ])
+        conn = sqlite3.connect(':memory:')
+        table_name = csv_to_sqlite_table(csv_path, conn, ddl_schema=ddl_schema)
+
+        assert conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0] == 2
+        assert pk_index_unique(conn, table_name) == 0
+
+
+class TestProcessDirectory:
+    """Test cases for process_directory function"""
+
+    def test_parallel_workers_match_serial(self, tmp_path, ignore_file):
+        """Test cleaning the CSVs in worker processes builds the same tables as cleaning them in turn"""
+        raw_dir = write_sources(tmp_path / 'raw')
+        serial_db = build_database(tmp_path, raw_dir, 'serial', workers=1)
+        parallel_db = build_database(tmp_path, raw_dir, 'parallel', workers=2)
+        serial = snapshot(serial_db)
+        parallel = snapshot(parallel_db)
+        conn = sqlite3.connect(parallel_db)
+        columns = column_types(conn, 'sfpd_incidents')
+        counters = conn.execute('SELECT source_table FROM key_sequences ORDER BY source_table').fetchall()
+        conn.close()
+
+        assert len(serial['sfpd_incidents']) == 4
+        assert len(serial['311_service_requests']) == 2
+        assert len(serial[INCIDENTS_TABLE]) == 6
+        assert 'descript' not in columns
+        assert columns['incident_hour'] == 'INTEGER'
+        # The API's key counters are set up at build time, not on the first POST
+        assert counters == [('311_service_requests',), ('sfpd_incidents',)]
+        assert {name: len(rows) for name, rows in parallel.items()} == {name: len(rows) for name, rows in serial.items()}
+        assert parallel == serial
+
+
+class TestIncrementalLoad:
+    """Test cases for process_directory(incremental=True)"""
+
+    def test_unchanged_sources_skipped(self, tmp_path, ignore_file):
+        """Test a second run skips sources whose fingerprint hasn't changed"""
+        raw_dir = write_sources(tmp_path / 'raw')
+        build_database(tmp_path, raw_dir, 'incremental', incremental=True)
+        result = process_directory(raw_dir, str(tmp_path / 'incremental_processed'), ignore_file,
+                                   create_sql_databases=True, sql_db_dir=str(tmp_path / 'incremental_db'),
+                                   incremental=True)
+
+        assert result['tables'] == []
+        assert sorted(result['skipped_tables']) == ['311_service_requests', 'sfpd_incidents']
+
+    def test_changed_rows_merged_and_api_rows_kept(self, tmp_path, ignore_file):
+        """Test changed rows are updated, new keys inserted and rows created through the API left alone"""
+        raw_dir = write_sources(tmp_path / 'raw')
+        db_path = build_database(tmp_path, raw_dir, 'incremental', incremental=True)
+
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO sfpd_incidents (unique_key, category, address, pddistrict, timestamp)
+            VALUES ('api-1', 'Arson', '9 Api St', 'Mission', '2024-01-09 10:00:00')
+        ''')
+        record_incident(cursor, 'sfpd_incidents', cursor.lastrowid)
+        conn.commit()
+        conn.close()
+
+        write_sources(tmp_path / 'raw', sfpd_rows=CHANGED_SFPD_ROWS)
+        result = process_directory(raw_dir, str(tmp_path / 'incremental_processed'), ignore_file,
+                                   create_sql_databases=True, sql_db_dir=str(tmp_path / 'incremental_db'),
+                                   incremental=True)
+
+        conn = sqlite3.connect(db_path)
+        categories = dict(conn.execute('SELECT pdid, category FROM sfpd_incidents'))
+        api_incidents = conn.execute(
+            f"SELECT COUNT(*) FROM {INCIDENTS_TABLE} WHERE address = '9 Api St'"
+        ).fetchone()[0]
+        watermarks = {row[0]: row[1:] for row in conn.execute(
+            'SELECT source_table, max_key, max_timestamp FROM ingest_watermarks'
+        )}
+        conn.close()
+
+        assert result['tables'] == ['sfpd_incidents']
+        assert result['skipped_tables'] == ['311_service_requests']
+        assert categories == {'101': 'Larceny', '102': 'Assault', '201': 'Robbery', '301': 'Vandalism',
+                              '1001': 'Burglary', None: 'Arson'}
+        assert api_incidents == 1
+        # Numeric keys and mixed-format times compare by value, not as text
+        assert watermarks['sfpd_incidents'] == ('1001', '2024-02-01 09:00:00')
+        assert watermarks['311_service_requests'] == ('5002', '01/06/2024 07:45:00 PM')
+
+    def test_merge_matches_fresh_build(self, tmp_path, ignore_file):
+        """Test merging changed sources gives the same source and derived tables as rebuilding"""
+        raw_dir = write_sources(tmp_path / 'raw')
+        incremental_db = build_database(tmp_path, raw_dir, 'incremental', incremental=True)
+        write_sources(tmp_path / 'raw', sfpd_rows=CHANGED_SFPD_ROWS,
+                      requests_rows=REQUESTS_ROWS[:1] + [REQUESTS_ROWS[1][:2] + ['Graffiti', 'Mural'] + REQUESTS_ROWS[1][4:]])
+        build_database(tmp_path, raw_dir, 'incremental', incremental=True)
+        fresh_db = build_database(tmp_path, raw_dir, 'fresh')
+
+        merged = snapshot(incremental_db)
+        fresh = snapshot(fresh_db)
+
+        assert len(fresh[INCIDENTS_TABLE]) == 7
+        for table in fresh:
+            assert merged[table] == fresh[table], table
+
+    def test_missing_key_keeps_api_rows(self, tmp_path, ignore_file):
+        """Test a source that lost its key columns fails instead of reloading over rows created through the API"""
+        raw_dir = write_sources(tmp_path / 'raw')
+        db_path = build_database(tmp_path, raw_dir, 'incremental', incremental=True)
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO sfpd_incidents (unique_key, category, address, pddistrict, timestamp)
+            VALUES ('api-1', 'Arson', '9 Api St', 'Mission', '2024-01-09 10:00:00')
+        ''')
+        record_incident(cursor, 'sfpd_incidents', cursor.lastrowid)
+        conn.commit()
+        conn.close()
+
+        # The key column is now ignored, which also changes the fingerprint
+        with open(ignore_file, 'w') as f:
+            f.write('sfpd_incidents.csv:\nIgnore: descript, pdid\n')
+        with pytest.raises(ValueError, match='natural key'):
+            build_database(tmp_path, raw_dir, 'incremental', incremental=True)
+
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute('SELECT COUNT(*) FROM sfpd_incidents').fetchone()[0]
+        api_rows = conn.execute("SELECT COUNT(*) FROM sfpd_incidents WHERE unique_key = 'api-1'").fetchone()[0]
+        api_incidents = conn.execute(
+            f"SELECT COUNT(*) FROM {INCIDENTS_TABLE} WHERE address = '9 Api St'"
+        ).fetchone()[0]
+        conn.close()
+
+        assert (rows, api_rows, api_incidents) == (5, 1, 1)
@@ -1,5 +1,6 @@
 import pytest
 import json
+import sqlite3
 import sys
 import os
 from unittest.mock import patch, Mock
@@ -8,6 +9,21 @@ from unittest.mock import patch, Mock
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 
+class TestPrepareDatabase:
+    """Test cases for building the incidents table before the first request"""
+
+    def test_builds_missing_incidents_table(self, client, pooled_test_db):
+        """Test a database without the incidents table is served once it has been built"""
+        conn = sqlite3.connect(pooled_test_db)
+        conn.execute('DROP TABLE incidents')
+        conn.close()
+
+        response = client.get('/api/incidents/timeline')
+
+        assert response.status_code == 200
+        assert json.loads(response.data)['count'] == 4
+
+
 class TestIncidentTimelineEndpoint:
     """Test cases for /api/incidents/timeline endpoint"""
 
@@ -57,6 +73,273 @@ class TestIncidentTimelineEndpoint:
         data = json.loads(response.data)
         assert len(data['data']) <= 5
 
+    def test_get_incident_timeline_ordered_by_time(self, client, mock_db_connection):
+        """Test incident timeline is ordered newest first"""
+        response = client.get('/api/incidents/timeline')
+
+        data = json.loads(response.data)
+        times = [item['incident_time'] for item in data['data']]
+        assert times == sorted(times, reverse=True)
+        assert data['count'] == 4
+
+    def test_get_incident_timeline_includes_created_incident(self, client, mock_db_connection):
+        """Test incidents created through the POST endpoints appear in the timeline"""
+        payload = {
+            'category': 'Arson',
+            'descript': 'Arson of a vehicle',
+            'address': '1 Timeline St',
+            'pddistrict': 'Bayview',
+            'timestamp': '2030-01-01 00:00:00'
+        }
+        client.post('/api/sfpd_incidents', data=json.dumps(payload), content_type='application/json')
+
+        response = client.get('/api/incidents/timeline?source=sfpd_incidents&limit=1')
+
+        data = json.loads(response.data)
+        assert data['data'][0]['address'] == '1 Timeline St'
+        assert data['data'][0]['neighborhood'] == 'Bayview'
+
+
+class TestIncidentTimelineSourceList:
+    """Test cases for a comma-separated source list on /api/incidents/timeline"""
+
+    SOURCES = 'sfpd_incidents,311_service_requests'
+
+    def test_source_list_matches_unfiltered_timeline(self, client, mock_db_connection):
+        """Test merged sources return the rows of the full timeline from those sources, in order"""
+        everything = json.loads(client.get('/api/incidents/timeline').data)['data']
+        expected = [item for item in everything if item['source_table'] in self.SOURCES.split(',')]
+        data = json.loads(client.get(f'/api/incidents/timeline?source={self.SOURCES}').data)
+
+        assert data['data'] == expected
+        assert data['sources'] == {'sfpd_incidents': 2, '311_service_requests': 2}
+
+    def test_source_list_pages_and_streams(self, client, mock_db_connection):
+        """Test limited pages and streamed responses of merged sources agree"""
+        full = json.loads(client.get(f'/api/incidents/timeline?source={self.SOURCES}').data)['data']
+        first = json.loads(client.get(f'/api/incidents/timeline?source={self.SOURCES}&limit=3').data)
+        second = json.loads(client.get(
+            f"/api/incidents/timeline?source={self.SOURCES}&limit=3&cursor={first['next_cursor']}"
+        ).data)
+        streamed = json.loads(client.get(
+            f'/api/incidents/timeline?source={self.SOURCES}&limit=3&prioritize_coords=true&stream=true'
+        ).data)
+
+        assert first['data'] + second['data'] == full
+        assert second['next_cursor'] is None
+        assert streamed['count'] == 3
+
+    def test_source_list_with_invalid_source(self, client, mock_db_connection):
+        """Test a list naming an unknown source is rejected"""
+        response = client.get('/api/incidents/timeline?source=sfpd_incidents,invalid_source')
+
+        assert response.status_code == 400
+        assert json.loads(response.data)['error'] == 'Invalid source table'
+
+
+class TestIncidentTimelinePagination:
+    """Test cases for cursor pagination on /api/incidents/timeline"""
+
+    def test_next_cursor_pages_through_all_rows(self, client, mock_db_connection):
+        """Test following next_cursor returns every row exactly once, in order"""
+        seen = []
+        url = '/api/incidents/timeline?limit=3'
+        while True:
+            data = json.loads(client.get(url).data)
+            seen.extend(data['data'])
+            if not data['next_cursor']:
+                break
+            url = f"/api/incidents/timeline?limit=3&cursor={data['next_cursor']}"
+
+        full = json.loads(client.get('/api/incidents/timeline').data)
+        assert seen == full['data']
+
+    def test_next_cursor_with_source_and_coords(self, client, mock_db_connection):
+        """Test pagination combined with source filter and coordinate priority"""
+        base = '/api/incidents/timeline?source=sfpd_incidents&prioritize_coords=true&limit=1'
+        first = json.loads(client.get(base).data)
+        second = json.loads(client.get(f"{base}&cursor={first['next_cursor']}").data)
+
+        assert first['data'][0]['incident_time'] > second['data'][0]['incident_time']
+        assert second['data'][0]['source_table'] == 'sfpd_incidents'
+
+    def test_no_next_cursor_without_limit(self, client, mock_db_connection):
+        """Test next_cursor is null when the whole result is returned"""
+        data = json.loads(client.get('/api/incidents/timeline').data)
+
+        assert data['next_cursor'] is None
+
+    def test_invalid_cursor(self, client, mock_db_connection):
+        """Test a malformed cursor is rejected"""
+        response = client.get('/api/incidents/timeline?limit=2&cursor=not-a-cursor')
+
+        assert response.status_code == 400
+        assert json.loads(response.data)['error'] == 'Invalid cursor'
+
+
+class TestBoundingBoxFilter:
+    """Test cases for the bbox parameter"""
+
+    # Holds 123 Main St, 456 Market St and 321 Pine St but not 789 Oak St
+    BBOX = '-122.42,37.77,-122.40,37.79'
+
+    def test_timeline_bbox(self, client, mock_db_connection):
+        """Test the timeline only returns incidents inside the box"""
+        data = json.loads(client.get(f'/api/incidents/timeline?bbox={self.BBOX}').data)
+
+        assert sorted(item['address'] for item in data['data']) == ['123 Main St', '321 Pine St', '456 Market St']
+
+    def test_timeline_bbox_with_limit(self, client, mock_db_connection):
+        """Test a limited, paged bbox query returns the same rows as the full one"""
+        full = json.loads(client.get(f'/api/incidents/timeline?bbox={self.BBOX}').data)
+        first = json.loads(client.get(f'/api/incidents/timeline?bbox={self.BBOX}&limit=2').data)
+        second = json.loads(client.get(
+            f"/api/incidents/timeline?bbox={self.BBOX}&limit=2&cursor={first['next_cursor']}"
+        ).data)
+
+        assert first['data'] + second['data'] == full['data']
+
+    def test_feed_and_neighborhoods_bbox(self, client, mock_db_connection):
+        """Test the feed and the neighborhood ranking honour the box"""
+        feed = json.loads(client.get(f'/api/incidents/feed?bbox={self.BBOX}').data)
+        top = json.loads(client.get(f'/api/neighborhood/top?bbox={self.BBOX}').data)
+
+        assert feed['count'] == 3
+        assert 'Mission' not in [item['neighborhood'] for item in top['data']]
+        assert sum(item['incident_count'] for item in top['data']) == 3
+
+    def test_invalid_bbox(self, client, mock_db_connection):
+        """Test malformed and inverted boxes are rejected"""
+        for bbox in ('1,2,3', 'a,b,c,d', '-122.40,37.77,-122.42,37.79', '-200,0,0,10'):
+            response = client.get(f'/api/incidents/timeline?bbox={bbox}')
+            assert response.status_code == 400
+
+
+class TestIncidentClustersEndpoint:
+    """Test cases for /api/incidents/clusters endpoint"""
+
+    def test_clusters_cover_located_incidents(self, client, mock_db_connection):
+        """Test the cells of a zoomed-out view add up to every incident with coordinates"""
+        response = client.get('/api/incidents/clusters?zoom=10')
+        data = json.loads(response.data)
+
+        assert response.status_code == 200
+        assert data['level'] == 10
+        assert data['total_incidents'] == 4
+        assert data['total_cells'] == len(data['data']) < 4
+        for cell in data['data']:
+            min_lon, min_lat, max_lon, max_lat = cell['bounds']
+            assert min_lon <= cell['longitude'] <= max_lon
+            assert min_lat <= cell['latitude'] <= max_lat
+
+    def test_clusters_breakdown(self, client, mock_db_connection):
+        """Test source and type breakdowns add up to the cell counts"""
+        data = json.loads(client.get('/api/incidents/clusters?zoom=15&breakdown=source,type').data)
+
+        assert data['total_cells'] == 4
+        for cell in data['data']:
+            assert sum(cell['sources'].values()) == cell['count']
+            assert sum(cell['types'].values()) == cell['count']
+        sources = {}
+        for cell in data['data']:
+            for source, count in cell['sources'].items():
+                sources[source] = sources.get(source, 0) + count
+        assert sources == {'311_service_requests': 2, 'sfpd_incidents': 2}
+
+    def test_clusters_bbox_and_source(self, client, mock_db_connection):
+        """Test only cells overlapping the box, of the requested source, are returned"""
+        data = json.loads(client.get(
+            '/api/incidents/clusters?zoom=15&bbox=-122.43,37.76,-122.42,37.77&source=sfpd_incidents'
+        ).data)
+
+        assert data['total_incidents'] == 1
+        assert data['data'][0]['latitude'] == pytest.approx(37.7649)
+
+    def test_clusters_invalid_params(self, client, mock_db_connection):
+        """Test a missing zoom, unknown breakdown or source is rejected"""
+        for query in ('', 'zoom=abc', 'zoom=30', 'zoom=12&breakdown=hour', 'zoom=12&source=invalid'):
+            response = client.get(f'/api/incidents/clusters?{query}')
+            assert response.status_code == 400
+
+
+class TestIncidentTimelineStreaming:
+    """Test cases for streamed responses on /api/incidents/timeline"""
+
+    def test_streamed_json_matches_buffered(self, client, mock_db_connection):
+        """Test stream=true returns the same document as the buffered response"""
+        buffered = json.loads(client.get('/api/incidents/timeline?limit=3').data)
+        response = client.get('/api/incidents/timeline?limit=3&stream=true')
+
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert json.loads(response.data) == buffered
+
+    def test_ndjson(self, client, mock_db_connection):
+        """Test format=ndjson returns one incident per line and a final summary line"""
+        buffered = json.loads(client.get('/api/incidents/timeline?source=sfpd_incidents').data)
+        response = client.get('/api/incidents/timeline?source=sfpd_incidents&format=ndjson')
+        lines = [json.loads(line) for line in response.data.decode().splitlines()]
+
+        assert response.mimetype == 'application/x-ndjson'
+        assert lines[:-1] == buffered['data']
+        assert lines[-1] == {'summary': {
+            'count': buffered['count'],
+            'sources': buffered['sources'],
+            'next_cursor': buffered['next_cursor']
+        }}
+
+    def test_streamed_pages(self, client, mock_db_connection):
+        """Test next_cursor from a streamed page continues where it ended"""
+        first = json.loads(client.get('/api/incidents/timeline?limit=2&stream=true').data)
+        second = json.loads(client.get(f"/api/incidents/timeline?limit=2&stream=true&cursor={first['next_cursor']}").data)
+        full = json.loads(client.get('/api/incidents/timeline').data)
+
+        assert first['data'] + second['data'] == full['data'][:4]
+
+    def test_streamed_in_batches(self, client, mock_db_connection):
+        """Test rows are fetched and sent in batches"""
+        with patch('streaming.STREAM_BATCH_SIZE', 1):
+            response = client.get('/api/incidents/timeline?limit=3&stream=true')
+            chunks = list(response.response)
+
+        assert len(chunks) == 5
+        assert json.loads(b''.join(chunks))['count'] == 3
+
+    def test_invalid_format(self, client, mock_db_connection):
+        """Test an unknown format is rejected"""
+        response = client.get('/api/incidents/timeline?format=xml')
+
+        assert response.status_code == 400
+
+
+class TestIncidentFeedEndpoint:
+    """Test cases for /api/incidents/feed endpoint"""
+
+    def test_get_incident_feed_success(self, client, mock_db_connection):
+        """Test the feed returns the map columns, newest first"""
+        response = client.get('/api/incidents/feed')
+        data = json.loads(response.data)
+
+        assert response.status_code == 200
+        assert data['count'] == 4
+        assert set(data['data'][0]) == {'source_table', 'incident_time', 'incident_type', 'latitude', 'longitude'}
+        times = [item['incident_time'] for item in data['data']]
+        assert times == sorted(times, reverse=True)
+
+    def test_get_incident_feed_time_range(self, client, mock_db_connection):
+        """Test since/until bound incident_time"""
+        response = client.get('/api/incidents/feed?since=2024-01-02&until=2024-01-03&format=ndjson')
+        lines = [json.loads(line) for line in response.data.decode().splitlines()]
+
+        assert [line['incident_time'] for line in lines[:-1]] == ['2024-01-02 11:00:00']
+        assert lines[-1]['summary']['sources'] == {'311_service_requests': 1}
+
+    def test_get_incident_feed_invalid_params(self, client, mock_db_connection):
+        """Test invalid source, time and format are rejected"""
+        for query in ('source=invalid_source', 'since=yesterday', 'format=csv'):
+            response = client.get(f'/api/incidents/feed?{query}')
+            assert response.status_code == 400
+
 
 class TestNeighborhoodTopEndpoint:
     """Test cases for /api/neighborhood/top endpoint"""
@@ -94,6 +377,35 @@ class TestNeighborhoodDangerAnalysisEndpoint:
         assert 'summary' in data
         assert isinstance(data['data'], list)
 
+    def test_get_danger_analysis_with_filters(self, client, mock_db_connection):
+        """Test danger analysis filters and percentages computed from the rollup"""
+        response = client.get('/api/neighborhoods/danger-analysis?time_period=Afternoon&day_type=Weekday')
+
+        data = json.loads(response.data)
+        assert [item['neighborhood'] for item in data['data']] == ['Mission', 'Tenderloin']
+        for item in data['data']:
+            assert item['time_period'] == 'Afternoon'
+            assert item['incident_count'] == 1
+            assert item['incident_types'] == 1
+            assert item['pct_of_neighborhood_incidents'] == 100.0
+
+    def test_get_danger_analysis_counts_created_incident(self, client, mock_db_connection):
+        """Test incidents created through the POST endpoints update the analysis"""
+        payload = {
+            'category': 'Assault',
+            'descript': 'Battery',
+            'address': '1 Test St',
+            'pddistrict': 'Mission',
+            'timestamp': '2024-01-02 12:30:00'
+        }
+        client.post('/api/sfpd_incidents', data=json.dumps(payload), content_type='application/json')
+
+        response = client.get('/api/neighborhoods/danger-analysis?neighborhood=Mission')
+
+        data = json.loads(response.data)
+        assert data['data'][0]['incident_count'] == 2
+        assert data['data'][0]['incident_types'] == 2
+
 
 class TestIncidentTypeBreakdownEndpoint:
     """Test cases for /stats/incident_type_breakdown endpoint"""
@@ -156,6 +468,33 @@ class TestFireIncompleteInspectionsEndpoint:
             assert isinstance(data, list)
 
 
+class TestMonthlyIncidentsEndpoint:
+    """Test cases for /stats/monthly_incidents endpoint"""
+
+    def test_monthly_counts(self, client, mock_db_connection):
+        """Test crime and fire counts are keyed by YYYY-MM"""
+        response = client.get('/stats/monthly_incidents')
+
+        assert response.status_code == 200
+        assert json.loads(response.data) == {
+            '2024-01': {'crime_cnt': 2, 'fire_cnt': 0, 'total_incidents': 2}
+        }
+
+    def test_new_incident_counted_in_its_month(self, client, mock_db_connection):
+        """Test a created fire incident is counted in its month, whatever its date format"""
+        payload = {
+            'Primary Situation': 'Structure Fire',
+            'Address': '456 Fire St',
+            'Analysis Neighborhood': 'Mission',
+            'Incident Date': '02/15/2024'
+        }
+        client.post('/api/fire-incidents', data=json.dumps(payload), content_type='application/json')
+
+        response = client.get('/stats/monthly_incidents')
+
+        assert json.loads(response.data)['2024-02'] == {'crime_cnt': 0, 'fire_cnt': 1, 'total_incidents': 1}
+
+
 class TestFireTopNeighborhoodsEndpoint:
     """Test cases for /api/fire/top-neighborhoods endpoint"""
 
@@ -169,6 +508,25 @@ class TestFireTopNeighborhoodsEndpoint:
         assert 'summary' in data
         assert isinstance(data['data'], list)
 
+    def test_ranked_by_year(self, client, mock_db_connection):
+        """Test created fire incidents are ranked within the year of their incident date"""
+        for neighborhood, date in [('Mission', '2023-05-01'), ('Mission', '2024-03-01'),
+                                   ('Mission', '2024-04-01'), ('Bayview', '2024-04-02')]:
+            payload = {
+                'Primary Situation': 'Structure Fire',
+                'Address': '456 Fire St',
+                'Analysis Neighborhood': neighborhood,
+                'Incident Date': date
+            }
+            client.post('/api/fire-incidents', data=json.dumps(payload), content_type='application/json')
+
+        response = client.get('/api/fire/top-neighborhoods?years=2')
+
+        data = json.loads(response.data)['data']
+        assert [(row['year'], row['rank'], row['neighborhood'], row['total_fires']) for row in data] == [
+            (2024, 1, 'Mission', 2), (2024, 2, 'Bayview', 1), (2023, 1, 'Mission', 1)
+        ]
+
     def test_get_fire_top_neighborhoods_with_limit(self, client, mock_db_connection):
         """Test fire top neighborhoods with limit parameter"""
         response = client.get('/api/fire/top-neighborhoods?limit=5')
@@ -218,6 +576,23 @@ class TestCreate311RequestsEndpoint:
             data = json.loads(response.data)
             assert 'message' in data or 'success' in data
 
+    def test_response_has_time_features(self, client, mock_db_connection):
+        """Test the created row is returned with the time features of its created_date"""
+        payload = {
+            'category': 'Street Cleaning',
+            'complaint_type': 'Blocked Street',
+            'descriptor': 'Street blocked by debris',
+            'incident_address': '123 Test St',
+            'neighborhood': 'Test District'
+        }
+
+        response = client.post('/api/311-requests', data=json.dumps(payload), content_type='application/json')
+
+        assert response.status_code == 201
+        data = json.loads(response.data)['data']
+        assert data['incident_year'] == int(data['created_date'][:4])
+        assert data['incident_hour'] == int(data['created_date'][11:13])
+
     def test_create_311_request_missing_required_field(self, client):
         """Test 311 request creation with missing required field"""
         payload = {
@@ -238,7 +613,7 @@ class TestCreate311RequestsEndpoint:
 
     def test_create_311_request_without_geocoding(self, client, mock_db_connection):
         """Test 311 request creation when geocoding fails"""
-        with patch('queries.geocode_address', return_value=(None, None)):
+        with patch('queries.nominatim_geocode', return_value=(None, None)):
             payload = {
                 'category': 'Street Cleaning',
                 'complaint_type': 'Blocked Street',
@@ -281,6 +656,24 @@ class TestCreateSfpdIncidentEndpoint:
             data = json.loads(response.data)
             assert 'message' in data or 'success' in data
 
+    def test_response_has_time_features(self, client, mock_db_connection):
+        """Test the created row is returned with the time features derived from its timestamp"""
+        payload = {
+            'category': 'Larceny',
+            'descript': 'Theft from vehicle',
+            'address': '789 Test St',
+            'pddistrict': 'Mission',
+            'timestamp': '2024-01-01 10:00:00'
+        }
+
+        response = client.post('/api/sfpd_incidents', data=json.dumps(payload), content_type='application/json')
+
+        assert response.status_code == 201
+        data = json.loads(response.data)['data']
+        # 2024-01-01 was a Monday (weekday 1, Sunday is 0)
+        assert (data['incident_epoch'], data['incident_hour'], data['incident_weekday'],
+                data['incident_year_month'], data['incident_year']) == (1704103200, 10, 1, 202401, 2024)
+
     def test_create_sfpd_incident_missing_required_field(self, client):
         """Test SFPD incident creation with missing required field"""
         payload = {
@@ -325,6 +718,38 @@ class TestCreateFireIncidentEndpoint:
             data = json.loads(response.data)
             assert 'message' in data or 'success' in data
 
+    def test_response_has_time_features(self, client, mock_db_connection):
+        """Test the created row is returned with the time features derived from its Incident Date"""
+        payload = {
+            'Primary Situation': 'Structure Fire',
+            'Address': '456 Fire St',
+            'Analysis Neighborhood': 'Downtown',
+            'Incident Date': '2024-01-06'
+        }
+
+        response = client.post('/api/fire-incidents', data=json.dumps(payload), content_type='application/json')
+
+        assert response.status_code == 201
+        data = json.loads(response.data)['data']
+        assert (data['incident_hour'], data['incident_weekday'], data['incident_year_month'],
+                data['incident_year']) == (0, 6, 202401, 2024)
+
+    def test_create_fire_incident_uses_zip_centroid(self, client, mock_db_connection):
+        """Test a new fire incident gets ZIP centroid coordinates in the timeline"""
+        payload = {
+            'Primary Situation': 'Structure Fire',
+            'Address': '456 Fire St',
+            'Analysis Neighborhood': 'Mission',
+            'Incident Date': '2030-01-01 12:00:00',
+            'ZIP Code': '94110'
+        }
+        client.post('/api/fire-incidents', data=json.dumps(payload), content_type='application/json')
+
+        response = client.get('/api/incidents/timeline?source=fire_incidents')
+
+        item = json.loads(response.data)['data'][0]
+        assert (item['latitude'], item['longitude']) == (37.7487, -122.4160)
+
     def test_create_fire_incident_missing_required_field(self, client):
         """Test fire incident creation with missing required field"""
         payload = {
@@ -374,3 +799,40 @@ class TestCORS:
         response = client.options('/api/incidents/timeline')
 
         assert response.status_code in [200, 204]
+
+
+class TestInternalEndpoints:
+    """Test cases for restricting /metrics and /debug/* to local clients"""
+
+    @pytest.mark.parametrize('path', ['/metrics', '/debug/slow-queries', '/debug/db-pool', '/debug/write-queue'])
+    def test_local_client_allowed(self, client, path):
+        """Test local clients can read the internal endpoints"""
+        response = client.get(path)
+
+        assert response.status_code == 200
+
+    @pytest.mark.parametrize('path', ['/metrics', '/debug/slow-queries', '/debug/geocoding', '/debug/response-cache'])
+    def test_remote_client_refused(self, client, path):
+        """Test remote clients get 403 from the internal endpoints"""
+        response = client.get(path, environ_base={'REMOTE_ADDR': '203.0.113.7'})
+
+        assert response.status_code == 403
+
+    def test_proxied_request_refused(self, client):
+        """Test a request forwarded by a local proxy counts as remote"""
+        response = client.get('/debug/slow-queries', headers={'X-Forwarded-For': '203.0.113.7'})
+
+        assert response.status_code == 403
+
+    def test_allowed_client(self, client):
+        """Test an address added to INTERNAL_ENDPOINT_CLIENTS, e.g. a Prometheus server, is let in"""
+        with patch('queries.INTERNAL_ENDPOINT_CLIENTS', {'127.0.0.1', '10.0.0.5'}):
+            response = client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.5'})
+
+        assert response.status_code == 200
+
+    def test_api_routes_unaffected(self, client, mock_db_connection):
+        """Test remote clients still reach the API"""
+        response = client.get('/api/incidents/timeline', environ_base={'REMOTE_ADDR': '203.0.113.7'})
+
+        assert response.status_code == 200
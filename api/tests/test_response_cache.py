@@ -0,0 +1,113 @@
+import pytest
+import json
+import sys
+import os
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from response_cache import ResponseCache
+
+
+class TestResponseCache:
+    """Test cases for ResponseCache"""
+
+    def test_lru_eviction(self):
+        """Test the least recently used entry is evicted first"""
+        cache = ResponseCache(max_entries=2)
+        cache.set('a', b'1')
+        cache.set('b', b'2')
+        cache.get('a')
+        cache.set('c', b'3')
+
+        assert cache.get('b') is None
+        assert cache.get('a')[0] == b'1'
+        assert cache.stats()['evictions'] == 1
+
+    def test_ttl_expiry(self):
+        """Test entries expire after their TTL"""
+        cache = ResponseCache(ttl=10)
+        with patch('response_cache.time.monotonic', return_value=100.0):
+            cache.set('a', b'1')
+        with patch('response_cache.time.monotonic', return_value=109.0):
+            assert cache.get('a') is not None
+        with patch('response_cache.time.monotonic', return_value=110.0):
+            assert cache.get('a') is None
+
+        assert cache.stats()['expired'] == 1
+
+    def test_bump_versions(self):
+        """Test bumping a table only changes that table's version"""
+        cache = ResponseCache()
+        before = cache.versions(['sfpd_incidents', 'fire_incidents'])
+        cache.bump('sfpd_incidents')
+
+        assert before == (0, 0)
+        assert cache.versions(['sfpd_incidents', 'fire_incidents']) == (1, 0)
+
+
+class TestCachedEndpoints:
+    """Test cases for the cached Query 4-10 endpoints"""
+
+    def test_second_request_is_served_from_cache(self, client, mock_db_connection):
+        """Test a repeated request doesn't touch the database"""
+        first = client.get('/stats/top_crime_categories?limit=5')
+        calls = mock_db_connection.call_count
+        second = client.get('/stats/top_crime_categories?limit=5')
+
+        assert first.headers['X-Cache'] == 'MISS'
+        assert second.headers['X-Cache'] == 'HIT'
+        assert second.data == first.data
+        assert mock_db_connection.call_count == calls
+
+    def test_query_args_are_normalized(self, client, mock_db_connection):
+        """Test argument order doesn't create separate entries"""
+        client.get('/api/fire/top-neighborhoods?limit=5&years=2')
+        response = client.get('/api/fire/top-neighborhoods?years=2&limit=5')
+
+        assert response.headers['X-Cache'] == 'HIT'
+
+    def test_if_none_match(self, client, mock_db_connection):
+        """Test a matching ETag is answered with 304 and no body"""
+        first = client.get('/stats/incident_type_breakdown')
+        etag = first.headers['ETag']
+        response = client.get('/stats/incident_type_breakdown', headers={'If-None-Match': etag})
+
+        assert response.status_code == 304
+        assert response.data == b''
+
+    def test_errors_are_not_cached(self, client, mock_db_connection):
+        """Test 400 responses are recomputed every time"""
+        client.get('/stats/top_crime_categories?limit=0')
+        response = client.get('/stats/top_crime_categories?limit=0')
+
+        assert response.status_code == 400
+        assert 'X-Cache' not in response.headers
+
+    def test_post_invalidates_dependent_endpoints(self, client, mock_db_connection, mock_geolocator):
+        """Test a new SFPD incident is reflected in the cached category counts"""
+        before = json.loads(client.get('/stats/top_crime_categories').data)
+        payload = {
+            'category': 'Arson',
+            'descript': 'Arson of a vehicle',
+            'address': '1 Test St',
+            'pddistrict': 'Bayview'
+        }
+        client.post('/api/sfpd_incidents', data=json.dumps(payload), content_type='application/json')
+        response = client.get('/stats/top_crime_categories')
+        after = json.loads(response.data)
+
+        assert response.headers['X-Cache'] == 'MISS'
+        assert 'Arson' not in before['top_crime_categories']
+        assert after['top_crime_categories']['Arson'] == 1
+
+    def test_cache_stats_endpoint(self, client, mock_db_connection):
+        """Test /debug/response-cache returns the cache counters"""
+        client.get('/stats/top_crime_categories')
+        client.get('/stats/top_crime_categories')
+        data = json.loads(client.get('/debug/response-cache').data)
+
+        assert data['hits'] == 1
+        assert data['misses'] == 1
+        assert data['entries'] == 1
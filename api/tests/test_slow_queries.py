@@ -0,0 +1,142 @@
+import pytest
+import json
+import sqlite3
+import sys
+import os
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import slow_queries
+from db_pool import PooledConnection
+from slow_queries import explain, plan_problems
+
+
+@pytest.fixture(autouse=True)
+def clear_slow_queries():
+    """Start every test with an empty slow-query log"""
+    slow_queries.log.clear()
+    yield
+    slow_queries.log.clear()
+
+
+@pytest.fixture
+def record_everything():
+    """Record every statement as slow"""
+    with patch.dict(slow_queries.settings, {'threshold_ms': 0}):
+        yield
+
+
+@pytest.fixture
+def timed_conn():
+    conn = sqlite3.connect(':memory:', factory=PooledConnection)
+    slow_queries.track_vm_steps(conn)
+    conn.execute('CREATE TABLE events (id INTEGER PRIMARY KEY, kind TEXT, at TEXT)')
+    conn.executemany('INSERT INTO events (kind, at) VALUES (?, ?)',
+                     [(f'kind{i % 7}', f'2024-01-{i % 28 + 1:02d}') for i in range(2000)])
+    slow_queries.log.clear()
+    yield conn
+    conn.close()
+
+
+class TestExplain:
+    """Test cases for explain and plan_problems functions"""
+
+    def test_full_scans_and_temp_b_trees(self, timed_conn):
+        """Test unindexed filters and sorts are reported, index lookups are not"""
+        plan = explain(timed_conn, 'SELECT kind, COUNT(*) FROM events WHERE at > ? GROUP BY kind ORDER BY 2', ('2024',))
+        problems = plan_problems(plan)
+
+        assert problems['full_scans'] == ['SCAN events']
+        assert len(problems['temp_b_trees']) == 2
+        assert plan_problems(explain(timed_conn, 'SELECT * FROM events WHERE id = ?', (1,))) == {
+            'full_scans': [], 'temp_b_trees': []
+        }
+
+    def test_plan_is_indented_by_depth(self, timed_conn):
+        """Test steps nested under another step are indented"""
+        plan = explain(timed_conn, 'SELECT * FROM events WHERE id IN (SELECT id FROM events WHERE kind = ?)', ('kind1',))
+
+        assert plan[0] == 'SEARCH events USING INTEGER PRIMARY KEY (rowid=?)'
+        assert plan[1] == 'LIST SUBQUERY 1'
+        assert plan[2] == '  SCAN events'
+
+
+class TestSlowQueryLog:
+    """Test cases for recording slow statements"""
+
+    def test_records_statement_until_done(self, timed_conn, record_everything, tmp_path):
+        """Test a slow statement is recorded with its plan and written to the file once fetched"""
+        log_path = tmp_path / 'slow.log'
+        with patch.dict(slow_queries.settings, {'log_path': str(log_path)}):
+            cursor = timed_conn.execute('SELECT * FROM events WHERE kind = ?  ORDER BY at', ('kind3',))
+            first = cursor.fetchmany(10)
+            assert not log_path.exists() or log_path.read_text() == ''
+            rest = cursor.fetchall()
+
+        [record] = slow_queries.log.records()
+        assert record['sql'] == 'SELECT * FROM events WHERE kind = ? ORDER BY at'
+        assert record['parameters'] == ['kind3']
+        assert record['rows'] == len(first) + len(rest) == 286
+        assert record['vm_steps'] > 0
+        assert record['full_scans'] == ['SCAN events']
+        assert record['temp_b_trees'] == ['USE TEMP B-TREE FOR ORDER BY']
+        assert record['route'] is None
+        assert json.loads(log_path.read_text()) == record
+
+    def test_fast_statements_are_not_recorded(self, timed_conn):
+        """Test statements under the threshold are only counted"""
+        timed_conn.execute('SELECT COUNT(*) FROM events').fetchone()
+
+        assert slow_queries.log.records() == []
+        assert slow_queries.log.stats()['statements'] == 1
+
+    def test_disabled(self, timed_conn, record_everything):
+        """Test nothing is timed while the log is disabled"""
+        with patch.dict(slow_queries.settings, {'enabled': False}):
+            timed_conn.execute('SELECT * FROM events').fetchall()
+
+        assert slow_queries.log.stats() == {'statements': 0, 'recorded': 0, 'kept': 0}
+
+    def test_keeps_most_recent(self, timed_conn, record_everything):
+        """Test only the newest max_records records are kept, newest first"""
+        with patch.dict(slow_queries.settings, {'max_records': 2}):
+            for limit in (1, 2, 3):
+                timed_conn.execute('SELECT id FROM events LIMIT ?', (limit,)).fetchall()
+
+        assert [record['parameters'] for record in slow_queries.log.records()] == [[3], [2]]
+
+    def test_log_file_rotates(self, timed_conn, record_everything, tmp_path):
+        """Test the log file is rotated once it reaches max_bytes"""
+        log_path = tmp_path / 'rotated.log'
+        with patch.dict(slow_queries.settings, {'log_path': str(log_path), 'max_bytes': 1000, 'backup_count': 2}):
+            for _ in range(5):
+                timed_conn.execute('SELECT * FROM events WHERE kind = ?', ('kind1',)).fetchall()
+
+        assert log_path.exists()
+        assert (tmp_path / 'rotated.log.1').exists()
+
+
+class TestSlowQueriesEndpoint:
+    """Test cases for /debug/slow-queries"""
+
+    def test_records_request_statements(self, client, pooled_test_db, record_everything):
+        """Test statements executed for a request are recorded with its route and query string"""
+        client.get('/api/neighborhood/top?min_incidents=1')
+        response = client.get('/debug/slow-queries?limit=1')
+        data = json.loads(response.data)
+
+        assert response.status_code == 200
+        assert data['threshold_ms'] == 0
+        [record] = data['data']
+        assert record['route'] == '/api/neighborhood/top'
+        assert record['request'] == 'GET /api/neighborhood/top?min_incidents=1'
+        assert 'HAVING incident_count >= 1' in record['sql']
+        assert isinstance(record['plan'], list) and record['plan']
+
+    def test_invalid_limit(self, client):
+        """Test a non-positive limit is rejected"""
+        response = client.get('/debug/slow-queries?limit=0')
+
+        assert response.status_code == 400
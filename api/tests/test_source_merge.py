@@ -0,0 +1,62 @@
+import pytest
+import sqlite3
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from source_merge import MergedCursor, execute_per_source
+
+
+@pytest.fixture
+def events():
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.execute('CREATE TABLE events (id INTEGER PRIMARY KEY, source_table TEXT, incident_time TEXT)')
+    conn.executemany('INSERT INTO events (source_table, incident_time) VALUES (?, ?)', [
+        ('a', '2024-01-01'), ('b', '2024-01-02'), ('a', '2024-01-03'),
+        ('c', '2024-01-04'), ('b', '2024-01-05'), ('a', '2024-01-05'),
+    ])
+    yield conn
+    conn.close()
+
+
+QUERY = '''
+    SELECT id, source_table, incident_time FROM events
+    WHERE source_table = ? AND incident_time >= ?
+    ORDER BY incident_time DESC, source_table DESC, id DESC
+'''
+SORT_KEY = ['incident_time', 'source_table', 'id']
+
+
+class TestExecutePerSource:
+    """Test cases for execute_per_source function"""
+
+    def test_merged_rows_match_single_query(self, events):
+        """Test the merged branches return the rows of one IN query, in the same order"""
+        expected = [tuple(row) for row in events.execute(
+            "SELECT id, source_table, incident_time FROM events WHERE source_table IN ('a', 'b') "
+            "ORDER BY incident_time DESC, source_table DESC, id DESC"
+        )]
+        cursor = execute_per_source(events, QUERY, ['2024-01-01'], ['a', 'b'], SORT_KEY)
+
+        assert isinstance(cursor, MergedCursor)
+        assert [tuple(row) for row in cursor.fetchall()] == expected
+
+    def test_limit_and_fetchmany(self, events):
+        """Test the merged result stops at the limit and can be read in batches"""
+        cursor = execute_per_source(events, QUERY + ' LIMIT ?', ['2024-01-01', 3], ['a', 'b', 'c'], SORT_KEY, 3)
+
+        assert [row['id'] for row in cursor.fetchmany(2)] == [5, 6]
+        assert [row['id'] for row in cursor.fetchmany(2)] == [4]
+        assert cursor.fetchmany(2) == []
+        assert [column[0] for column in cursor.description] == ['id', 'source_table', 'incident_time']
+        cursor.close()
+
+    def test_single_source_runs_plain_query(self, events):
+        """Test one source is executed directly, without merging"""
+        cursor = execute_per_source(events, QUERY, ['2024-01-01'], ['b'], SORT_KEY)
+
+        assert isinstance(cursor, sqlite3.Cursor)
+        assert [row['id'] for row in cursor.fetchall()] == [5, 2]
@@ -8,26 +8,26 @@ import os
 # Add parent directory to path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from queries import parse_float, geocode_address, get_db_connection
+from queries import parse_float, nominatim_geocode, get_db_connection
 
 
 class TestGeocodeAddress:
-    """Test cases for geocode_address function"""
+    """Test cases for nominatim_geocode function"""
 
-    def test_geocode_address_empty(self):
+    def test_nominatim_geocode_empty(self):
         """Test geocoding with empty address"""
-        lat, lon = geocode_address("")
+        lat, lon = nominatim_geocode("")
         assert lat is None
         assert lon is None
 
-    def test_geocode_address_none(self):
+    def test_nominatim_geocode_none(self):
         """Test geocoding with None address"""
-        lat, lon = geocode_address(None)
+        lat, lon = nominatim_geocode(None)
         assert lat is None
         assert lon is None
 
     @patch('queries.geolocator')
-    def test_geocode_address_success(self, mock_geolocator):
+    def test_nominatim_geocode_success(self, mock_geolocator):
         """Test successful geocoding"""
         # Mock successful geocoding
         mock_location = Mock()
@@ -35,21 +35,21 @@ class TestGeocodeAddress:
         mock_location.longitude = -122.4194
         mock_geolocator.geocode.return_value = mock_location
 
-        lat, lon = geocode_address("123 Main St")
+        lat, lon = nominatim_geocode("123 Main St")
 
         assert lat == 37.7749
         assert lon == -122.4194
         mock_geolocator.geocode.assert_called_once()
 
     @patch('queries.geolocator')
-    def test_geocode_address_with_zipcode(self, mock_geolocator):
+    def test_nominatim_geocode_with_zipcode(self, mock_geolocator):
         """Test geocoding with zip code"""
         mock_location = Mock()
         mock_location.latitude = 37.7749
         mock_location.longitude = -122.4194
         mock_geolocator.geocode.return_value = mock_location
 
-        lat, lon = geocode_address("123 Main St", "94102")
+        lat, lon = nominatim_geocode("123 Main St", "94102")
 
         assert lat == 37.7749
         assert lon == -122.4194
@@ -58,34 +58,32 @@ class TestGeocodeAddress:
         assert "94102" in call_args
 
     @patch('queries.geolocator')
-    def test_geocode_address_not_found(self, mock_geolocator):
+    def test_nominatim_geocode_not_found(self, mock_geolocator):
         """Test geocoding when location not found"""
         mock_geolocator.geocode.return_value = None
 
-        lat, lon = geocode_address("Nonexistent Address")
+        lat, lon = nominatim_geocode("Nonexistent Address")
 
         assert lat is None
         assert lon is None
 
     @patch('queries.geolocator')
-    def test_geocode_address_service_error(self, mock_geolocator):
-        """Test geocoding with service error"""
+    def test_nominatim_geocode_service_error(self, mock_geolocator):
+        """Test service errors are raised so the geocode worker can retry"""
         mock_geolocator.geocode.side_effect = GeocoderServiceError("Service unavailable")
 
-        lat, lon = geocode_address("123 Main St")
-
-        assert lat is None
-        assert lon is None
+        with pytest.raises(GeocoderServiceError):
+            nominatim_geocode("123 Main St")
 
     @patch('queries.geolocator')
-    def test_geocode_address_timeout(self, mock_geolocator):
+    def test_nominatim_geocode_timeout(self, mock_geolocator):
         """Test geocoding handles timeout parameter"""
         mock_location = Mock()
         mock_location.latitude = 37.7749
         mock_location.longitude = -122.4194
         mock_geolocator.geocode.return_value = mock_location
 
-        geocode_address("123 Main St")
+        nominatim_geocode("123 Main St")
 
         # Verify timeout was passed
         call_kwargs = mock_geolocator.geocode.call_args[1]
@@ -0,0 +1,168 @@
+import pytest
+import json
+import sqlite3
+import sys
+import os
+import threading
+from unittest.mock import patch
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import write_queue
+from write_queue import WriteQueue
+from incidents import INCIDENTS_TABLE
+
+
+SFPD_RECORD = {
+    'category': 'Larceny',
+    'descript': 'Theft',
+    'address': '1 Queue St',
+    'pddistrict': 'Mission',
+    'timestamp': '2024-01-08 13:00:00'
+}
+
+
+@pytest.fixture
+def items_db(tmp_path):
+    path = str(tmp_path / 'items.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE items (name TEXT UNIQUE)')
+    conn.commit()
+    conn.close()
+    return path
+
+
+def insert_item(name):
+    def work(cursor):
+        cursor.execute('INSERT INTO items VALUES (?)', (name,))
+        return cursor.lastrowid
+    return work
+
+
+class TestWriteQueue:
+    """Test cases for WriteQueue"""
+
+    def test_concurrent_writes_are_grouped(self, items_db):
+        """Test writes submitted together commit in fewer transactions than writes"""
+        writer = WriteQueue(items_db, max_batch=100, max_delay=0.05)
+        futures = []
+        submitted = threading.Barrier(20)
+
+        def submit(i):
+            submitted.wait()
+            futures.append(writer.submit(insert_item(f'item {i}')))
+
+        threads = [threading.Thread(target=submit, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        rowids = [future.result(timeout=5) for future in futures]
+        stats = writer.stats()
+        writer.stop(timeout=5)
+
+        conn = sqlite3.connect(items_db)
+        count = conn.execute('SELECT COUNT(*) FROM items').fetchone()[0]
+        conn.close()
+
+        assert count == 20
+        assert sorted(rowids) == list(range(1, 21))
+        assert stats['committed'] == 20
+        assert stats['batches'] < 20
+
+    def test_failed_write_does_not_affect_batch(self, items_db):
+        """Test a write that raises fails alone while the rest of its batch commits"""
+        writer = WriteQueue(items_db, max_batch=10, max_delay=0.05)
+        first = writer.submit(insert_item('a'))
+        duplicate = writer.submit(insert_item('a'))
+        last = writer.submit(insert_item('b'))
+
+        assert first.result(timeout=5) == 1
+        with pytest.raises(sqlite3.IntegrityError):
+            duplicate.result(timeout=5)
+        assert last.result(timeout=5) == 2
+        stats = writer.stats()
+        writer.stop(timeout=5)
+
+        assert stats['committed'] == 2
+        assert stats['failed'] == 1
+
+    def test_locked_database_fails_batch(self, items_db):
+        """Test every write of a batch fails when its transaction can't start"""
+        blocker = sqlite3.connect(items_db)
+        blocker.execute('BEGIN IMMEDIATE')
+        with patch.dict(write_queue.db_pool.pool.pragmas, {'busy_timeout': 0}):
+            writer = WriteQueue(items_db)
+            future = writer.submit(insert_item('a'))
+            with pytest.raises(sqlite3.OperationalError):
+                future.result(timeout=5)
+        blocker.rollback()
+        blocker.close()
+
+        # The writer recovers once the lock is released
+        assert writer.submit(insert_item('b')).result(timeout=5) == 1
+        writer.stop(timeout=5)
+
+    def test_stop_commits_queued_writes(self, items_db):
+        """Test stopping the writer commits what was already queued"""
+        writer = WriteQueue(items_db, max_batch=1)
+        futures = [writer.submit(insert_item(str(i))) for i in range(5)]
+        writer.stop(timeout=5)
+
+        assert [future.result(timeout=0) for future in futures] == [1, 2, 3, 4, 5]
+
+
+class TestCreateEndpoints:
+    """Test cases for the create endpoints on the write queue"""
+
+    def test_post_goes_through_writer(self, client, mock_db_connection, test_db):
+        """Test a POST is committed by the writer of its database"""
+        response = client.post('/api/sfpd_incidents', data=json.dumps(SFPD_RECORD), content_type='application/json')
+        stats = write_queue.stats()[test_db]
+
+        assert response.status_code == 201
+        assert stats['committed'] == 1
+
+        conn = sqlite3.connect(test_db)
+        incidents = conn.execute(f'''
+            SELECT COUNT(*) FROM {INCIDENTS_TABLE} WHERE source_table = 'sfpd_incidents' AND address = '1 Queue St'
+        ''').fetchone()[0]
+        conn.close()
+        assert incidents == 1
+
+    def test_concurrent_posts(self, app, mock_db_connection, test_db):
+        """Test concurrent POSTs all succeed with distinct keys"""
+        responses = []
+
+        def post():
+            with app.test_client() as client:
+                responses.append(client.post('/api/sfpd_incidents', data=json.dumps(SFPD_RECORD),
+                                             content_type='application/json'))
+
+        threads = [threading.Thread(target=post) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert [response.status_code for response in responses] == [201] * 10
+        keys = {json.loads(response.data)['data']['unique_key'] for response in responses}
+        assert len(keys) == 10
+
+    def test_disabled_writes_inline(self, client, mock_db_connection, test_db):
+        """Test writes are committed in the handler when the queue is disabled"""
+        with patch.dict(write_queue.settings, {'enabled': False}):
+            response = client.post('/api/sfpd_incidents', data=json.dumps(SFPD_RECORD), content_type='application/json')
+
+        assert response.status_code == 201
+        assert test_db not in write_queue.stats()
+
+    def test_stats_endpoint(self, client, mock_db_connection, test_db):
+        """Test writer counters are reported per database"""
+        client.post('/api/sfpd_incidents', data=json.dumps(SFPD_RECORD), content_type='application/json')
+        response = client.get('/debug/write-queue')
+        data = json.loads(response.data)
+
+        assert response.status_code == 200
+        assert data[test_db]['submitted'] == 1
@@ -0,0 +1,203 @@
+"""
+Single-writer queue with group commit for the create endpoints.
+
+SQLite allows one writer at a time, so concurrent POSTs that each open a
+transaction queue behind each other's commits and, past busy_timeout, fail
+with "database is locked". Instead, handlers submit their write as a callable
+work(cursor) and wait on the returned Future. One writer thread per database
+owns the write connection: it takes the first pending write, gathers more
+for up to max_delay seconds or max_batch writes, runs them in one transaction
+and commits once (group commit). Each write runs in its own SAVEPOINT, so a
+write that raises is rolled back and its Future fails without affecting the
+rest of the batch.
+"""
+
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+import db_pool
+
+DEFAULT_MAX_BATCH = 64
+DEFAULT_MAX_DELAY = 0.002
+# Seconds a handler waits for its write before giving up
+DEFAULT_TIMEOUT = 30.0
+
+_STOP = object()
+
+
+class WriteQueue:
+    """
+    Group-committing writer of one database.
+
+    Args:
+        db_path: Database the writes go to
+        max_batch: Most writes committed in one transaction
+        max_delay: Seconds to wait for more writes after the first of a batch
+    """
+
+    def __init__(self, db_path, max_batch=DEFAULT_MAX_BATCH, max_delay=DEFAULT_MAX_DELAY):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._conn = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'committed': 0, 'failed': 0, 'batches': 0, 'largest_batch': 0}
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            db_pool.apply_pragmas(self._conn, db_pool.pool.pragmas)
+        return self._conn
+
+    def submit(self, work):
+        """
+        Queue work(cursor) for the writer, starting it if needed.
+
+        Returns:
+            Future resolving to work's return value once its batch is committed
+        """
+        future = Future()
+        with self._lock:
+            self._stats['submitted'] += 1
+        self.start()
+        self._queue.put((work, future))
+        return future
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # Finish this batch, then stop
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _write(self, batch):
+        """Run a batch of writes in one transaction"""
+        conn = self._connection()
+        cursor = conn.cursor()
+        done = []
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            for work, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                cursor.execute('SAVEPOINT queued_write')
+                try:
+                    result = work(cursor)
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO queued_write')
+                    cursor.execute('RELEASE queued_write')
+                    future.set_exception(e)
+                    continue
+                cursor.execute('RELEASE queued_write')
+                done.append((future, result))
+            conn.commit()
+        except Exception as e:
+            # e.g. the database stayed locked by another process: nothing was stored
+            if conn.in_transaction:
+                conn.rollback()
+            for work, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            done = []
+        finally:
+            cursor.close()
+
+        for future, result in done:
+            future.set_result(result)
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['committed'] += len(done)
+            self._stats['failed'] += len(batch) - len(done)
+            self._stats['largest_batch'] = max(self._stats['largest_batch'], len(batch))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            self._write(self._collect(item))
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        """Commit everything already queued, then stop the writer and close its connection"""
+        with self._lock:
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['pending'] = self._queue.qsize()
+        return stats
+
+
+# enabled: route create endpoint writes through the writer thread (False commits each write in its handler)
+settings = {
+    'enabled': True,
+    'max_batch': DEFAULT_MAX_BATCH,
+    'max_delay': DEFAULT_MAX_DELAY,
+    'timeout': DEFAULT_TIMEOUT,
+}
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def configure(**options):
+    """Update settings, e.g. configure(max_batch=128, max_delay=0.005); applies to writers created afterwards"""
+    unknown = set(options) - set(settings)
+    if unknown:
+        raise ValueError(f"Unknown write queue settings: {', '.join(sorted(unknown))}")
+    settings.update(options)
+
+
+def writer_for(db_path):
+    """The writer of a database, created on first use"""
+    with _writers_lock:
+        writer = _writers.get(db_path)
+        if writer is None:
+            writer = WriteQueue(db_path, max_batch=settings['max_batch'], max_delay=settings['max_delay'])
+            _writers[db_path] = writer
+        return writer
+
+
+def stop_all(timeout=None):
+    """Stop and forget every writer"""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.stop(timeout)
+
+
+def stats():
+    with _writers_lock:
+        return {db_path: writer.stats() for db_path, writer in _writers.items()}
+
+
+atexit.register(stop_all)
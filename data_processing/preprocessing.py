@@ -7,6 +7,67 @@ import os
 import re
 import sqlite3
 import csv
+import sys
+import itertools
+import argparse
+import hashlib
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+DDL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'SQL DDL', 'publicsafety_TABLES_DDL.sql')
+
+# SQLite column type for each DDL type (booleans are stored as their CSV text)
+DDL_TYPE_AFFINITY = {
+    'VARCHAR': 'TEXT',
+    'BOOLEAN': 'TEXT',
+    'INTEGER': 'INTEGER',
+    'NUMERIC': 'REAL',
+    'DATE': 'TIMESTAMP',
+    'TIMESTAMP': 'TIMESTAMP',
+}
+
+# Tried in order against sampled values of columns the DDL doesn't declare
+INFERRED_TYPE_PATTERNS = [
+    ('INTEGER', re.compile(r'-?\d+')),
+    ('REAL', re.compile(r'-?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?')),
+    ('TIMESTAMP', re.compile(r'\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?([+-]\d{2}:?\d{2}|Z)?')),
+]
+
+TYPE_SAMPLE_ROWS = 1000
+BULK_BATCH_SIZE = 50000
+
+# Columns with at least this fraction of missing values are dropped
+EMPTY_COLUMN_THRESHOLD = 0.95
+DEFAULT_CHUNKSIZE = 100000
+
+# Indexes for the columns the API filters, groups or sorts on, created after loading
+QUERY_INDEXES = {
+    'sfpd_incidents': [('category',), ('timestamp',), ('unique_key',)],
+    'fire_incidents': [('Primary Situation', 'Action Taken Primary'), ('Analysis Neighborhood', 'Incident Date')],
+    'fire_inspections': [('Inspection Start Date',)],
+    'sffd_service_calls': [('call_type', 'received_timestamp', 'on_scene_timestamp')],
+}
+
+# Natural keys that replace the DDL primary key where the data disagrees with it
+# (sfpd unique_key repeats across the offenses of one incident; pdid doesn't)
+NATURAL_KEY_OVERRIDES = {
+    'sfpd_incidents': ['pdid'],
+}
+
+# Per-source fingerprint and high-water marks of the last incremental load
+INGEST_WATERMARKS_TABLE = 'ingest_watermarks'
+
+# The incidents table schema is shared with the API
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from incidents import (
+    build_incidents_table, refresh_incidents, table_exists, table_columns, derive_coordinates,
+    derive_time_features, INCIDENTS_TABLE, INCIDENT_SOURCES, COORDINATE_SOURCES, TIME_FEATURE_COLUMNS
+)
+from gazetteer import build_gazetteer, refine_zip_coordinates, GAZETTEER_TABLE
+from key_allocator import KEY_COLUMNS, prepare_key_sequences
+
+# Columns added by apply_extra_preprocessing, typed even when the sample is empty
+DERIVED_COLUMN_TYPES = dict.fromkeys(TIME_FEATURE_COLUMNS, 'INTEGER')
 
 
 def load_ignore_columns(ignore_file_path='ignore.txt'):
@@ -66,17 +127,11 @@ def load_ignore_columns(ignore_file_path='ignore.txt'):
     return ignore_dict
 
 
-def process_csv_with_ignore(csv_path, output_dir, ignore_file_path='ignore.txt'):
+def get_columns_to_ignore(filename, ignore_dict):
     """
-    Process a CSV file by removing ignored columns and saving to output directory.
+    Columns to ignore for a dataset, from ignore.txt or the built-in lists for
+    datasets whose ignore.txt entry doesn't match their file name.
     """
-    # Get the filename from the path
-    filename = os.path.basename(csv_path)
-
-    # Load ignore columns
-    ignore_dict = load_ignore_columns(ignore_file_path)
-
-
     # Get columns to ignore for this dataset
     columns_to_ignore = ignore_dict.get(filename, [])
 
@@ -135,9 +190,86 @@ def process_csv_with_ignore(csv_path, output_dir, ignore_file_path='ignore.txt')
                 "Current Supervisor Districts",
                 'supervisor district'
             ]
-    # Read the CSV
+    return columns_to_ignore
+
+
+def match_columns_to_drop(columns, columns_to_ignore, filename):
+    """Resolve ignored column names against actual columns (case-insensitive)"""
+    columns_lower = {col.lower(): col for col in columns}
+    columns_to_drop = []
+
+    for ignore_col in columns_to_ignore:
+        ignore_col_lower = ignore_col.lower()
+        if ignore_col_lower in columns_lower:
+            columns_to_drop.append(columns_lower[ignore_col_lower])
+        else:
+            print(f"Warning: Column '{ignore_col}' not found in {filename}")
+
+    return columns_to_drop
+
+
+def apply_extra_preprocessing(df, filename):
+    """Dataset-specific cleanup applied after column and row filtering"""
+    if str(filename).lower() == 'fire-incidents.csv':
+        df['Incident Date'] = pd.to_datetime(df['Incident Date'], errors='coerce')
+
+    # Parse the incident time of every source (whatever its format) into
+    # integer time features once here, so the API groups and filters on them
+    # instead of calling strftime/SUBSTR on every row per request
+    table_name = table_name_for(filename)
+    if table_name in INCIDENT_SOURCES:
+        column = INCIDENT_SOURCES[table_name]['incident_time']
+        if column in df.columns:
+            features = derive_time_features(df[column])
+            for feature in TIME_FEATURE_COLUMNS:
+                df[feature] = features[feature]
+        else:
+            print(f"Warning: Column '{column}' not found in {filename}, no time features derived")
+
+    # Derive numeric coordinates once here so the API never parses Location
+    # strings or looks up ZIP centroids per request
+    if table_name in COORDINATE_SOURCES:
+        kind, column = COORDINATE_SOURCES[table_name]
+        if column in df.columns:
+            coords = derive_coordinates(df[column], kind)
+            df['Latitude'] = coords['Latitude']
+            df['Longitude'] = coords['Longitude']
+        else:
+            print(f"Warning: Column '{column}' not found in {filename}, no coordinates derived")
+            df['Latitude'] = None
+            df['Longitude'] = None
+    return df
+
+
+def format_datetime_columns(df):
+    """
+    Write datetime columns as '%Y-%m-%d %H:%M:%S' text, so the output doesn't
+    depend on whether a file (or chunk) happens to hold only midnight times
+    """
+    for col in df.select_dtypes(include='datetime').columns:
+        df[col] = df[col].dt.strftime('%Y-%m-%d %H:%M:%S')
+    return df
+
+
+def process_csv_with_ignore(csv_path, output_dir, ignore_file_path='ignore.txt', ignore_dict=None):
+    """
+    Process a CSV file by removing ignored columns and saving to output directory.
+    Pass ignore_dict to reuse an already parsed ignore.txt.
+    """
+    # Get the filename from the path
+    filename = os.path.basename(csv_path)
+
+    # Load ignore columns
+    if ignore_dict is None:
+        ignore_dict = load_ignore_columns(ignore_file_path)
+
+    columns_to_ignore = get_columns_to_ignore(filename, ignore_dict)
+
+    # Read the CSV as text, so values are written back as they appear in the
+    # source (no 94110 -> 94110.0 for columns with missing values), exactly
+    # like process_csv_streaming
     print(f"Reading {csv_path}...")
-    df = pd.read_csv(csv_path)
+    df = pd.read_csv(csv_path, dtype=str)
     print(f"Original shape: {df.shape}")
 
     if not columns_to_ignore:
@@ -145,15 +277,7 @@ def process_csv_with_ignore(csv_path, output_dir, ignore_file_path='ignore.txt')
     else:
         # Find which columns actually exist in the dataframe
         # (case-insensitive matching)
-        df_columns_lower = {col.lower(): col for col in df.columns}
-        columns_to_drop = []
-
-        for ignore_col in columns_to_ignore:
-            ignore_col_lower = ignore_col.lower()
-            if ignore_col_lower in df_columns_lower:
-                columns_to_drop.append(df_columns_lower[ignore_col_lower])
-            else:
-                print(f"Warning: Column '{ignore_col}' not found in {filename}")
+        columns_to_drop = match_columns_to_drop(df.columns, columns_to_ignore, filename)
 
         # Drop the columns
         if columns_to_drop:
@@ -162,7 +286,7 @@ def process_csv_with_ignore(csv_path, output_dir, ignore_file_path='ignore.txt')
             print(f"New shape after dropping ignored columns: {df.shape}")
 
     # Remove columns that are 95% or more empty
-    threshold = 0.95
+    threshold = EMPTY_COLUMN_THRESHOLD
     empty_threshold = len(df) * threshold
     columns_before = df.columns.tolist()
 
@@ -188,9 +312,7 @@ def process_csv_with_ignore(csv_path, output_dir, ignore_file_path='ignore.txt')
     os.makedirs(output_dir, exist_ok=True)
 
 
-    ## extra data preprocessing
-    if str(filename).lower() == 'fire-incidents.csv':
-        df['Incident Date'] = pd.to_datetime(df['Incident Date'], errors='coerce')
+    df = format_datetime_columns(apply_extra_preprocessing(df, filename))
 
     # Save to output directory
     output_path = os.path.join(output_dir, filename)
@@ -200,23 +322,228 @@ def process_csv_with_ignore(csv_path, output_dir, ignore_file_path='ignore.txt')
     return output_path
 
 
-def csv_to_sqlite_table(csv_path, conn):
+def process_csv_streaming(csv_path, output_dir, ignore_file_path='ignore.txt', chunksize=DEFAULT_CHUNKSIZE, ignore_dict=None):
+    """
+    Chunked version of process_csv_with_ignore for CSVs too large to load at once.
+
+    Ignored columns are excluded through usecols so they are never read. A
+    first pass counts missing values per column for the 95%-empty rule; a
+    second pass cleans each chunk and appends it to the output CSV. Values are
+    read as strings so every chunk keeps the same text as the source file.
+
+    Returns:
+        Path of the output CSV
+    """
+    filename = os.path.basename(csv_path)
+    if ignore_dict is None:
+        ignore_dict = load_ignore_columns(ignore_file_path)
+    columns_to_ignore = get_columns_to_ignore(filename, ignore_dict)
+
+    print(f"Streaming {csv_path} in chunks of {chunksize} rows...")
+    all_columns = pd.read_csv(csv_path, nrows=0).columns.tolist()
+    columns_to_drop = match_columns_to_drop(all_columns, columns_to_ignore, filename)
+    usecols = [col for col in all_columns if col not in columns_to_drop]
+    if columns_to_drop:
+        print(f"Skipping {len(columns_to_drop)} ignored columns: {columns_to_drop}")
+
+    # First pass: missing value counts for the empty-column rule
+    total_rows = 0
+    missing_counts = pd.Series(0, index=usecols)
+    for chunk in pd.read_csv(csv_path, usecols=usecols, dtype=str, chunksize=chunksize):
+        total_rows += len(chunk)
+        missing_counts = missing_counts.add(chunk.isnull().sum(), fill_value=0)
+
+    empty_threshold = total_rows * EMPTY_COLUMN_THRESHOLD
+    columns_to_drop_empty = [col for col, count in missing_counts.items() if count >= empty_threshold]
+    if columns_to_drop_empty:
+        print(f"Dropping {len(columns_to_drop_empty)} columns that are 95%+ empty: {columns_to_drop_empty}")
+    keep = [col for col in usecols if col not in columns_to_drop_empty]
+
+    # Second pass: clean and write chunk by chunk
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, filename)
+
+    rows_written = 0
+    for i, chunk in enumerate(pd.read_csv(csv_path, usecols=keep, dtype=str, chunksize=chunksize)):
+        chunk = chunk[keep].dropna(how='all')
+        chunk = format_datetime_columns(apply_extra_preprocessing(chunk, filename))
+
+        chunk.to_csv(output_path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+        rows_written += len(chunk)
+
+    print(f"Dropped {total_rows - rows_written} completely empty rows")
+    print(f"Saved processed file to {output_path} ({rows_written} rows)\n")
+    return output_path
+
+
+def table_name_for(filename):
+    """SQLite table name for a CSV file name (hyphens and spaces become underscores)"""
+    table_name = os.path.splitext(os.path.basename(filename))[0]
+    return table_name.replace('-', '_').replace(' ', '_')
+
+
+def normalize_column_name(column):
+    """snake_case form of a CSV header, as used in the DDL (e.g. 'ZIP Code' -> 'zip_code')"""
+    return re.sub(r'[^0-9a-z]+', '_', column.lower()).strip('_')
+
+
+def load_ddl_schema(ddl_path=DDL_PATH):
+    """
+    Parse the CREATE TABLE statements of the DDL file.
+
+    Returns:
+        Dictionary of table name -> {'columns': {column: SQLite type}, 'primary_key': [columns]}
+    """
+    schema = {}
+    if not os.path.exists(ddl_path):
+        return schema
+
+    with open(ddl_path, 'r') as f:
+        ddl = f.read()
+
+    for match in re.finditer(r'CREATE TABLE\s+"?(\w+)"?\s*\((.*?)\n\);', ddl, re.S | re.I):
+        table_name, body = match.group(1), match.group(2)
+        columns = {}
+        primary_key = []
+        for line in body.splitlines():
+            line = line.strip().rstrip(',')
+            key_match = re.match(r'PRIMARY KEY\s*\((.*)\)', line, re.I)
+            if key_match:
+                primary_key = [col.strip() for col in key_match.group(1).split(',')]
+                continue
+            column_match = re.match(r'(\w+)\s+(\w+)', line)
+            if column_match and column_match.group(1).upper() not in ('FOREIGN', 'REFERENCES', 'ON'):
+                columns[column_match.group(1)] = DDL_TYPE_AFFINITY.get(column_match.group(2).upper(), 'TEXT')
+        schema[table_name] = {'columns': columns, 'primary_key': primary_key}
+
+    return schema
+
+
+def infer_column_type(values):
+    """Infer INTEGER, REAL, TIMESTAMP or TEXT from a sample of non-empty CSV values"""
+    values = [value for value in values if value != '']
+    if not values:
+        return 'TEXT'
+    for column_type, pattern in INFERRED_TYPE_PATTERNS:
+        if all(pattern.fullmatch(value) for value in values):
+            return column_type
+    return 'TEXT'
+
+
+def _batches(rows, batch_size):
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def configure_bulk_load(conn):
+    """
+    Trade durability for speed while (re)building the database from scratch:
+    no rollback journal and no fsyncs. A crash mid-build means rebuilding again.
+    """
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    conn.execute('PRAGMA cache_size = -262144')  # 256 MB
+
+
+def natural_key_columns(table_name, headers, ddl_schema):
+    """
+    CSV headers forming the table's natural key (NATURAL_KEY_OVERRIDES, else
+    the DDL primary key), or an empty list if any key column is missing.
+    """
+    by_normalized = {normalize_column_name(col): col for col in headers}
+    primary_key = NATURAL_KEY_OVERRIDES.get(table_name) or ddl_schema.get(table_name, {}).get('primary_key', [])
+    key_columns = [by_normalized.get(col) for col in primary_key]
+    return key_columns if key_columns and all(key_columns) else []
+
+
+def create_table_indexes(conn, table_name, headers, ddl_schema):
+    """
+    Create the natural-key index (UNIQUE when the data allows it) and the
+    indexes the API queries filter or group on.
+    """
+    created = []
+
+    key_columns = natural_key_columns(table_name, headers, ddl_schema)
+    if key_columns:
+        key_sql = ', '.join(f'"{col}"' for col in key_columns)
+        duplicate = conn.execute(
+            f'SELECT 1 FROM "{table_name}" GROUP BY {key_sql} HAVING COUNT(*) > 1 LIMIT 1'
+        ).fetchone()
+        unique = '' if duplicate else 'UNIQUE '
+        if duplicate:
+            print(f"Warning: duplicate keys ({', '.join(key_columns)}) in '{table_name}', creating a non-unique index")
+        conn.execute(f'CREATE {unique}INDEX IF NOT EXISTS "pk_{table_name}" ON "{table_name}" ({key_sql})')
+        created.append(f'pk_{table_name}')
+
+    for columns in QUERY_INDEXES.get(table_name, []):
+        if not all(col in headers for col in columns):
+            continue
+        index_name = f"idx_{table_name}_" + '_'.join(normalize_column_name(col) for col in columns)
+        column_sql = ', '.join(f'"{col}"' for col in columns)
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table_name}" ({column_sql})')
+        created.append(index_name)
+
+    conn.commit()
+    return created
+
+
+def column_types_for(table_name, headers, sample_rows, ddl_schema):
+    """SQLite type of each header, from the DDL or inferred from sample rows (lists of CSV strings)"""
+    ddl_columns = ddl_schema.get(table_name, {}).get('columns', {})
+    column_types = []
+    for i, col in enumerate(headers):
+        column_type = DERIVED_COLUMN_TYPES.get(col) or ddl_columns.get(normalize_column_name(col))
+        if column_type is None:
+            column_type = infer_column_type([row[i] for row in sample_rows if i < len(row) and row[i] is not None])
+        column_types.append(column_type)
+    return column_types
+
+
+def create_typed_table(cursor, table_name, headers, sample_rows, ddl_schema):
+    """
+    Create a table typed from the DDL, or from sample rows (lists of CSV
+    strings) for columns the DDL doesn't declare.
+
+    Returns:
+        INSERT statement with one placeholder per column
+    """
+    column_types = column_types_for(table_name, headers, sample_rows, ddl_schema)
+    columns = ', '.join(f'"{col}" {column_type}' for col, column_type in zip(headers, column_types))
+    cursor.execute(f'CREATE TABLE "{table_name}" ({columns})')
+
+    placeholders = ', '.join(['?' for _ in headers])
+    return f'INSERT INTO "{table_name}" VALUES ({placeholders})'
+
+
+def csv_to_sqlite_table(csv_path, conn, table_name=None, batch_size=BULK_BATCH_SIZE, ddl_schema=None):
     """
     Convert a CSV file to a table in an existing SQLite database.
 
+    Rows are streamed in batches through executemany inside a single
+    transaction. Column types come from the DDL where the (snake_cased)
+    column is declared there, and are otherwise inferred from a sample of
+    rows. Empty fields are stored as NULL. Indexes are created after the load.
+
     Args:
         csv_path: Path to the CSV file
         conn: SQLite database connection
+        table_name: Table to create (defaults to the sanitized file name)
+        batch_size: Rows per executemany call
+        ddl_schema: Parsed DDL (see load_ddl_schema), loaded from DDL_PATH if None
 
     Returns:
         Name of the created table
     """
     # Get the filename without extension to use as table name
     filename = os.path.basename(csv_path)
-    table_name = os.path.splitext(filename)[0]
-
-    # Sanitize table name (replace hyphens and spaces with underscores)
-    table_name = table_name.replace('-', '_').replace(' ', '_')
+    table_name = table_name or table_name_for(filename)
+    if ddl_schema is None:
+        ddl_schema = load_ddl_schema()
 
     print(f"Adding {filename} as table '{table_name}'...")
 
@@ -225,36 +552,278 @@ def csv_to_sqlite_table(csv_path, conn):
     # Drop table if it exists
     cursor.execute(f'DROP TABLE IF EXISTS "{table_name}"')
 
-    # Read CSV and create table
-    with open(csv_path, 'r') as file:
+    with open(csv_path, 'r', newline='') as file:
         csv_reader = csv.reader(file)
         headers = next(csv_reader)  # Get column names
 
-        # Create table with columns from CSV headers
-        columns = ', '.join([f'"{col}" TEXT' for col in headers])
-        cursor.execute(f'CREATE TABLE "{table_name}" ({columns})')
+        # Type each column from the DDL, or from a sample of the first rows
+        sample = list(itertools.islice(csv_reader, TYPE_SAMPLE_ROWS))
+        insert_sql = create_typed_table(cursor, table_name, headers, sample, ddl_schema)
 
-        # Insert data
-        placeholders = ', '.join(['?' for _ in headers])
-        for row in csv_reader:
-            cursor.execute(f'INSERT INTO "{table_name}" VALUES ({placeholders})', row)
+        # Insert data in one transaction, empty fields as NULL
+        rows = (
+            [value if value != '' else None for value in row]
+            for row in itertools.chain(sample, csv_reader)
+        )
+        row_count = 0
+        for batch in _batches(rows, batch_size):
+            cursor.executemany(insert_sql, batch)
+            row_count += len(batch)
 
     conn.commit()
-    print(f"Table '{table_name}' created successfully\n")
+
+    indexes = create_table_indexes(conn, table_name, headers, ddl_schema)
+    print(f"Table '{table_name}' created successfully with {row_count} rows and indexes {indexes}\n")
 
     return table_name
 
 
-def process_directory(input_dir, output_dir, ignore_file_path='ignore.txt', create_sql_databases=False, sql_db_dir='sql_databases'):
+def source_fingerprint(csv_path, ignore_dict):
+    """SHA-256 of a raw CSV plus the columns ignored for it (so ignore.txt edits count as changes)"""
+    digest = hashlib.sha256()
+    with open(csv_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    ignored = get_columns_to_ignore(os.path.basename(csv_path), ignore_dict)
+    digest.update(repr(sorted(ignored)).encode())
+    return digest.hexdigest()
+
+
+def load_watermarks(conn):
+    """Create the watermark table if needed and return source_table -> fingerprint"""
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {INGEST_WATERMARKS_TABLE} (
+            source_table TEXT PRIMARY KEY,
+            source_file TEXT,
+            fingerprint TEXT,
+            row_count INTEGER,
+            max_timestamp TEXT,
+            max_key TEXT,
+            loaded_at TEXT
+        )
+    ''')
+    conn.commit()
+    return dict(conn.execute(f'SELECT source_table, fingerprint FROM {INGEST_WATERMARKS_TABLE}'))
+
+
+def record_watermark(conn, table_name, source_file, fingerprint, ddl_schema):
+    """Store the fingerprint, row count and high-water marks of a loaded source"""
+    columns = table_columns(conn, table_name)
+    time_column = INCIDENT_SOURCES.get(table_name, {}).get('incident_time')
+    key_columns = natural_key_columns(table_name, columns, ddl_schema)
+
+    row_count = conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+    max_timestamp = None
+    if time_column in columns and 'incident_epoch' in columns:
+        # Latest by the parsed time, as the source text may mix formats
+        row = conn.execute(
+            f'SELECT "{time_column}" FROM "{table_name}" WHERE incident_epoch IS NOT NULL '
+            f'ORDER BY incident_epoch DESC LIMIT 1'
+        ).fetchone()
+        max_timestamp = row[0] if row else None
+    elif time_column in columns:
+        max_timestamp = conn.execute(f'SELECT MAX("{time_column}") FROM "{table_name}"').fetchone()[0]
+    max_key = None
+    if key_columns:
+        # Keys are stored as TEXT; compare all-digit keys as numbers ('10' > '9')
+        key = key_columns[0]
+        numeric = not conn.execute(
+            f'SELECT 1 FROM "{table_name}" WHERE "{key}" = ? OR "{key}" GLOB ? LIMIT 1', ('', '*[^0-9]*')
+        ).fetchone()
+        key_sql = f'CAST("{key}" AS INTEGER)' if numeric else f'"{key}"'
+        max_key = conn.execute(f'SELECT MAX({key_sql}) FROM "{table_name}"').fetchone()[0]
+
+    conn.execute(f'''
+        INSERT OR REPLACE INTO {INGEST_WATERMARKS_TABLE}
+        (source_table, source_file, fingerprint, row_count, max_timestamp, max_key, loaded_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (table_name, source_file, fingerprint, row_count,
+          None if max_timestamp is None else str(max_timestamp),
+          None if max_key is None else str(max_key),
+          datetime.now().isoformat(timespec='seconds')))
+    conn.commit()
+
+
+def _has_key_index(conn, table_name, key_columns):
+    for index in conn.execute(f'PRAGMA index_list("{table_name}")').fetchall():
+        indexed = [row[2] for row in conn.execute(f'PRAGMA index_info("{index[1]}")')]
+        if indexed[:len(key_columns)] == key_columns:
+            return True
+    return False
+
+
+def upsert_csv_to_sqlite_table(csv_path, conn, batch_size=BULK_BATCH_SIZE, ddl_schema=None, refresh_derived=True):
+    """
+    Merge a cleaned CSV into its existing table by natural key.
+
+    The CSV is bulk-loaded into a temporary staging table typed like the
+    target. Target rows whose values differ from their staged row are
+    updated, staged rows with unseen keys are inserted, and every other row
+    (including rows created through the API, which have no matching key) is
+    left untouched. Rows missing from the CSV are not deleted. Only the
+    changed rows are re-derived into the incidents table and rollup.
+
+    Falls back to csv_to_sqlite_table when the table doesn't exist yet, or
+    when the CSV lacks the natural key columns of a table the API doesn't
+    write to (reloading it loses nothing).
+
+    Raises:
+        ValueError: if the CSV lacks the natural key columns of a table the API
+            writes to (e.g. after an ignore.txt edit); the table is left as is,
+            since reloading it would delete the rows created through the API
+
+    Args:
+        csv_path: Path to the cleaned CSV file
+        conn: SQLite database connection
+        batch_size: Rows per executemany call
+        ddl_schema: Parsed DDL (see load_ddl_schema), loaded from DDL_PATH if None
+        refresh_derived: Update the incidents table and rollup for changed rows
+
+    Returns:
+        Dictionary with 'table', 'inserted' and 'updated' counts
+    """
+    filename = os.path.basename(csv_path)
+    table_name = table_name_for(filename)
+    if ddl_schema is None:
+        ddl_schema = load_ddl_schema()
+
+    with open(csv_path, 'r', newline='') as file:
+        headers = next(csv.reader(file))
+    key_columns = natural_key_columns(table_name, headers, ddl_schema)
+    if not key_columns and table_name in KEY_COLUMNS and table_exists(conn, table_name):
+        expected = NATURAL_KEY_OVERRIDES.get(table_name) or ddl_schema.get(table_name, {}).get('primary_key', [])
+        raise ValueError(
+            f"{filename} lacks the natural key ({', '.join(expected) or 'none declared'}) of '{table_name}', "
+            f"which holds rows created through the API. Restore the key columns (check ignore.txt) "
+            f"or rebuild the database without --incremental."
+        )
+
+    cursor = conn.cursor()
+    cursor.execute('DROP TABLE IF EXISTS temp.ingest_changed')
+    cursor.execute('CREATE TEMP TABLE ingest_changed (source_rowid INTEGER PRIMARY KEY)')
+
+    if not table_exists(conn, table_name) or not key_columns:
+        if table_exists(conn, table_name):
+            print(f"Warning: no natural key for '{table_name}' in {filename}, reloading the whole table")
+            if table_exists(conn, INCIDENTS_TABLE):
+                # Re-derive the old rows too, so incidents of dropped rows go away
+                cursor.execute(f'''
+                    INSERT INTO temp.ingest_changed
+                    SELECT source_rowid FROM {INCIDENTS_TABLE} WHERE source_table = ?
+                ''', (table_name,))
+        csv_to_sqlite_table(csv_path, conn, table_name=table_name, batch_size=batch_size, ddl_schema=ddl_schema)
+        cursor.execute(f'INSERT OR IGNORE INTO temp.ingest_changed SELECT rowid FROM "{table_name}"')
+        row_count = conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+        stats = {'table': table_name, 'inserted': row_count, 'updated': 0}
+    else:
+        print(f"Merging {filename} into table '{table_name}' on ({', '.join(key_columns)})...")
+        declared = {row[1]: row[2] for row in conn.execute(f'PRAGMA table_info("{table_name}")')}
+
+        with open(csv_path, 'r', newline='') as file:
+            csv_reader = csv.reader(file)
+            next(csv_reader)
+            sample = list(itertools.islice(csv_reader, TYPE_SAMPLE_ROWS))
+            inferred = column_types_for(table_name, headers, sample, ddl_schema)
+            column_types = [declared.get(col) or inferred[i] for i, col in enumerate(headers)]
+
+            # New columns in the CSV are added to the target table
+            for col, column_type in zip(headers, column_types):
+                if col not in declared:
+                    cursor.execute(f'ALTER TABLE "{table_name}" ADD COLUMN "{col}" {column_type}')
+
+            # Stage the CSV with the target's column types so values compare equal
+            cursor.execute('DROP TABLE IF EXISTS temp.ingest_staging')
+            columns_sql = ', '.join(f'"{col}" {column_type}' for col, column_type in zip(headers, column_types))
+            cursor.execute(f'CREATE TEMP TABLE ingest_staging ({columns_sql})')
+            insert_sql = f'INSERT INTO temp.ingest_staging VALUES ({", ".join("?" for _ in headers)})'
+            rows = (
+                [value if value != '' else None for value in row]
+                for row in itertools.chain(sample, csv_reader)
+            )
+            for batch in _batches(rows, batch_size):
+                cursor.executemany(insert_sql, batch)
+
+        key_sql = ', '.join(f's."{col}"' for col in key_columns)
+        key_match = ' AND '.join(f't."{col}" = s."{col}"' for col in key_columns)
+        key_present = ' AND '.join(f's."{col}" IS NOT NULL' for col in key_columns)
+
+        # Keep the last row of keys repeated within the CSV
+        cursor.execute(f'''
+            DELETE FROM temp.ingest_staging WHERE rowid NOT IN (
+                SELECT MAX(rowid) FROM temp.ingest_staging AS s GROUP BY {key_sql}
+            )
+        ''')
+        if not _has_key_index(conn, table_name, key_columns):
+            create_table_indexes(conn, table_name, table_columns(conn, table_name), ddl_schema)
+
+        # Existing rows whose values changed
+        differs = ' OR '.join(f't."{col}" IS NOT s."{col}"' for col in headers)
+        cursor.execute(f'''
+            INSERT INTO temp.ingest_changed
+            SELECT t.rowid FROM temp.ingest_staging AS s JOIN "{table_name}" AS t ON {key_match}
+            WHERE {differs}
+        ''')
+        updated = cursor.rowcount
+        assignments = ', '.join(f'"{col}" = s."{col}"' for col in headers)
+        cursor.execute(f'''
+            UPDATE "{table_name}" AS t SET {assignments}
+            FROM temp.ingest_staging AS s
+            WHERE t.rowid IN (SELECT source_rowid FROM temp.ingest_changed) AND {key_match}
+        ''')
+
+        # Rows with keys the table hasn't seen
+        last_rowid = cursor.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM "{table_name}"').fetchone()[0]
+        column_list = ', '.join(f'"{col}"' for col in headers)
+        cursor.execute(f'''
+            INSERT INTO "{table_name}" ({column_list})
+            SELECT {', '.join(f's."{col}"' for col in headers)} FROM temp.ingest_staging AS s
+            WHERE {key_present}
+              AND NOT EXISTS (SELECT 1 FROM "{table_name}" AS t WHERE {key_match})
+        ''')
+        inserted = cursor.rowcount
+        cursor.execute(f'INSERT INTO temp.ingest_changed SELECT rowid FROM "{table_name}" WHERE rowid > ?',
+                       (last_rowid,))
+
+        cursor.execute('DROP TABLE temp.ingest_staging')
+        stats = {'table': table_name, 'inserted': inserted, 'updated': updated}
+
+    if refresh_derived and table_name in INCIDENT_SOURCES and table_exists(conn, INCIDENTS_TABLE):
+        refresh_incidents(cursor, table_name, 'SELECT source_rowid FROM temp.ingest_changed')
+    cursor.execute('DROP TABLE temp.ingest_changed')
+    conn.commit()
+
+    print(f"Table '{table_name}': {stats['inserted']} rows inserted, {stats['updated']} rows updated\n")
+    return stats
+
+
+def clean_csv(csv_path, output_dir, ignore_dict, chunksize=None):
+    """Clean one CSV with an already parsed ignore list (picklable worker entry point)"""
+    if chunksize:
+        return process_csv_streaming(csv_path, output_dir, ignore_dict=ignore_dict, chunksize=chunksize)
+    return process_csv_with_ignore(csv_path, output_dir, ignore_dict=ignore_dict)
+
+
+def process_directory(input_dir, output_dir, ignore_file_path='ignore.txt', create_sql_databases=False, sql_db_dir='sql_databases', chunksize=None, workers=1, incremental=False):
     """
     Process all CSV files in a directory by removing ignored columns.
 
+    With workers > 1 each CSV is cleaned in its own process. The calling
+    process stays the only writer to the SQLite database and loads each
+    cleaned file as soon as its worker finishes.
+
+    With incremental=True the existing database is kept: sources whose raw
+    CSV (and ignore list) are unchanged since the last run are skipped, and
+    the others are merged by natural key (see upsert_csv_to_sqlite_table).
+
     Args:
         input_dir: Directory containing CSV files to process
         output_dir: Directory where processed CSVs will be saved
         ignore_file_path: Path to the ignore.txt file
         create_sql_databases: If True, also convert processed CSVs to SQLite databases
         sql_db_dir: Directory where SQLite databases will be saved
+        chunksize: If set, stream each CSV in chunks of this many rows (flat memory use)
+        workers: Number of processes cleaning CSVs in parallel
+        incremental: Merge changed sources into the existing database instead of rebuilding it
 
     Returns:
         Dictionary with 'csv_files' and optionally 'db_files' lists
@@ -268,19 +837,19 @@ def process_directory(input_dir, output_dir, ignore_file_path='ignore.txt', crea
 
     print(f"Found {len(csv_files)} CSV files to process\n")
 
-    processed_files = []
-    for csv_file in csv_files:
-        csv_path = os.path.join(input_dir, csv_file)
-        output_path = process_csv_with_ignore(csv_path, output_dir, ignore_file_path)
-        processed_files.append(output_path)
-
-    print(f"Processed {len(processed_files)} files successfully!")
-
-    result = {'csv_files': processed_files, 'db_file': None, 'tables': []}
-
-    # Convert to SQLite database if requested
+    # Parse ignore.txt once for every dataset
+    ignore_dict = load_ignore_columns(ignore_file_path)
+    csv_paths = [os.path.join(input_dir, csv_file) for csv_file in csv_files]
+
+    conn = None
+    db_path = None
+    ddl_schema = None
+    tables = []
+    skipped = []
+    fingerprints = {}
+    rebuild_incidents = True
     if create_sql_databases:
-        print(f"\nCreating SQLite database with all processed CSVs as tables...")
+        print(f"Creating SQLite database with all processed CSVs as tables...")
 
         # Create database directory if it doesn't exist
         os.makedirs(sql_db_dir, exist_ok=True)
@@ -288,19 +857,78 @@ def process_directory(input_dir, output_dir, ignore_file_path='ignore.txt', crea
         # Create single database file
         db_path = os.path.join(sql_db_dir, 'processed_data.db')
 
-        # Remove existing database if it exists
-        if os.path.exists(db_path):
+        if not incremental and os.path.exists(db_path):
+            # Remove existing database if it exists
             os.remove(db_path)
             print(f"Removed existing database at {db_path}")
 
         # Connect to database
         conn = sqlite3.connect(db_path)
+        if not incremental:
+            configure_bulk_load(conn)
+        ddl_schema = load_ddl_schema()
+        watermarks = load_watermarks(conn)
+        rebuild_incidents = not incremental or not table_exists(conn, INCIDENTS_TABLE)
+
+        for csv_path in list(csv_paths):
+            fingerprints[csv_path] = source_fingerprint(csv_path, ignore_dict)
+            table_name = table_name_for(csv_path)
+            if incremental and watermarks.get(table_name) == fingerprints[csv_path] and table_exists(conn, table_name):
+                # Keep the database (and rows created through the API); only
+                # sources that changed since their watermark are reprocessed
+                print(f"Skipping {os.path.basename(csv_path)}: unchanged since the last load")
+                csv_paths.remove(csv_path)
+                skipped.append(table_name)
+
+    def load(csv_path, output_path):
+        # Add the cleaned CSV as a table (single writer)
+        if conn is None:
+            return
+        if incremental:
+            table_name = upsert_csv_to_sqlite_table(output_path, conn, ddl_schema=ddl_schema,
+                                                    refresh_derived=not rebuild_incidents)['table']
+        else:
+            table_name = csv_to_sqlite_table(output_path, conn, ddl_schema=ddl_schema)
+        record_watermark(conn, table_name, os.path.basename(csv_path), fingerprints[csv_path], ddl_schema)
+        tables.append(table_name)
+
+    outputs = {}
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(clean_csv, csv_path, output_dir, ignore_dict, chunksize): csv_path
+                for csv_path in csv_paths
+            }
+            for future in as_completed(futures):
+                outputs[futures[future]] = future.result()
+                load(futures[future], outputs[futures[future]])
+    else:
+        for csv_path in csv_paths:
+            outputs[csv_path] = clean_csv(csv_path, output_dir, ignore_dict, chunksize)
+            load(csv_path, outputs[csv_path])
 
-        # Add each CSV as a table
-        tables = []
-        for csv_path in processed_files:
-            table_name = csv_to_sqlite_table(csv_path, conn)
-            tables.append(table_name)
+    processed_files = [outputs[csv_path] for csv_path in csv_paths]
+    print(f"Processed {len(processed_files)} files successfully!")
+
+    result = {'csv_files': processed_files, 'db_file': None, 'tables': [], 'skipped_tables': skipped}
+
+    if conn is not None:
+        if tables:
+            # Block centroids from every address with coordinates, then use
+            # them in place of ZIP centroids (fire_incidents)
+            blocks = build_gazetteer(conn)
+            print(f"Built '{GAZETTEER_TABLE}' table with {blocks} blocks and intersections")
+            refined = refine_zip_coordinates(conn)
+            print(f"Replaced ZIP centroids with block centroids: {refined}")
+
+        # Materialize the unified incidents table the API reads from
+        # (incremental loads already refreshed the rows they changed)
+        if rebuild_incidents:
+            counts = build_incidents_table(conn)
+            print(f"Built '{INCIDENTS_TABLE}' table from {len(counts)} sources: {counts}")
+
+        # Key counters and key column indexes for rows created through the API
+        prepare_key_sequences(conn)
 
         conn.close()
 
@@ -311,7 +939,21 @@ def process_directory(input_dir, output_dir, ignore_file_path='ignore.txt', crea
     return result
 
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Clean the raw CSVs and build processed_data.db')
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help=f'Stream each CSV in chunks of this many rows instead of loading it whole '
+                             f'(e.g. {DEFAULT_CHUNKSIZE})')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes cleaning CSVs in parallel (default: 1)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Merge new or changed rows into the existing database instead of rebuilding it')
+    return parser.parse_args(argv)
+
+
 def main():
+    args = parse_args()
+
     # Process the files
     input_dir = '../data'
     output_dir = '../processed_data'
@@ -321,7 +963,8 @@ def main():
     os.makedirs(output_dir, exist_ok=True)
 
     # Process directory and create SQL databases
-    result = process_directory(input_dir, output_dir, create_sql_databases=True, sql_db_dir=sql_db_dir)
+    result = process_directory(input_dir, output_dir, create_sql_databases=True, sql_db_dir=sql_db_dir,
+                               chunksize=args.chunksize, workers=args.workers, incremental=args.incremental)
 
     # Print the contents of the output directory
     print("\nContents of the processed_data directory:")
@@ -0,0 +1,598 @@
+"""
+Synthetic processed_data.db at a configurable scale, for benchmarking the API.
+
+The real datasets are a few 10k-row CSVs, which says little about how the API
+behaves on the millions of rows of the full city data. This generator writes
+the six incident source tables (plus fire_inspections, read by Query 8) with
+the same columns, value formats and indexes as preprocessing.py produces, then
+builds the same derived tables (gazetteer, incidents and its rollups).
+
+Values follow the skew of the real data rather than being uniform:
+neighborhoods and categories are drawn from Zipf-like distributions (a few
+neighborhoods and categories account for most incidents), volume grows over
+the years, and incident times follow weekly and hourly cycles. Everything is
+drawn from one seeded generator, so a scale and seed always produce the same
+database.
+
+Usage:
+    python synthetic_data.py --rows 1M [--seed 0] [--output ../sql_databases/synthetic_1M.db]
+"""
+
+import argparse
+import datetime
+import itertools
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+from preprocessing import (
+    configure_bulk_load, create_table_indexes, create_typed_table, load_ddl_schema
+)
+from incidents import build_incidents_table, SF_ZIP_COORDINATES
+from gazetteer import build_gazetteer, refine_zip_coordinates
+
+DEFAULT_CHUNK_SIZE = 100000
+DEFAULT_START = datetime.date(2015, 1, 1)
+DEFAULT_END = datetime.date(2024, 12, 31)
+
+# Share of the generated rows that goes to each table
+TABLE_SHARES = {
+    'sfpd_incidents': 0.35,
+    '311_service_requests': 0.30,
+    'sffd_service_calls': 0.20,
+    'fire_incidents': 0.06,
+    'fire_safety_complaints': 0.03,
+    'fire_violations': 0.03,
+    'fire_inspections': 0.03,
+}
+
+# Columns of each generated table, as named in the cleaned CSVs
+TABLE_COLUMNS = {
+    '311_service_requests': [
+        'unique_key', 'created_date', 'closed_date', 'resolution_action_updated_date', 'status',
+        'status_notes', 'agency_name', 'category', 'complaint_type', 'descriptor', 'incident_address',
+        'supervisor_district', 'neighborhood', 'location', 'source', 'media_url', 'latitude',
+        'longitude', 'police_district',
+    ],
+    'sfpd_incidents': [
+        'unique_key', 'category', 'descript', 'dayofweek', 'pddistrict', 'resolution', 'address',
+        'longitude', 'latitude', 'location', 'pdid', 'timestamp',
+    ],
+    'sffd_service_calls': [
+        'call_number', 'unit_id', 'incident_number', 'call_type', 'call_date', 'received_timestamp',
+        'dispatch_timestamp', 'on_scene_timestamp', 'call_final_disposition', 'address', 'city',
+        'zipcode_of_incident', 'supervisor_district', 'latitude', 'longitude',
+    ],
+    'fire_incidents': [
+        'Incident Number', 'Exposure Number', 'ID', 'Address', 'Incident Date', 'Call Number',
+        'Alarm DtTm', 'Arrival DtTm', 'Close DtTm', 'City', 'ZIP Code', 'Suppression Units',
+        'Suppression Personnel', 'EMS Units', 'EMS Personnel', 'Other Units', 'Other Personnel',
+        'Fire Fatalities', 'Fire Injuries', 'Civilian Fatalities', 'Civilian Injuries',
+        'Number of Alarms', 'Primary Situation', 'Mutual Aid', 'Action Taken Primary',
+        'Action Taken Secondary', 'Property Use', 'Supervisor District', 'Analysis Neighborhood',
+        'Latitude', 'Longitude',
+    ],
+    'fire_safety_complaints': [
+        'Complaint ID', 'Received Date', 'Complaint Item Type Description', 'Disposition', 'Address',
+        'Zipcode', 'Neighborhood  District', 'Location', 'Latitude', 'Longitude',
+    ],
+    'fire_violations': [
+        'Violation ID', 'violation date', 'violation item description', 'Status', 'Address',
+        'Zipcode', 'neighborhood district', 'Location', 'Latitude', 'Longitude',
+    ],
+    'fire_inspections': [
+        'Inspection Number', 'Inspection Type', 'Inspection Type Description', 'Inspection Status',
+        'Inspection Start Date', 'Inspection End Date', 'Address', 'Zipcode', 'Analysis Neighborhood',
+    ],
+}
+
+# (analysis neighborhood, ZIP code, police district, supervisor district), busiest first
+NEIGHBORHOODS = [
+    ('Tenderloin', '94102', 'TENDERLOIN', '5'),
+    ('South of Market', '94103', 'SOUTHERN', '6'),
+    ('Mission', '94110', 'MISSION', '9'),
+    ('Financial District/South Beach', '94104', 'CENTRAL', '3'),
+    ('Bayview Hunters Point', '94124', 'BAYVIEW', '10'),
+    ('Western Addition', '94115', 'NORTHERN', '5'),
+    ('Nob Hill', '94109', 'CENTRAL', '3'),
+    ('North Beach', '94133', 'CENTRAL', '3'),
+    ('Castro/Upper Market', '94114', 'MISSION', '8'),
+    ('Chinatown', '94108', 'CENTRAL', '3'),
+    ('Outer Mission', '94112', 'INGLESIDE', '11'),
+    ('Haight Ashbury', '94117', 'PARK', '5'),
+    ('Potrero Hill', '94107', 'BAYVIEW', '10'),
+    ('Sunset/Parkside', '94122', 'TARAVAL', '4'),
+    ('Marina', '94123', 'NORTHERN', '2'),
+    ('Inner Richmond', '94118', 'RICHMOND', '1'),
+    ('Mission Bay', '94158', 'SOUTHERN', '6'),
+    ('Visitacion Valley', '94134', 'INGLESIDE', '10'),
+    ('Outer Richmond', '94121', 'RICHMOND', '1'),
+    ('Rincon Hill', '94105', 'SOUTHERN', '6'),
+    ('Glen Park', '94131', 'INGLESIDE', '8'),
+    ('Outer Sunset', '94116', 'TARAVAL', '4'),
+    ('West of Twin Peaks', '94127', 'TARAVAL', '7'),
+    ('Lakeshore', '94132', 'TARAVAL', '7'),
+    ('Russian Hill', '94111', 'CENTRAL', '3'),
+]
+
+STREETS = [
+    'MARKET ST', 'MISSION ST', 'TURK ST', 'EDDY ST', 'ELLIS ST', 'OFARRELL ST', 'FOLSOM ST',
+    'HOWARD ST', '6TH ST', 'VALENCIA ST', '16TH ST', '24TH ST', 'CALIFORNIA ST', 'MONTGOMERY ST',
+    'KEARNY ST', '3RD ST', 'PALOU AVE', 'EVANS AVE', 'FILLMORE ST', 'GEARY BLVD', 'DIVISADERO ST',
+    'POLK ST', 'LARKIN ST', 'HYDE ST', 'COLUMBUS AVE', 'BROADWAY', 'STOCKTON ST', 'CASTRO ST',
+    '18TH ST', 'CHURCH ST', 'GRANT AVE', 'PACIFIC AVE', 'WASHINGTON ST', 'GENEVA AVE', 'OCEAN AVE',
+    'HAIGHT ST', 'STANYAN ST', 'MASONIC AVE', '20TH ST', 'CONNECTICUT ST', 'IRVING ST', 'JUDAH ST',
+    'NORIEGA ST', 'CHESTNUT ST', 'LOMBARD ST', 'UNION ST', 'CLEMENT ST', 'ANZA ST', 'BALBOA ST',
+    'KING ST', 'BERRY ST', 'LELAND AVE', 'BAYSHORE BLVD', 'SAN BRUNO AVE', 'FULTON ST', 'FREMONT ST',
+    'MAIN ST', 'DIAMOND ST', 'BOSWORTH ST', 'TARAVAL ST', 'SLOAT BLVD', 'WEST PORTAL AVE',
+    'PORTOLA DR', 'BROTHERHOOD WAY', 'LAKE MERCED BLVD', 'JACKSON ST', 'LEAVENWORTH ST',
+]
+STREETS_PER_NEIGHBORHOOD = 3
+
+# Category values, most frequent first
+SFPD_CATEGORIES = [
+    'LARCENY/THEFT', 'OTHER OFFENSES', 'NON-CRIMINAL', 'ASSAULT', 'VEHICLE THEFT', 'DRUG/NARCOTIC',
+    'VANDALISM', 'WARRANTS', 'BURGLARY', 'SUSPICIOUS OCC', 'MISSING PERSON', 'ROBBERY', 'FRAUD',
+    'FORGERY/COUNTERFEITING', 'SECONDARY CODES', 'WEAPON LAWS', 'PROSTITUTION', 'TRESPASS',
+    'STOLEN PROPERTY', 'SEX OFFENSES, FORCIBLE', 'DISORDERLY CONDUCT', 'DRUNKENNESS',
+    'RECOVERED VEHICLE', 'KIDNAPPING', 'DRIVING UNDER THE INFLUENCE', 'RUNAWAY', 'LIQUOR LAWS',
+    'ARSON', 'LOITERING', 'EMBEZZLEMENT', 'SUICIDE', 'FAMILY OFFENSES', 'BAD CHECKS', 'BRIBERY',
+    'EXTORTION', 'GAMBLING', 'PORNOGRAPHY/OBSCENE MAT', 'TREA',
+]
+SFPD_RESOLUTIONS = ['NONE', 'ARREST, BOOKED', 'ARREST, CITED', 'LOCATED', 'PSYCHOPATHIC CASE', 'UNFOUNDED']
+SFPD_DESCRIPTIONS_PER_CATEGORY = 6
+
+SERVICE_CATEGORIES = [
+    ('Street and Sidewalk Cleaning', 'Public Works', ['Bulky Items', 'General Cleaning', 'Human or Animal Waste', 'Needles']),
+    ('Graffiti', 'Public Works', ['Graffiti on Building', 'Graffiti on Pole', 'Graffiti on Sidewalk']),
+    ('Encampments', 'Healthy Streets Operation Center', ['Encampment Reports', 'Encampment Cleanup']),
+    ('Abandoned Vehicle', 'Parking Enforcement', ['Abandoned Vehicle - Car4door', 'Abandoned Vehicle - Pickup']),
+    ('Parking Enforcement', 'Parking Enforcement', ['Blocking Driveway', 'Double Parking', 'Red Zone']),
+    ('Street Defects', 'Public Works', ['Pavement Defect', 'Construction Plate Shifted']),
+    ('Sewer Issues', 'PUC Sewer Ops', ['Odor', 'Sewage Back Up', 'Flooding']),
+    ('Tree Maintenance', 'Urban Forestry', ['Overgrown Tree', 'Damaged Tree']),
+    ('Damaged Property', 'Public Works', ['Damaged Parking Meter', 'Damaged Traffic Sign']),
+    ('Litter Receptacles', 'Recology', ['Overflowing', 'Damaged Receptacle']),
+    ('Noise Report', 'Entertainment Commission', ['Construction Noise', 'Amplified Sound']),
+    ('Streetlights', 'PUC Streetlights', ['Streetlight Out', 'Streetlight Flickering']),
+    ('Sidewalk or Curb', 'Public Works', ['Sidewalk Defect', 'Curb Ramp']),
+    ('General Request', '311 Supervisor Queue', ['Complaint', 'Request for Service', 'Compliment']),
+]
+SERVICE_STATUS_NOTES = ['Case Resolved', 'Case is a duplicate', 'Field Work has been completed.', 'Case Transferred']
+
+CALL_TYPES = [
+    'Medical Incident', 'Alarms', 'Structure Fire', 'Traffic Collision', 'Other', 'Citizen Assist / Service Call',
+    'Outside Fire', 'Water Rescue', 'Gas Leak (Natural and LP Gases)', 'Vehicle Fire', 'Electrical Hazard',
+    'Elevator / Escalator Rescue', 'Smoke Investigation (Outside)', 'Odor (Strange / Unknown)', 'Fuel Spill',
+    'HazMat', 'Train / Rail Incident', 'Explosion', 'Assist Police', 'Industrial Accidents',
+]
+CALL_DISPOSITIONS = [
+    'Code 2 Transport', 'Fire', 'Other', 'No Merit', 'Patient Declined Transport', 'Cancelled',
+    'Against Medical Advice', 'Gone on Arrival', 'Unable to Locate', 'Medical Examiner',
+]
+UNIT_IDS = [f'{kind}{number:02d}' for kind in ('E', 'M', 'T', 'B') for number in range(1, 45)]
+
+FIRE_SITUATIONS = [
+    '745 Alarm system activation, no fire - unintentional', '743 Smoke detector activation, no fire - unintentional',
+    '321 EMS call, excluding vehicle accident with injury', '711 Municipal alarm system, malicious false alarm',
+    '700 False alarm or false call, other', '611 Dispatched & cancelled en route', '500 Service Call, other',
+    '113 Cooking fire, confined to container', '651 Smoke scare, odor of smoke', '311 Medical assist, assist EMS crew',
+    '733 Smoke detector activation due to malfunction', '118 Trash or rubbish fire, contained',
+    '151 Outside rubbish, trash or waste fire', '111 Building fire', '131 Passenger vehicle fire',
+    '412 Gas leak (natural gas or LPG)', '553 Public service', '550 Public service assistance, other',
+    '440 Electrical wiring/equipment problem, other', '322 Motor vehicle accident with injuries',
+]
+FIRE_ACTIONS = [
+    '86 Investigate', '93 Cancelled en route', '73 Provide manpower', '32 Provide basic life support (BLS)',
+    '11 Extinguish', '64 Shut down system', '51 Ventilate', '52 Forcible entry', '00 Action taken, other',
+    '31 Provide first aid & check for injuries',
+]
+PROPERTY_USES = [
+    '429 Multifamily dwelling', '419 1 or 2 family dwelling', '960 Street, other', '161 Restaurant or cafeteria',
+    '599 Business office', '963 Street or road', '449 Hotel/motel, commercial', '311 24-hour care Nursing homes',
+]
+
+COMPLAINT_TYPES = [
+    'Alarm Systems', 'Blocked exits', 'Fire Extinguishers', 'Sprinklers', 'Storage', 'Overcrowding',
+    'Electrical', 'Smoke detectors', 'Fire Escapes', 'Hazardous materials', 'Other',
+]
+COMPLAINT_DISPOSITIONS = ['no merit', 'Complaint Abated', 'condition corrected', 'Referred to Other Agency', 'Pending']
+VIOLATION_ITEMS = [
+    'fire alarm system', 'fire extinguisher', 'exit signs', 'sprinkler system', 'emergency lighting',
+    'fire escape', 'standpipe', 'combustible storage', 'exit obstruction', 'fire door', 'electrical', 'smoke detector',
+]
+INSPECTION_TYPES = [
+    ('CA', 'Complaint'), ('AN', 'Annual Inspection'), ('PC', 'Plan Check'), ('RF', 'Referral'),
+    ('SE', 'Special Event'), ('RI', 'Re-inspection'),
+]
+
+# Relative incident volume by weekday (Monday first) and by hour of day
+WEEKDAY_WEIGHTS = [1.0, 0.98, 1.0, 1.02, 1.1, 1.05, 0.92]
+HOUR_WEIGHTS = [
+    0.9, 0.75, 0.6, 0.45, 0.35, 0.35, 0.5, 0.75, 1.0, 1.15, 1.2, 1.25,
+    1.35, 1.3, 1.3, 1.35, 1.45, 1.55, 1.6, 1.5, 1.35, 1.2, 1.1, 1.0,
+]
+# Volume at the end of the range relative to its start
+GROWTH = 1.6
+COORDINATE_SPREAD = 0.006  # degrees, standard deviation around a neighborhood centroid
+
+SCALE_SUFFIXES = {'K': 1000, 'M': 1000000}
+
+
+def parse_scale(value):
+    """Row count from a number with an optional K/M suffix, e.g. '10M' -> 10000000"""
+    value = str(value).strip().upper()
+    multiplier = SCALE_SUFFIXES.get(value[-1:], 1)
+    number = value[:-1] if value[-1:] in SCALE_SUFFIXES else value
+    return int(float(number) * multiplier)
+
+
+def zipf_weights(count, exponent=1.1):
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    return weights / weights.sum()
+
+
+def table_row_counts(rows):
+    """Rows of each table for a total scale (every table gets at least one row)"""
+    return {table: max(1, round(rows * share)) for table, share in TABLE_SHARES.items()}
+
+
+class RowGenerator:
+    """Vectorized column values with the skew of the real data, from one seeded generator"""
+
+    def __init__(self, seed=0, start=DEFAULT_START, end=DEFAULT_END):
+        self.rng = np.random.default_rng(seed)
+        self.start = np.datetime64(start, 's')
+
+        days = (end - start).days + 1
+        offsets = np.arange(days)
+        weekday = (np.datetime64(start, 'D') + offsets).astype('datetime64[D]').view('int64')
+        # 1970-01-01 was a Thursday; shift so Monday is 0
+        weekday = (weekday + 3) % 7
+        day_weights = (1 + (GROWTH - 1) * offsets / max(days - 1, 1)) * np.take(WEEKDAY_WEIGHTS, weekday)
+        self.day_p = day_weights / day_weights.sum()
+        self.days = days
+        self.hour_p = np.array(HOUR_WEIGHTS) / sum(HOUR_WEIGHTS)
+        self.neighborhood_p = zipf_weights(len(NEIGHBORHOODS), 0.9)
+        self.centroids = np.array([SF_ZIP_COORDINATES[zip_code] for _, zip_code, _, _ in NEIGHBORHOODS])
+
+    def choice(self, values, n, exponent=1.1):
+        """n values drawn with Zipf-like skew (earlier values more often)"""
+        indexes = self.rng.choice(len(values), n, p=zipf_weights(len(values), exponent))
+        return np.asarray(values, dtype=object)[indexes]
+
+    def neighborhoods(self, n):
+        return self.rng.choice(len(NEIGHBORHOODS), n, p=self.neighborhood_p)
+
+    def times(self, n):
+        """Incident times as datetime64[s]"""
+        day = self.rng.choice(self.days, n, p=self.day_p)
+        hour = self.rng.choice(24, n, p=self.hour_p)
+        second = self.rng.integers(0, 3600, n)
+        return self.start + (day * 86400 + hour * 3600 + second).astype('timedelta64[s]')
+
+    def coordinates(self, neighborhood):
+        """(latitude, longitude) arrays scattered around the centroids of the neighborhoods"""
+        n = len(neighborhood)
+        latitude = self.centroids[neighborhood, 0] + self.rng.normal(0, COORDINATE_SPREAD, n)
+        longitude = self.centroids[neighborhood, 1] + self.rng.normal(0, COORDINATE_SPREAD, n)
+        return latitude.round(6), longitude.round(6)
+
+    def addresses(self, neighborhood):
+        """'<n>00 Block of <street>' addresses on a few streets of each neighborhood"""
+        n = len(neighborhood)
+        street = (neighborhood * STREETS_PER_NEIGHBORHOOD + self.rng.integers(0, STREETS_PER_NEIGHBORHOOD, n)) % len(STREETS)
+        block = self.rng.integers(0, 30, n) * 100
+        return [f'{b} Block of {STREETS[s]}' for b, s in zip(block.tolist(), street.tolist())]
+
+    def missing(self, values, fraction):
+        """values as a list, with a fraction of them replaced by None"""
+        values = list(values)
+        for index in np.flatnonzero(self.rng.random(len(values)) < fraction).tolist():
+            values[index] = None
+        return values
+
+
+def format_times(times, suffix=''):
+    """'YYYY-MM-DD HH:MM:SS' strings (plus suffix) of datetime64 values"""
+    text = np.char.replace(np.datetime_as_string(times, unit='s'), 'T', ' ')
+    return np.char.add(text, suffix).tolist() if suffix else text.tolist()
+
+
+def format_dates(times):
+    return np.datetime_as_string(times, unit='D').tolist()
+
+
+def location_points(latitude, longitude):
+    return [f"{{'type': 'Point', 'coordinates': [{lon}, {lat}]}}" for lat, lon in zip(latitude, longitude)]
+
+
+def neighborhood_column(neighborhood, field):
+    return [NEIGHBORHOODS[i][field] for i in neighborhood.tolist()]
+
+
+def _rows_311(gen, first_key, n):
+    neighborhood = gen.neighborhoods(n)
+    created = gen.times(n)
+    closed = created + gen.rng.exponential(3 * 86400, n).astype('timedelta64[s]')
+    latitude, longitude = gen.coordinates(neighborhood)
+    # 3% of requests have the 0.0 "no coordinates" sentinel, as in the raw data
+    no_coords = gen.rng.random(n) < 0.03
+    latitude[no_coords] = 0.0
+    longitude[no_coords] = 0.0
+    category = gen.rng.choice(len(SERVICE_CATEGORIES), n, p=zipf_weights(len(SERVICE_CATEGORIES), 0.9)).tolist()
+    variant = gen.rng.integers(0, 4, n).tolist()
+    open_status = (gen.rng.random(n) < 0.08).tolist()
+    closed_text = format_times(closed, '+00:00')
+    return zip(
+        (str(first_key + i) for i in range(n)),
+        format_times(created, '+00:00'),
+        (None if is_open else text for is_open, text in zip(open_status, closed_text)),
+        (None if is_open else text for is_open, text in zip(open_status, closed_text)),
+        ('Open' if is_open else 'Closed' for is_open in open_status),
+        gen.missing(gen.choice(SERVICE_STATUS_NOTES, n), 0.2),
+        (SERVICE_CATEGORIES[c][1] for c in category),
+        (SERVICE_CATEGORIES[c][0] for c in category),
+        (SERVICE_CATEGORIES[c][2][v % len(SERVICE_CATEGORIES[c][2])] for c, v in zip(category, variant)),
+        (SERVICE_CATEGORIES[c][2][(v + 1) % len(SERVICE_CATEGORIES[c][2])] for c, v in zip(category, variant)),
+        gen.addresses(neighborhood),
+        neighborhood_column(neighborhood, 3),
+        neighborhood_column(neighborhood, 0),
+        itertools.repeat(None),
+        gen.choice(['Phone', 'Mobile/Open311', 'Web', 'Integrated Agency'], n),
+        itertools.repeat(None),
+        latitude.tolist(),
+        longitude.tolist(),
+        neighborhood_column(neighborhood, 2),
+    )
+
+
+def _rows_sfpd(gen, first_key, n):
+    neighborhood = gen.neighborhoods(n)
+    times = gen.times(n)
+    latitude, longitude = gen.coordinates(neighborhood)
+    category_index = gen.rng.choice(len(SFPD_CATEGORIES), n, p=zipf_weights(len(SFPD_CATEGORIES), 1.2))
+    description = gen.rng.choice(SFPD_DESCRIPTIONS_PER_CATEGORY, n, p=zipf_weights(SFPD_DESCRIPTIONS_PER_CATEGORY))
+    weekday = ((times.astype('datetime64[D]').view('int64') + 3) % 7).tolist()
+    day_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+    keys = range(first_key, first_key + n)
+    return zip(
+        (str(key) for key in keys),
+        (SFPD_CATEGORIES[c] for c in category_index.tolist()),
+        (f'{SFPD_CATEGORIES[c]} - TYPE {d + 1}' for c, d in zip(category_index.tolist(), description.tolist())),
+        (day_names[d] for d in weekday),
+        neighborhood_column(neighborhood, 2),
+        gen.choice(SFPD_RESOLUTIONS, n, 1.5),
+        gen.addresses(neighborhood),
+        longitude.tolist(),
+        latitude.tolist(),
+        (f'({lat}, {lon})' for lat, lon in zip(latitude.tolist(), longitude.tolist())),
+        (str(key * 100000 + 6244) for key in keys),
+        format_times(times, '+00:00'),
+    )
+
+
+def _rows_sffd(gen, first_key, n):
+    neighborhood = gen.neighborhoods(n)
+    received = gen.times(n)
+    call_type = gen.choice(CALL_TYPES, n, 1.6)
+    dispatch = received + gen.rng.lognormal(4.2, 0.6, n).astype('timedelta64[s]')
+    on_scene = dispatch + gen.rng.lognormal(6.0, 0.45, n).astype('timedelta64[s]')
+    latitude, longitude = gen.coordinates(neighborhood)
+    return zip(
+        (str(first_key + i) for i in range(n)),
+        gen.choice(UNIT_IDS, n, 0.5),
+        (str(first_key + i) for i in range(n)),
+        call_type.tolist(),
+        format_dates(received),
+        format_times(received, '+00:00'),
+        format_times(dispatch, '+00:00'),
+        gen.missing(format_times(on_scene, '+00:00'), 0.12),
+        gen.choice(CALL_DISPOSITIONS, n, 1.2),
+        gen.addresses(neighborhood),
+        itertools.repeat('SF'),
+        neighborhood_column(neighborhood, 1),
+        neighborhood_column(neighborhood, 3),
+        latitude.tolist(),
+        longitude.tolist(),
+    )
+
+
+def _rows_fire_incidents(gen, first_key, n):
+    neighborhood = gen.neighborhoods(n)
+    alarm = gen.times(n)
+    arrival = alarm + gen.rng.lognormal(5.8, 0.4, n).astype('timedelta64[s]')
+    close = arrival + gen.rng.lognormal(7.5, 0.8, n).astype('timedelta64[s]')
+    situation = gen.rng.choice(len(FIRE_SITUATIONS), n, p=zipf_weights(len(FIRE_SITUATIONS)))
+    action = (situation + gen.rng.choice(3, n, p=[0.7, 0.2, 0.1])) % len(FIRE_ACTIONS)
+    # Only the ZIP code is known; preprocessing derives ZIP-centroid coordinates
+    zip_codes = neighborhood_column(neighborhood, 1)
+    centroids = [SF_ZIP_COORDINATES[zip_code] for zip_code in zip_codes]
+    units = gen.rng.integers(1, 6, n).tolist()
+    return zip(
+        (str(first_key + i) for i in range(n)),
+        itertools.repeat('0'),
+        (f'{first_key + i}0' for i in range(n)),
+        gen.addresses(neighborhood),
+        format_dates(alarm),
+        (str(first_key + i + 1) for i in range(n)),
+        format_times(alarm),
+        format_times(arrival),
+        format_times(close),
+        itertools.repeat('San Francisco'),
+        zip_codes,
+        units,
+        (u * 4 for u in units),
+        gen.rng.integers(0, 2, n).tolist(),
+        gen.rng.integers(0, 3, n).tolist(),
+        itertools.repeat(0),
+        itertools.repeat(0),
+        itertools.repeat(0),
+        itertools.repeat(0),
+        itertools.repeat(0),
+        (int(injured) for injured in gen.rng.random(n) < 0.01),
+        itertools.repeat(1),
+        (FIRE_SITUATIONS[s] for s in situation.tolist()),
+        itertools.repeat('None'),
+        (FIRE_ACTIONS[a] for a in action.tolist()),
+        gen.missing(gen.choice(FIRE_ACTIONS, n), 0.6),
+        gen.choice(PROPERTY_USES, n),
+        neighborhood_column(neighborhood, 3),
+        neighborhood_column(neighborhood, 0),
+        (latitude for latitude, _ in centroids),
+        (longitude for _, longitude in centroids),
+    )
+
+
+def _rows_fire_complaints(gen, first_key, n):
+    neighborhood = gen.neighborhoods(n)
+    received = gen.times(n)
+    latitude, longitude = gen.coordinates(neighborhood)
+    return zip(
+        (f'{first_key + i}-C' for i in range(n)),
+        format_times(received),
+        gen.choice(COMPLAINT_TYPES, n),
+        gen.choice(COMPLAINT_DISPOSITIONS, n),
+        gen.addresses(neighborhood),
+        neighborhood_column(neighborhood, 1),
+        neighborhood_column(neighborhood, 0),
+        location_points(latitude.tolist(), longitude.tolist()),
+        latitude.tolist(),
+        longitude.tolist(),
+    )
+
+
+def _rows_fire_violations(gen, first_key, n):
+    neighborhood = gen.neighborhoods(n)
+    violation = gen.times(n)
+    latitude, longitude = gen.coordinates(neighborhood)
+    return zip(
+        (f'{first_key + i}-V' for i in range(n)),
+        format_times(violation),
+        gen.choice(VIOLATION_ITEMS, n),
+        gen.choice(['closed', 'open', 'pending'], n, 2.0),
+        gen.addresses(neighborhood),
+        neighborhood_column(neighborhood, 1),
+        neighborhood_column(neighborhood, 0),
+        location_points(latitude.tolist(), longitude.tolist()),
+        latitude.tolist(),
+        longitude.tolist(),
+    )
+
+
+def _rows_fire_inspections(gen, first_key, n):
+    neighborhood = gen.neighborhoods(n)
+    start = gen.times(n)
+    end = start + gen.rng.exponential(20 * 86400, n).astype('timedelta64[s]')
+    inspection_type = gen.rng.choice(len(INSPECTION_TYPES), n, p=zipf_weights(len(INSPECTION_TYPES)))
+    complete = (gen.rng.random(n) < 0.85).tolist()
+    end_text = format_dates(end)
+    return zip(
+        (f'{first_key + i}' for i in range(n)),
+        (INSPECTION_TYPES[t][0] for t in inspection_type.tolist()),
+        (INSPECTION_TYPES[t][1] for t in inspection_type.tolist()),
+        ('Complete' if done else 'In Progress' for done in complete),
+        format_dates(start),
+        (text if done else None for done, text in zip(complete, end_text)),
+        gen.addresses(neighborhood),
+        neighborhood_column(neighborhood, 1),
+        neighborhood_column(neighborhood, 0),
+    )
+
+
+# Table -> (row function, first key); keys stay below key_allocator.KEY_BASE
+ROW_GENERATORS = {
+    '311_service_requests': (_rows_311, 10000000),
+    'sfpd_incidents': (_rows_sfpd, 100000000),
+    'sffd_service_calls': (_rows_sffd, 200000000),
+    'fire_incidents': (_rows_fire_incidents, 300000000),
+    'fire_safety_complaints': (_rows_fire_complaints, 400000000),
+    'fire_violations': (_rows_fire_violations, 500000000),
+    'fire_inspections': (_rows_fire_inspections, 600000000),
+}
+
+
+def _sample_strings(rows):
+    """Rows as lists of CSV-style strings, for create_typed_table's type inference"""
+    return [['' if value is None else str(value) for value in row] for row in rows]
+
+
+def generate_table(conn, gen, table_name, rows, ddl_schema, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Create and fill one table in chunks of chunk_size rows, then create its indexes"""
+    columns = TABLE_COLUMNS[table_name]
+    row_function, first_key = ROW_GENERATORS[table_name]
+    cursor = conn.cursor()
+    cursor.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+
+    insert_sql = None
+    for offset in range(0, rows, chunk_size):
+        chunk = list(row_function(gen, first_key + offset, min(chunk_size, rows - offset)))
+        if insert_sql is None:
+            insert_sql = create_typed_table(cursor, table_name, columns, _sample_strings(chunk[:1000]), ddl_schema)
+        cursor.executemany(insert_sql, chunk)
+        conn.commit()
+
+    create_table_indexes(conn, table_name, columns, ddl_schema)
+
+
+def generate_database(db_path, rows, seed=0, start=DEFAULT_START, end=DEFAULT_END,
+                      chunk_size=DEFAULT_CHUNK_SIZE, verbose=False):
+    """
+    Write a synthetic processed_data.db with about `rows` source rows.
+
+    Returns:
+        Dictionary of table -> rows generated
+    """
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    configure_bulk_load(conn)
+    ddl_schema = load_ddl_schema()
+    gen = RowGenerator(seed, start, end)
+
+    counts = table_row_counts(rows)
+    for table_name, count in counts.items():
+        started = time.perf_counter()
+        generate_table(conn, gen, table_name, count, ddl_schema, chunk_size)
+        if verbose:
+            print(f"Generated {count} rows of '{table_name}' in {time.perf_counter() - started:.1f}s")
+
+    # The derived tables preprocessing builds after loading
+    started = time.perf_counter()
+    build_gazetteer(conn)
+    refine_zip_coordinates(conn)
+    build_incidents_table(conn)
+    conn.close()
+    if verbose:
+        print(f"Built gazetteer and incidents tables in {time.perf_counter() - started:.1f}s")
+    return counts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a synthetic processed_data.db for benchmarks')
+    parser.add_argument('--rows', default='1M', help='Total source rows, e.g. 1M, 10M, 50M (default: 1M)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--start', type=datetime.date.fromisoformat, default=DEFAULT_START,
+                        help=f'First incident date (default: {DEFAULT_START})')
+    parser.add_argument('--end', type=datetime.date.fromisoformat, default=DEFAULT_END,
+                        help=f'Last incident date (default: {DEFAULT_END})')
+    parser.add_argument('--output', default=None,
+                        help='Database path (default: ../sql_databases/synthetic_<rows>.db)')
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    rows = parse_scale(args.rows)
+    output = args.output or os.path.join('..', 'sql_databases', f'synthetic_{args.rows}.db')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+    started = time.perf_counter()
+    counts = generate_database(output, rows, seed=args.seed, start=args.start, end=args.end, verbose=True)
+    print(f"Created {output} with {sum(counts.values())} rows in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()